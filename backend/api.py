@@ -1,25 +1,13 @@
-from flask import Flask, request, jsonify
-from risk_analysis import calculate_risk_score, categorize_risk
-from scrape_yfinance import scrape_yfinance_data
-from swot_analysis import generate_portfolio_swot, generate_trading_signals, parse_swot_analysis
+from flask import Flask, Response, request, jsonify, stream_with_context
 from scrape_esg import scrape_esg_sustainalytics
-from esg_analysis import ESGAnalyzer
-from strategy_bot import generate_strategies
-from chatbot import PortfolioChat
-import pandas as pd
 from references import ESG_SUSTAINALYTICS_MAPPING
+import services
 import json
 import os
-import pandas as pd
-import requests as R
 
 
 os.environ['GROQ_API_KEY'] = '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'
 
-esg_analyser = ESGAnalyzer()
-
-conversations = {}
-
 app = Flask(__name__)
 
 # Root endpoint
@@ -30,28 +18,24 @@ def home():
 # Example endpoint: GET request
 @app.route("/api/finance/<qtype>/<ticker_name>", methods=["GET"])
 def get_history(ticker_name,qtype):
-    if not os.path.exists(f'data/finance/{ticker_name}'):
-        os.makedirs(f"data/finance/{ticker_name}", exist_ok=True)
-        scrape_yfinance_data(ticker_name, f"data/finance/{ticker_name}")
-    if os.path.exists(f"data/finance/{ticker_name}/{qtype}.csv"):
-        query = pd.read_csv(f"data/finance/{ticker_name}/{qtype}.csv")
-        data = query.to_dict(orient='records')
+    data = services.get_finance_data(ticker_name, qtype)
+    if data is not None:
         return jsonify(data)
     else:
         return jsonify({"message": f"No data found for {ticker_name}/{qtype}"})
 # http://127.0.0.1:5000/api/finance/technicals/RELIANCE.NS
 
+@app.route("/api/analytics/risk", methods=["GET"])
+def get_risk_batch():
+    tickers_param = request.args.get('portfolio')
+    if not tickers_param:
+        return jsonify({"error": "No tickers provided"}), 400
+    return jsonify(services.get_risk_batch(tickers_param.split(',')))
+# http://127.0.0.1:5000/api/analytics/risk?portfolio=AAPL,NVDA,RELIANCE.NS
+
 @app.route("/api/analytics/risk/<ticker_name>", methods=["GET"])
 def get_risk(ticker_name):
-    if os.path.exists(f"data/{ticker_name}/technicals.csv"):
-        technicals = pd.read_csv(f"data/{ticker_name}/technicals.csv")
-    else:
-        os.makedirs(f"data/{ticker_name}", exist_ok=True)
-        scrape_yfinance_data(ticker_name, f"data/{ticker_name}")
-        technicals = pd.read_csv(f"data/{ticker_name}/technicals.csv")
-    risk_scores = calculate_risk_score(technicals)
-    risk_scores['category'] = categorize_risk(risk_scores['risk_score'])
-    return jsonify(risk_scores)
+    return jsonify(services.get_risk(ticker_name))
 # http://127.0.0.1:5000//api/analytics/risk/RELIANCE.NS
 
 @app.route("/api/analytics/esg/<ticker_name>", methods=["GET"])
@@ -66,9 +50,7 @@ def get_esg(ticker_name):
 
     # with open(f"data/esg/{ticker_name}.json") as f:
     #     data = json.load(f)
-    data = {}
-    data['analysis'] = esg_analyser.get_esg_score(ticker_name)
-    return jsonify(data)
+    return jsonify(services.get_esg(ticker_name))
 # http://127.0.0.1:5000//api/analytics/esg/RELIANCE.NS
 
 @app.route('/api/analytics/swot', methods=['GET'])
@@ -81,30 +63,21 @@ def get_swot():
     # Convert comma-separated tickers into a list
     portfolio = tickers_param.split(',')
 
-    swot = generate_portfolio_swot(portfolio)
-    swot = parse_swot_analysis(swot)
-    signals = generate_trading_signals(portfolio)
-    data = {
-        "swot": swot,
-        "signals": signals
-    }
-    return jsonify(data)
+    return jsonify(services.get_swot(portfolio))
 # http://127.0.0.1:5000/api/analytics/swot?portfolio=AAPL,GOOGL,META,MSFT,AMZN
 
 @app.route('/api/analytics/strategies', methods=['GET']) 
 def get_strategies():
     prompt = request.args.get('prompt')
     portfolio = request.args.get('portfolio').split(',')
-    strategies = generate_strategies(prompt, portfolio)
-    return jsonify(strategies)
+    return jsonify(services.get_strategies(prompt, portfolio))
 # https://127.0.0.1:5000/api/analytics/strategies?portfolio=AAPL,GOOGL,META,MSFT,AMZN?prompt=%22I%20want%20to%20focus%20on%20EV%20market%20and%20emerging%20tech,%20but%20avoid%20traditional%20energy.%20Looking%20for%20growth%20opportunities%20in%20next%202-3%20years.%22
 
 
 @app.route('/api/chat/portfolio/reset', methods=['GET'])
 def reset_portfolio_chat():
     user_id = request.args.get('user_id')
-    if user_id in conversations:
-        del conversations[user_id]
+    services.reset_chat(user_id)
     return jsonify({"message": "Chat session reset."})
 
 @app.route('/api/chat/portfolio/', methods=['GET'])
@@ -116,56 +89,23 @@ def portfoilio_chat():
     portfolio = portfolio.split(',') 
     prompt = request.args.get('prompt')
     doc = request.args.get('doc')
-    if user_id not in conversations:
-        conversations[user_id] = PortfolioChat()
-    bot = conversations[user_id]
-    if doc:
-        assert prompt is None
-        bot.analyze_report(doc)
-    if prompt:
-        response = bot.process_message(prompt, portfolio)
-    if not prompt and not doc:
-        response = {"error": "No prompt or document provided."}
-    return jsonify(response)
-
-def rest_api_call(url, method, data=None, headers=None):
-    url = 'http://127.0.0.1:5000' + url
-    if headers is None:
-        headers = {'Content-Type': 'application/json'}
-    response = R.request(method, url, headers=headers, data=data)
-    return response.json()
+    return jsonify(services.chat(user_id, portfolio, prompt, doc))
+
+@app.route('/api/chat/portfolio/stream', methods=['GET'])
+def portfolio_chat_stream():
+    user_id = request.args.get('user_id')
+    portfolio = request.args.get('portfolio')
+    prompt = request.args.get('prompt')
+    if portfolio is None or not prompt:
+        return jsonify({"error": "No portfolio or prompt provided."}), 400
+    events = services.chat_stream(user_id, portfolio.split(','), prompt)
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/one/', methods=['GET'])
 def get_portfolio(prompt = "Improve my strategies"):
     tickers = request.args.get('portfolio').split(',')
-    portfolio_data = []
-    for ticker in tickers:
-        history = rest_api_call(f'/api/finance/technicals/{ticker}', method='GET')
-        last = history[-1]
-        last_to_last = history[-2]
-        month_ago = history[-31]
-        percentage_change = (last['Close'] - last_to_last['Close'])/last_to_last['Close']*100
-        roi = ((last['Close']/month_ago['Close'])-1)*100
-        roi_prev = ((last_to_last['Close']/month_ago['Close'])-1)*100
-        roi_pct = ((roi-roi_prev)/roi_prev)*100
-        data = {'Value':last['Close'],
-        'name': ticker,
-        'ticker_name':ticker,
-        'percentage_change':percentage_change,
-        'sign': percentage_change > 0,
-        'ESG': rest_api_call(f'/api/analytics/esg/{ticker}', method='GET')['analysis']['total_esg'],
-        'Risk': rest_api_call(f'/api/analytics/risk/{ticker}', method='GET')['risk_score'],
-        'ROI' : roi,
-        'ROI_PCT' : roi_pct,
-        'Principle': month_ago['Close'],
-        }
-        portfolio_data.append(data)
-    ret = {'tickers':portfolio_data,
-        'overall':pd.DataFrame(portfolio_data)[['ESG','Risk', 'ROI', 'Principle']].mean().to_dict(),
-        'swot':rest_api_call(f"/api/analytics/swot?portfolio={','.join(tickers)}","GET"),
-        "strategies":rest_api_call(f"/api/analytics/strategies?portfolio={','.join(tickers)}?prompt={prompt}", 'GET', data=None, headers=None),
-        }
-    return ret
+    return jsonify(services.get_portfolio_overview(tickers, prompt))
 
 
 
@@ -0,0 +1,106 @@
+"""
+ASGI entry point for the API.
+
+The LLM-bound endpoints (SWOT, strategies and portfolio chat) are served
+natively on asyncio, so one worker process can hold many in-flight LLM
+requests. Chat answers can also be streamed token by token as
+Server-Sent Events. Every other route falls through to the Flask app.
+
+Run with: uvicorn asgi:app --workers 4
+"""
+import asyncio
+from typing import Any, Dict, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import services
+from api import app as flask_app
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def swot(params: Dict[str, str]) -> Tuple[int, Any]:
+    if not params.get('portfolio'):
+        return 400, {"error": "No tickers provided"}
+    return 200, await services.get_swot_async(params['portfolio'].split(','))
+
+
+async def strategies(params: Dict[str, str]) -> Tuple[int, Any]:
+    portfolio = params['portfolio'].split(',')
+    return 200, await services.get_strategies_async(params.get('prompt'), portfolio)
+
+
+async def portfolio_chat(params: Dict[str, str]) -> Tuple[int, Any]:
+    if params.get('portfolio') is None:
+        return 200, {"error": "No portfolio provided."}
+    portfolio = params['portfolio'].split(',')
+    return 200, await services.chat_async(params.get('user_id'), portfolio, params.get('prompt'), params.get('doc'))
+
+
+async def portfolio_chat_stream(params: Dict[str, str]) -> Tuple[int, Any]:
+    if params.get('portfolio') is None or not params.get('prompt'):
+        return 400, {"error": "No portfolio or prompt provided."}
+    portfolio = params['portfolio'].split(',')
+    return 200, services.chat_stream_async(params.get('user_id'), portfolio, params['prompt'])
+
+
+ASYNC_ROUTES = {
+    '/api/analytics/swot': swot,
+    '/api/analytics/strategies': strategies,
+    '/api/chat/portfolio/': portfolio_chat,
+    '/api/chat/portfolio/stream': portfolio_chat_stream,
+}
+
+
+async def app(scope, receive, send):
+    """Dispatch LLM-bound GET endpoints to async handlers and the rest to Flask"""
+    handler = ASYNC_ROUTES.get(scope.get('path')) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+    if handler is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    query = parse_qs(scope['query_string'].decode(), keep_blank_values=True)
+    params = {key: values[-1] for key, values in query.items()}
+    status, data = await handler(params)
+    if hasattr(data, '__aiter__'):
+        await send_event_stream(receive, send, status, data)
+        return
+    body = flask_app.json.dumps(data).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_event_stream(receive, send, status: int, events):
+    """Send Server-Sent Events frames as they are produced, stopping when the client disconnects"""
+    async def stream():
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')],
+        })
+        async for event in events:
+            await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    streaming = asyncio.ensure_future(stream())
+    watching = asyncio.ensure_future(disconnected())
+    try:
+        # A disconnect cancels the stream so the LLM call behind it stops too
+        await asyncio.wait({streaming, watching}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, watching):
+            task.cancel()
+        await asyncio.gather(streaming, watching, return_exceptions=True)
+        await events.aclose()
+    if not streaming.cancelled() and streaming.exception() is not None:
+        raise streaming.exception()
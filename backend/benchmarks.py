@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from covariance import daily_returns
+from price_store import get_price_store
+from scrape_yfinance import HISTORY_TTL, is_history_stale, refresh_price_history, scrape_flight
+
+DEFAULT_BENCHMARK = "SPY"
+BENCHMARK_CHECK_INTERVAL = float(os.environ.get("BENCHMARK_CHECK_INTERVAL", HISTORY_TTL))  # Seconds between checks for new bars
+BENCHMARK_RETRY_DELAY = 30.0  # Seconds before retrying a failed refresh, doubled on each failure
+
+# Broad market indices: symbol -> name
+MARKET_BENCHMARKS = {
+    'SPY': 'S&P 500',
+    '^NSEI': 'NIFTY 50',
+    '^BSESN': 'BSE Sensex',
+}
+
+# Ticker suffix -> regional index for listings outside the US
+REGIONAL_BENCHMARKS = {
+    '.NS': '^NSEI',
+    '.BO': '^BSESN',
+}
+
+# SECTOR_TICKERS sector -> sector ETF
+SECTOR_BENCHMARKS = {
+    'Technology': 'XLK',
+    'EV': 'DRIV',
+    'Healthcare': 'XLV',
+    'Finance': 'XLF',
+    'Energy': 'XLE',
+    'AI': 'BOTZ',
+    'Semiconductors': 'SMH',
+    'Cloud': 'SKYY',
+    'E-commerce': 'IBUY',
+    'Social Media': 'SOCL',
+    'Biotech': 'XBI',
+    'Green Energy': 'ICLN',
+}
+
+
+def benchmark_for(ticker: str) -> str:
+    """Market index a ticker is measured against (its regional index, else the S&P 500)"""
+    for suffix, symbol in REGIONAL_BENCHMARKS.items():
+        if ticker.upper().endswith(suffix):
+            return symbol
+    return DEFAULT_BENCHMARK
+
+
+def portfolio_benchmark(tickers: List[str]) -> str:
+    """Market index shared by every holding, or the S&P 500 for a mixed portfolio"""
+    symbols = {benchmark_for(ticker) for ticker in tickers}
+    return symbols.pop() if len(symbols) == 1 else DEFAULT_BENCHMARK
+
+
+def sector_benchmark(sector: str) -> Optional[str]:
+    """Sector ETF of a SECTOR_TICKERS sector, if there is one"""
+    return SECTOR_BENCHMARKS.get(sector)
+
+
+class BenchmarkRegistry:
+    """
+    Benchmark histories kept in memory and checked for new bars every ``check_interval`` seconds.
+
+    Benchmarks are fetched into the shared price store (only the bars
+    missing since the last check), so every process and endpoint computes
+    betas from the same series. Their daily returns, keyed by calendar date,
+    are preloaded. A refresh that fails, or leaves a benchmark without
+    bars, keeps the series loaded so far and is retried with exponential
+    backoff rather than at the next check.
+    """
+
+    def __init__(self, symbols: Optional[List[str]] = None, store=None,
+                 check_interval: float = BENCHMARK_CHECK_INTERVAL):
+        self.symbols = symbols or list(dict.fromkeys([*MARKET_BENCHMARKS, *SECTOR_BENCHMARKS.values()]))
+        self.store = store or get_price_store()
+        self.check_interval = check_interval
+        self.next_refresh = 0.0  # Time of the next check for new bars
+        self._retry_delay = 0.0
+        self._histories: Dict[str, pd.DataFrame] = {}
+        self._returns: Dict[str, pd.Series] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """
+        Fetch the benchmarks not checked within the check interval, then reload all of them.
+
+        Returns:
+            bool: True if every benchmark has bars; otherwise a retry is scheduled.
+        """
+        def fetch():
+            # Another process may have refreshed while we waited for the lock
+            stale = [symbol for symbol in self.symbols if is_history_stale(symbol, self.store, self.check_interval)]
+            if stale:
+                refresh_price_history(stale, self.store)
+            return len(stale)
+
+        failed = False
+        try:
+            scrape_flight.do("benchmarks", fetch)
+        except Exception as e:
+            print(f"Warning: Could not refresh benchmarks: {str(e)}")
+            failed = True
+
+        histories, returns = {}, {}
+        for symbol in self.symbols:
+            hist = self.store.load_frame(symbol)
+            histories[symbol] = pd.DataFrame() if hist is None else hist
+            returns[symbol] = daily_returns(histories[symbol])
+        missing = [symbol for symbol in self.symbols if histories[symbol].empty]
+        if missing:
+            print(f"Warning: No bars for benchmarks: {', '.join(missing)}")
+
+        with self._lock:
+            for symbol in missing:
+                # Keep a series loaded earlier rather than replacing it with nothing
+                if symbol in self._histories:
+                    histories[symbol], returns[symbol] = self._histories[symbol], self._returns[symbol]
+            self._histories, self._returns = histories, returns
+            if failed or missing:
+                self._retry_delay = min(max(self._retry_delay * 2, BENCHMARK_RETRY_DELAY), self.check_interval)
+                self.next_refresh = time.time() + self._retry_delay
+            else:
+                self._retry_delay = 0.0
+                self.next_refresh = time.time() + self.check_interval
+        return not (failed or missing)
+
+    def _ensure_current(self):
+        if time.time() >= self.next_refresh:
+            self.refresh()
+
+    def get_history(self, symbol: str) -> pd.DataFrame:
+        """Daily bars of a benchmark (empty if it could not be fetched)"""
+        self._ensure_current()
+        with self._lock:
+            return self._histories.get(symbol, pd.DataFrame())
+
+    def get_returns(self, symbol: str) -> pd.Series:
+        """Daily returns of a benchmark, keyed by calendar date"""
+        self._ensure_current()
+        with self._lock:
+            return self._returns.get(symbol, pd.Series(dtype=float))
+
+    def aligned_returns(self, symbol: str, dates: pd.Index) -> np.ndarray:
+        """Daily returns of a benchmark on the given calendar dates (NaN where it did not trade)"""
+        dates = pd.DatetimeIndex(dates)
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        return self.get_returns(symbol).reindex(dates.normalize()).to_numpy()
+
+    def returns_matrix(self, symbols: Optional[List[str]] = None) -> pd.DataFrame:
+        """Date-aligned daily returns of several benchmarks as a dates x symbols frame"""
+        self._ensure_current()
+        with self._lock:
+            return pd.DataFrame({symbol: self._returns[symbol] for symbol in (symbols or self.symbols)
+                                 if symbol in self._returns and not self._returns[symbol].empty})
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_benchmarks() -> BenchmarkRegistry:
+    """Get the process-wide benchmark registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = BenchmarkRegistry()
+        return _registry
@@ -1,43 +1,79 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, AsyncIterator, Iterator
 import yfinance as yf
 import pandas as pd
 import numpy as np
-from groq import Groq
+import asyncio
 import os
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 import PyPDF2
 import re
+from market_data import PriceStoreBackend
+from price_store import get_price_store
+from scrape_yfinance import ensure_price_histories
+from llm_gateway import get_llm_gateway
+from indicators import get_indicator_engine
+from context_builder import ContextBuilder, CONTEXT_TOKEN_BUDGET, truncate_to_tokens
 
 os.environ['GROQ_API_KEY'] = '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'
 # Load environment variables from .env file
 load_dotenv()
 
-def calculate_stock_metrics(hist: pd.DataFrame, ticker: str) -> Dict[str, float]:
+CHAT_HISTORY_TURNS = 10  # Question/answer pairs kept per session
+HISTORY_TURN_TOKENS = 80  # Tokens of each past message shown to the LLM
+REPORT_EXCERPT_TOKENS = 120  # Tokens of each report analysis shown to the LLM
+ANALYSIS_CACHE_SIZE = 128  # Portfolio analyses kept across chat turns and sessions
+MIN_HISTORY_BARS = 30  # Daily bars a holding needs to be analyzed
+_analysis_cache = OrderedDict()  # (sorted holdings, last bar of each) -> analysis
+_analysis_cache_lock = threading.Lock()
+
+
+def last_bar(ticker: str, price_store) -> tuple:
+    """(ticker, timestamp, close) of a holding's last stored bar, read without loading its history"""
+    bars = price_store.load(ticker)
+    if bars is None or len(bars['timestamp']) == 0:
+        return (ticker, None, None)
+    return (ticker, int(bars['timestamp'][-1]), float(bars['Close'][-1]))
+
+
+def load_histories(portfolio: List[str], price_store, period: str = "1y") -> Dict[str, pd.DataFrame]:
+    """Refresh the holdings' stale bars (TTL and single-flight) and load them from the price store"""
+    try:
+        ensure_price_histories(portfolio, price_store)
+    except Exception as e:
+        print(f"Error refreshing portfolio histories: {str(e)}")
+    return PriceStoreBackend(price_store).fetch_histories(list(dict.fromkeys(portfolio)), period=period)
+
+MISSING_API_KEY_MESSAGE = """API key not found. Please set your GROQ_API_KEY environment variable.
+                         You can get an API key from https://console.groq.com/keys"""
+
+STOCK_INDICATORS = {
+    'value_change_21d': ('change', {'periods': 20}),
+    'monthly_return': ('change', {'periods': 29}),
+    'ytd_return': ('total_return', {}),
+    'volatility': ('volatility', {}),
+    'downside_vol': ('volatility', {'downside': True}),
+    'max_drawdown': ('max_drawdown', {}),
+    'momentum': ('change', {'periods': 9}),
+    'trend_signal': ('sma_trend', {'short': 50, 'long': 200}),
+    'rsi': ('rsi', {'period': 14}),
+    'macd_signal': ('macd_signal', {}),
+    'volume_trend': ('volume_trend', {'recent': 5, 'base': 20}),
+}
+
+def calculate_stocks_metrics(histories: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, float]]:
+    """Calculate comprehensive metrics of many stocks, computing their indicators together"""
+    indicators = get_indicator_engine().compute(histories, STOCK_INDICATORS)
+    return {ticker: calculate_stock_metrics(hist, ticker, indicators.get(ticker)) for ticker, hist in histories.items()}
+
+def calculate_stock_metrics(hist: pd.DataFrame, ticker: str, indicators: Dict[str, float] = None) -> Dict[str, float]:
     """Calculate comprehensive stock metrics"""
     try:
-        # Basic price metrics
-        returns = hist['Close'].pct_change().dropna()
-        current_price = hist['Close'].iloc[-1]
-        
-        # Performance metrics
-        value_change_21d = ((current_price / hist['Close'].iloc[-21]) - 1) * 100
-        monthly_return = ((current_price / hist['Close'].iloc[-30]) - 1) * 100
-        ytd_return = ((current_price / hist['Close'].iloc[0]) - 1) * 100
-        
-        # Risk metrics
-        volatility = returns.std() * np.sqrt(252) * 100
-        downside_vol = returns[returns < 0].std() * np.sqrt(252) * 100
-        max_drawdown = ((hist['Close'] / hist['Close'].expanding(min_periods=1).max()) - 1).min() * 100
-        
-        # Technical indicators
-        sma_50 = hist['Close'].rolling(window=50).mean().iloc[-1]
-        sma_200 = hist['Close'].rolling(window=200).mean().iloc[-1]
-        rsi = calculate_rsi(hist['Close'])
-        macd = calculate_macd(hist['Close'])
-        
-        # Volume and momentum
-        volume_trend = (hist['Volume'].iloc[-5:].mean() / hist['Volume'].iloc[-20:-5].mean() - 1) * 100
-        momentum = ((current_price / hist['Close'].iloc[-10]) - 1) * 100
+        if len(hist) < MIN_HISTORY_BARS:
+            raise ValueError(f"Need at least {MIN_HISTORY_BARS} days of history, got {len(hist)}")
+        if indicators is None:
+            indicators = get_indicator_engine().compute({ticker: hist}, STOCK_INDICATORS)[ticker]
         
         # ESG and risk scores (simulated - replace with actual data if available)
         esg_score = np.random.normal(65, 15)  # Simulated ESG score (0-100)
@@ -46,42 +82,16 @@ def calculate_stock_metrics(hist: pd.DataFrame, ticker: str) -> Dict[str, float]
         
         return {
             'ticker': ticker,
-            'value_change_21d': value_change_21d,
-            'monthly_return': monthly_return,
-            'ytd_return': ytd_return,
-            'volatility': volatility,
-            'downside_vol': downside_vol,
-            'max_drawdown': max_drawdown,
-            'momentum': momentum,
-            'trend_signal': 1 if sma_50 > sma_200 else -1,
-            'rsi': rsi,
-            'macd_signal': macd,
-            'volume_trend': volume_trend,
+            **indicators,
             'esg_score': esg_score,
             'governance_risk': governance_risk,
             'climate_risk': climate_risk,
-            'risk_score': calculate_risk_score(volatility, downside_vol, rsi, esg_score)
+            'risk_score': calculate_risk_score(indicators['volatility'], indicators['downside_vol'], indicators['rsi'], esg_score)
         }
     except Exception as e:
         print(f"Error calculating metrics for {ticker}: {str(e)}")
         return {}
 
-def calculate_rsi(prices: pd.Series, periods: int = 14) -> float:
-    """Calculate Relative Strength Index"""
-    delta = prices.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=periods).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=periods).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs.iloc[-1]))
-
-def calculate_macd(prices: pd.Series) -> int:
-    """Calculate MACD signal"""
-    exp1 = prices.ewm(span=12, adjust=False).mean()
-    exp2 = prices.ewm(span=26, adjust=False).mean()
-    macd = exp1 - exp2
-    signal = macd.ewm(span=9, adjust=False).mean()
-    return 1 if macd.iloc[-1] > signal.iloc[-1] else -1
-
 def calculate_risk_score(volatility: float, downside_vol: float, rsi: float, esg_score: float) -> float:
     """Calculate comprehensive risk score including ESG factors"""
     vol_score = min(volatility / 50, 1)  # Normalize volatility
@@ -132,8 +142,60 @@ class PortfolioChat:
         self.current_analysis = None
         self.report_analysis = {}  # Store report analyses
     
-    def analyze_portfolio(self, portfolio: List[str]) -> Dict[str, Any]:
-        """Analyze the given portfolio and return comprehensive metrics"""
+    def to_state(self) -> Dict[str, Any]:
+        """Session state to save between requests"""
+        return {
+            'chat_history': self.chat_history,
+            'current_portfolio': self.current_portfolio,
+            'current_analysis': self.current_analysis,
+            'report_analysis': self.report_analysis,
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'PortfolioChat':
+        """Restore a session saved with to_state"""
+        bot = cls()
+        bot.chat_history = state.get('chat_history', [])
+        bot.current_portfolio = state.get('current_portfolio')
+        bot.current_analysis = state.get('current_analysis')
+        bot.report_analysis = {
+            report_key: {**report, 'timestamp': pd.Timestamp(report['timestamp'])} if report.get('timestamp') else report
+            for report_key, report in state.get('report_analysis', {}).items()
+        }
+        return bot
+    
+    def get_portfolio_analysis(self, portfolio: List[str]) -> Dict[str, Any]:
+        """
+        Get the portfolio analysis, reusing it until holdings change or a holding gets a new or revised bar.
+
+        Analyses are shared by every chat session holding the same tickers. Bars
+        are only downloaded once they are past their TTL, and histories are only
+        loaded from the price store when the analysis has to be recomputed.
+        """
+        price_store = get_price_store()
+        try:
+            ensure_price_histories(portfolio, price_store)
+        except Exception as e:
+            print(f"Error refreshing portfolio histories: {str(e)}")
+        holdings = tuple(sorted(set(portfolio)))
+        key = (holdings, tuple(last_bar(ticker, price_store) for ticker in holdings))
+        with _analysis_cache_lock:
+            if key in _analysis_cache:
+                _analysis_cache.move_to_end(key)
+                return _analysis_cache[key]
+        
+        histories = PriceStoreBackend(price_store).fetch_histories(list(holdings), period="1y")
+        analysis = self.analyze_portfolio(portfolio, histories)
+        # Failed analyses are not cached so the next turn retries them
+        if analysis['stock_metrics']:
+            with _analysis_cache_lock:
+                _analysis_cache[key] = analysis
+                while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+                    _analysis_cache.popitem(last=False)
+        return analysis
+    
+    def analyze_portfolio(self, portfolio: List[str], histories: Dict[str, pd.DataFrame] = None) -> Dict[str, Any]:
+        """Analyze the given portfolio (from already fetched histories, if given) and return comprehensive metrics"""
         analysis = {
             'portfolio_metrics': {},
             'stock_metrics': {},
@@ -144,12 +206,14 @@ class PortfolioChat:
         
         try:
             # Get individual stock metrics
-            for ticker in portfolio:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period="1y")
-                if not hist.empty and len(hist) >= 21:
-                    metrics = calculate_stock_metrics(hist, ticker)
-                    analysis['stock_metrics'][ticker] = metrics
+            if histories is None:
+                histories = load_histories(portfolio, get_price_store())
+            stock_metrics = calculate_stocks_metrics({
+                ticker: hist for ticker in portfolio
+                if len(hist := histories.get(ticker, pd.DataFrame())) >= MIN_HISTORY_BARS
+            })
+            # Holdings whose metrics failed are left out rather than breaking every summary
+            analysis['stock_metrics'] = {ticker: metrics for ticker, metrics in stock_metrics.items() if metrics}
             
             # Calculate portfolio level metrics
             if analysis['stock_metrics']:
@@ -166,43 +230,70 @@ class PortfolioChat:
     def process_message(self, message: str, portfolio: List[str] = None) -> str:
         """Process user message and return AI response"""
         try:
-            # Update portfolio if provided
-            if portfolio:
-                self.current_portfolio = portfolio
-                self.current_analysis = self.analyze_portfolio(portfolio)
-            
-            # Create context from current analysis and reports
-            context = self._create_chat_context()
-            
-            # Add report context if available
-            if self.report_analysis:
-                context += "\n\nReport Analysis:\n"
-                for report_name, analysis in self.report_analysis.items():
-                    context += f"\nReport: {report_name}\n"
-                    if 'metrics' in analysis:
-                        metrics = analysis['metrics']
-                        if metrics.get('revenue'):
-                            context += f"Revenue: ${metrics['revenue'][-1]}M\n"
-                        if metrics.get('margins'):
-                            context += f"Latest Margin: {metrics['margins'][-1]['value']}%\n"
-            
-            # Generate AI response
-            prompt = f"""
-            You are a professional investment advisor. Use the following portfolio and report analysis to answer the user's question.
-            
-            Context:
-            {context}
-            
-            User Question: {message}
-            
-            Provide a clear, concise response focusing on the most relevant metrics and actionable insights.
-            """
-            
-            return self._generate_completion(prompt)
-            
+            response = self._generate_completion(self._build_message_prompt(message, portfolio))
+            self._record_turn(message, response)
+            return response
+        except Exception as e:
+            return f"Error processing message: {str(e)}"
+    
+    async def process_message_async(self, message: str, portfolio: List[str] = None) -> str:
+        """Process user message without blocking the event loop on market data or the LLM"""
+        try:
+            prompt = await asyncio.to_thread(self._build_message_prompt, message, portfolio)
+            response = await self._generate_completion_async(prompt)
+            self._record_turn(message, response)
+            return response
         except Exception as e:
             return f"Error processing message: {str(e)}"
     
+    def process_message_stream(self, message: str, portfolio: List[str] = None) -> Iterator[str]:
+        """Process user message, yielding the AI response as it is generated"""
+        try:
+            prompt = self._build_message_prompt(message, portfolio)
+        except Exception as e:
+            yield f"Error processing message: {str(e)}"
+            return
+        parts = []
+        for text in self._stream_completion(prompt):
+            parts.append(text)
+            yield text
+        self._record_turn(message, "".join(parts))
+    
+    async def process_message_stream_async(self, message: str, portfolio: List[str] = None) -> AsyncIterator[str]:
+        """Process user message, yielding the AI response as it is generated without blocking the event loop"""
+        try:
+            prompt = await asyncio.to_thread(self._build_message_prompt, message, portfolio)
+        except Exception as e:
+            yield f"Error processing message: {str(e)}"
+            return
+        parts = []
+        async for text in self._stream_completion_async(prompt):
+            parts.append(text)
+            yield text
+        self._record_turn(message, "".join(parts))
+    
+    def _build_message_prompt(self, message: str, portfolio: List[str] = None) -> str:
+        """Update the portfolio analysis and build the prompt answering a user message"""
+        # Update portfolio if provided
+        if portfolio:
+            self.current_portfolio = portfolio
+            self.current_analysis = self.get_portfolio_analysis(portfolio)
+        
+        # Create context from current analysis, reports and recent turns
+        context = self._create_chat_context()
+        
+        # Generate AI response
+        return f"""
+        You are a professional investment advisor. Use the following portfolio and report analysis to answer the user's question.
+        
+        Context:
+        {context}
+        
+        User Question: {message}
+        
+        Provide a clear, concise response focusing on the most relevant metrics and actionable insights.
+        """
+    
     def _calculate_portfolio_metrics(self, stock_metrics: Dict[str, Dict]) -> Dict[str, float]:
         """Calculate aggregate portfolio metrics"""
         metrics = {}
@@ -263,68 +354,146 @@ class PortfolioChat:
             print(f"Error calculating ESG metrics: {str(e)}")
         return metrics
     
-    def _create_chat_context(self) -> str:
-        """Create a context string from current analysis"""
-        if not self.current_analysis:
-            return "No portfolio analysis available."
-        
-        context = []
+    def _create_chat_context(self, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+        """
+        Create a context string from the current analysis, analyzed reports and recent turns.
+
+        Sections are ranked so the portfolio overview and risk profile are
+        kept first; holdings, conversation history and report excerpts are
+        trimmed or summarized to stay within ``budget`` tokens.
+        """
+        builder = ContextBuilder(budget)
+        analysis = self.current_analysis or {}
         
         # Portfolio overview
-        if self.current_analysis['portfolio_metrics']:
-            metrics = self.current_analysis['portfolio_metrics']
-            context.append(f"Portfolio Overview:")
-            context.append(f"- Total Return (21d): {metrics.get('total_return', 0):0.1f}%")
-            context.append(f"- Portfolio Volatility: {metrics.get('portfolio_volatility', 0):0.1f}%")
-            context.append(f"- Average ESG Score: {metrics.get('avg_esg_score', 0):0.1f}")
-            context.append(f"- Risk Score: {metrics.get('avg_risk_score', 0):0.1f}")
-        
-        # Sector exposure
-        if self.current_analysis['sector_exposure']:
-            context.append("\nSector Exposure:")
-            for sector, exposure in self.current_analysis['sector_exposure'].items():
-                context.append(f"- {sector}: {exposure:0.1f}%")
+        if analysis.get('portfolio_metrics'):
+            metrics = analysis['portfolio_metrics']
+            builder.add("Portfolio Overview", [
+                f"- Total Return (21d): {metrics.get('total_return', 0):0.1f}%",
+                f"- Portfolio Volatility: {metrics.get('portfolio_volatility', 0):0.1f}%",
+                f"- Average ESG Score: {metrics.get('avg_esg_score', 0):0.1f}",
+                f"- Risk Score: {metrics.get('avg_risk_score', 0):0.1f}",
+            ], priority=0)
         
         # Risk profile
-        if self.current_analysis['risk_profile']:
-            profile = self.current_analysis['risk_profile']
-            context.append("\nRisk Profile:")
-            context.append(f"- Volatility Risk: {profile.get('volatility_risk', 0):0.1f}%")
-            context.append(f"- Maximum Drawdown: {profile.get('drawdown_risk', 0):0.1f}%")
-            context.append(f"- ESG Risk Level: {profile.get('esg_risk', 0):0.1f}")
-            context.append(f"- Climate Risk: {profile.get('climate_risk', 0):0.1f}")
+        if analysis.get('risk_profile'):
+            profile = analysis['risk_profile']
+            builder.add("Risk Profile", [
+                f"- Volatility Risk: {profile.get('volatility_risk', 0):0.1f}%",
+                f"- Maximum Drawdown: {profile.get('drawdown_risk', 0):0.1f}%",
+                f"- ESG Risk Level: {profile.get('esg_risk', 0):0.1f}",
+                f"- Climate Risk: {profile.get('climate_risk', 0):0.1f}",
+            ], priority=1)
+        
+        # Sector exposure, largest first
+        if analysis.get('sector_exposure'):
+            exposure = sorted(analysis['sector_exposure'].items(), key=lambda item: item[1], reverse=True)
+            builder.add("Sector Exposure", [f"- {sector}: {weight:0.1f}%" for sector, weight in exposure], priority=2)
+        
+        # Recent conversation, most recent turns kept first
+        if self.chat_history:
+            builder.add("Recent Conversation", [
+                f"- {'User' if turn['role'] == 'user' else 'Advisor'}: {truncate_to_tokens(' '.join(turn['content'].split()), HISTORY_TURN_TOKENS)}"
+                for turn in self.chat_history
+            ], priority=3, keep_last=True)
+        
+        # Holdings, riskiest first
+        if analysis.get('stock_metrics'):
+            holdings = sorted(analysis['stock_metrics'].values(), key=lambda m: m.get('risk_score', 0), reverse=True)
+            builder.add("Holdings", [
+                f"- {m['ticker']}: 21d {m['value_change_21d']:0.1f}%, volatility {m['volatility']:0.1f}%, "
+                f"RSI {m['rsi']:0.0f}, risk score {m['risk_score']:0.1f}"
+                for m in holdings
+            ], priority=4, summary=f"Holdings: {len(holdings)} stocks")
+        
+        # Report excerpts, most recent first
+        if self.report_analysis:
+            lines = []
+            for report_name, report in reversed(list(self.report_analysis.items())):
+                line = f"- {report_name}"
+                metrics = report.get('metrics', {})
+                if metrics.get('revenue'):
+                    line += f" | Revenue: ${metrics['revenue'][-1]}M"
+                if metrics.get('margins'):
+                    line += f" | Latest Margin: {metrics['margins'][-1]['value']}%"
+                if isinstance(report.get('analysis'), str):
+                    line += f" | {truncate_to_tokens(' '.join(report['analysis'].split()), REPORT_EXCERPT_TOKENS)}"
+                lines.append(line)
+            builder.add("Report Analysis", lines, priority=5,
+                        summary=f"Report Analysis: {len(lines)} reports analyzed ({', '.join(self.report_analysis)})")
         
-        return "\n".join(context)
+        return builder.build() or "No portfolio analysis available."
+    
+    def _record_turn(self, message: str, response: str):
+        """Remember a question and its answer, keeping only the latest turns"""
+        self.chat_history.append({'role': 'user', 'content': message})
+        self.chat_history.append({'role': 'assistant', 'content': response})
+        del self.chat_history[:-2 * CHAT_HISTORY_TURNS]
     
     def _generate_completion(self, prompt: str) -> str:
-        """Generate AI completion using Groq"""
+        """Generate AI completion through the shared LLM gateway"""
+        if not os.environ.get("GROQ_API_KEY"):
+            return MISSING_API_KEY_MESSAGE
         try:
-            api_key = os.environ.get("GROQ_API_KEY")
-            if not api_key:
-                return """API key not found. Please set your GROQ_API_KEY environment variable.
-                         You can get an API key from https://console.groq.com/keys"""
-            
-            client = Groq(api_key=api_key)
-            chat_completion = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192",
-            )
-            return str(chat_completion.choices[0].message.content)
+            return get_llm_gateway().complete(prompt)
         except Exception as e:
-            # Fallback response with basic analysis
-            try:
-                # Extract key metrics for a simple response
-                if self.current_analysis and self.current_analysis['portfolio_metrics']:
-                    metrics = self.current_analysis['portfolio_metrics']
-                    return f"""Unable to generate AI response, but here are your key metrics:
-                        - Total Return (21d): {metrics.get('total_return', 0):0.1f}%
-                        - Portfolio Volatility: {metrics.get('portfolio_volatility', 0):0.1f}%
-                        - Risk Score: {metrics.get('avg_risk_score', 0):0.1f}
-                        Please set up your GROQ_API_KEY for detailed AI analysis."""
-            except:
-                pass
-            
-            return "Please set up your GROQ_API_KEY environment variable for AI analysis."
+            return self._fallback_response()
+    
+    async def _generate_completion_async(self, prompt: str) -> str:
+        """Generate AI completion through the shared LLM gateway without blocking the event loop"""
+        if not os.environ.get("GROQ_API_KEY"):
+            return MISSING_API_KEY_MESSAGE
+        try:
+            return await get_llm_gateway().complete_async(prompt)
+        except Exception as e:
+            return self._fallback_response()
+    
+    def _stream_completion(self, prompt: str) -> Iterator[str]:
+        """Stream AI completion through the shared LLM gateway"""
+        if not os.environ.get("GROQ_API_KEY"):
+            yield MISSING_API_KEY_MESSAGE
+            return
+        streamed = False
+        try:
+            for text in get_llm_gateway().stream(prompt):
+                streamed = True
+                yield text
+        except Exception:
+            # Errors after the first token surface to the caller; the answer is already partial
+            if streamed:
+                raise
+            yield self._fallback_response()
+    
+    async def _stream_completion_async(self, prompt: str) -> AsyncIterator[str]:
+        """Stream AI completion through the shared LLM gateway without blocking the event loop"""
+        if not os.environ.get("GROQ_API_KEY"):
+            yield MISSING_API_KEY_MESSAGE
+            return
+        streamed = False
+        try:
+            async for text in get_llm_gateway().stream_async(prompt):
+                streamed = True
+                yield text
+        except Exception:
+            if streamed:
+                raise
+            yield self._fallback_response()
+    
+    def _fallback_response(self) -> str:
+        """Fallback response with basic analysis when the LLM is unavailable"""
+        try:
+            # Extract key metrics for a simple response
+            if self.current_analysis and self.current_analysis['portfolio_metrics']:
+                metrics = self.current_analysis['portfolio_metrics']
+                return f"""Unable to generate AI response, but here are your key metrics:
+                    - Total Return (21d): {metrics.get('total_return', 0):0.1f}%
+                    - Portfolio Volatility: {metrics.get('portfolio_volatility', 0):0.1f}%
+                    - Risk Score: {metrics.get('avg_risk_score', 0):0.1f}
+                    Please set up your GROQ_API_KEY for detailed AI analysis."""
+        except:
+            pass
+        
+        return "Please set up your GROQ_API_KEY environment variable for AI analysis."
     
     def analyze_report(self, file_path: str) -> Dict[str, Any]:
         """Analyze a PDF report and extract insights"""
@@ -0,0 +1,87 @@
+import math
+import os
+from typing import List, Optional
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKENS", 1500))
+CHARS_PER_TOKEN = 4  # Rough average for English text with the Llama tokenizer
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about ``max_tokens`` tokens, marking the cut"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(max_chars - 3, 0)].rstrip() + "..."
+
+
+class ContextSection:
+    """A titled block of prompt context with a priority and a fallback summary"""
+
+    def __init__(self, title: str, lines: List[str], priority: int, summary: Optional[str] = None,
+                 keep_last: bool = False):
+        self.title = title
+        self.lines = lines
+        self.priority = priority
+        self.summary = summary
+        self.keep_last = keep_last
+
+    def render(self, lines: List[str]) -> str:
+        return "\n".join([f"{self.title}:"] + lines)
+
+
+class ContextBuilder:
+    """
+    Assemble prompt context within a fixed token budget.
+
+    Sections are granted budget in priority order (0 first). A section that
+    does not fit whole keeps as many of its lines as fit (the first ones, or
+    the last ones with ``keep_last``); if not even one line fits it is
+    replaced by its summary, or dropped. Kept sections appear in the order
+    they were added.
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET):
+        self.budget = budget
+        self.sections: List[ContextSection] = []
+
+    def add(self, title: str, lines: List[str], priority: int, summary: Optional[str] = None,
+            keep_last: bool = False):
+        """Add a section; empty sections are ignored"""
+        if lines:
+            self.sections.append(ContextSection(title, lines, priority, summary, keep_last))
+
+    def build(self) -> str:
+        """Render the sections that fit in the budget"""
+        remaining = self.budget
+        rendered = {}
+        for index, section in sorted(enumerate(self.sections), key=lambda item: item[1].priority):
+            text = self._fit(section, remaining)
+            if text:
+                rendered[index] = text
+                # Sections are joined by a blank line
+                remaining -= estimate_tokens(text) + 1
+        return "\n\n".join(rendered[index] for index in sorted(rendered))
+
+    def _fit(self, section: ContextSection, budget: int) -> Optional[str]:
+        text = section.render(section.lines)
+        if estimate_tokens(text) <= budget:
+            return text
+
+        kept = []
+        lines = reversed(section.lines) if section.keep_last else section.lines
+        for line in lines:
+            candidate = [line] + kept if section.keep_last else kept + [line]
+            if estimate_tokens(section.render(candidate)) > budget:
+                break
+            kept = candidate
+        if kept:
+            return section.render(kept)
+
+        if section.summary and estimate_tokens(section.summary) <= budget:
+            return section.summary
+        return None
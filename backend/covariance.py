@@ -0,0 +1,241 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from market_data import normalize_dates
+
+COVARIANCE_CACHE_SIZE = int(os.environ.get("COVARIANCE_CACHE_SIZE", 64))  # Portfolios kept
+MIN_OBSERVATIONS = 30  # Daily returns needed for a ticker to be included, and shared by a pair for its covariance
+TRADING_DAYS = 252
+
+
+def daily_returns(hist: pd.DataFrame) -> pd.Series:
+    """Daily close-to-close returns of a history, keyed by calendar date"""
+    if hist.empty:
+        return pd.Series(dtype=float)
+    closes = normalize_dates(hist)['Close']
+    closes = closes[~closes.index.duplicated(keep='last')]
+    return closes.pct_change().dropna()
+
+
+def returns_matrix(histories: Dict[str, pd.DataFrame], min_observations: int = MIN_OBSERVATIONS) -> pd.DataFrame:
+    """
+    Build one date-aligned dates x tickers matrix of daily returns.
+
+    Each ticker's returns are taken over its own bars, keyed by calendar
+    date, on the union of every ticker's dates; a ticker has NaN on the
+    dates it did not trade, so a short history never truncates the rest.
+    Tickers with fewer than ``min_observations`` returns are left out.
+    """
+    returns = {}
+    for ticker, hist in histories.items():
+        ticker_returns = daily_returns(hist)
+        if len(ticker_returns) >= min_observations:
+            returns[ticker] = ticker_returns
+    if not returns:
+        return pd.DataFrame()
+    return pd.DataFrame(returns).sort_index()
+
+
+def pairwise_covariance(returns: np.ndarray, min_overlap: int = MIN_OBSERVATIONS) -> np.ndarray:
+    """
+    Sample covariance of every pair of columns over the rows both have (NaN marks a missing row).
+
+    Variances use each column's whole history. Pairs sharing fewer than
+    ``min_overlap`` rows get zero covariance, and the matrix is projected
+    onto the nearest positive semi-definite one if the pairwise estimates
+    are not jointly consistent.
+    """
+    observed = ~np.isnan(returns)
+    values = np.where(observed, returns, 0.0)
+    mask = observed.astype(float)
+    overlap = mask.T @ mask
+    sums = values.T @ mask  # [i, j]: sum of column i over the rows column j also has
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = (values.T @ values - sums * sums.T / overlap) / (overlap - 1)
+    covariance[(overlap < min_overlap) & ~np.eye(len(overlap), dtype=bool)] = 0.0
+    covariance = np.nan_to_num(covariance)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    if eigenvalues[0] < 0:
+        covariance = (eigenvectors * np.clip(eigenvalues, 0, None)) @ eigenvectors.T
+    return covariance
+
+
+def ledoit_wolf_shrinkage(returns: np.ndarray) -> float:
+    """
+    Ledoit-Wolf optimal intensity for shrinking a covariance matrix towards a scaled identity.
+
+    Args:
+        returns (np.ndarray): Observations x variables matrix; missing
+            observations (NaN) count as the variable's mean.
+
+    Returns:
+        float: Shrinkage intensity in [0, 1].
+    """
+    n, p = returns.shape
+    centered = np.nan_to_num(returns - np.nanmean(returns, axis=0))
+    covariance = centered.T @ centered / n
+    mu = np.trace(covariance) / p
+    delta = ((covariance - mu * np.eye(p)) ** 2).sum() / p
+    if delta == 0:
+        return 0.0
+    squared = centered ** 2
+    beta = ((squared.T @ squared) / n - covariance ** 2).sum() / (p * n)
+    return float(min(beta, delta) / delta)
+
+
+def shrink_covariance(covariance: np.ndarray, intensity: float) -> np.ndarray:
+    """Blend a covariance matrix with the identity scaled to its average variance"""
+    target = np.trace(covariance) / len(covariance) * np.eye(len(covariance))
+    return (1 - intensity) * covariance + intensity * target
+
+
+def covariance_to_correlation(covariance: np.ndarray) -> np.ndarray:
+    """Correlation matrix of a covariance matrix (NaN where a variance is zero)"""
+    std = np.sqrt(np.diag(covariance))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return covariance / np.outer(std, std)
+
+
+def average_correlation(correlation: np.ndarray) -> float:
+    """Mean of the off-diagonal entries of a correlation matrix (NaN for one asset)"""
+    n = len(correlation)
+    if n < 2:
+        return float('nan')
+    return float((np.nansum(correlation) - np.nansum(np.diag(correlation))) / (n * (n - 1)))
+
+
+class CovarianceEngine:
+    """
+    Correlations, covariances and betas of a set of tickers from one aligned returns matrix.
+
+    Means and variances use each ticker's own history and covariances the
+    dates both tickers traded, so a recent listing does not shorten the
+    window of the others. The covariance is optionally shrunk
+    (``'ledoit_wolf'`` for the optimal intensity, or a fixed intensity in
+    [0, 1]). Betas of every ticker against the benchmark come from one
+    vectorized regression, each over the dates it shares with the benchmark. Results are cached per (tickers, benchmark, latest bar
+    of each, shrinkage), so repeated requests on unchanged data are free.
+    """
+
+    def __init__(self, max_entries: int = COVARIANCE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analyze(self, histories: Dict[str, pd.DataFrame], benchmark: Optional[pd.DataFrame] = None,
+                shrinkage: Union[None, str, float] = None,
+                min_observations: int = MIN_OBSERVATIONS) -> Dict[str, Any]:
+        """
+        Analyze the co-movement of a set of tickers.
+
+        Args:
+            histories (dict): Ticker -> daily OHLCV history.
+            benchmark (pd.DataFrame): Benchmark history to compute betas against.
+            shrinkage: None, 'ledoit_wolf', or a fixed shrinkage intensity.
+            min_observations (int): Returns a ticker needs to be included, and a pair needs in common for its covariance.
+
+        Returns:
+            dict: tickers (list, those with enough data), observations
+            (pd.Series of returns per ticker), mean_returns, volatilities and
+            betas (annualized pd.Series; betas empty without a benchmark), covariance and correlation
+            (annualized pd.DataFrame, after shrinkage) and shrinkage (float
+            intensity used).
+        """
+        key = (
+            tuple((ticker, *self._last_bar(hist)) for ticker, hist in histories.items()),
+            self._last_bar(benchmark) if benchmark is not None else None,
+            shrinkage,
+            min_observations,
+        )
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        result = self._compute(histories, benchmark, shrinkage, min_observations)
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _last_bar(hist: pd.DataFrame) -> tuple:
+        if hist.empty:
+            return (None, None)
+        return (hist.index[-1], float(hist['Close'].iloc[-1]))
+
+    def _compute(self, histories: Dict[str, pd.DataFrame], benchmark: Optional[pd.DataFrame],
+                 shrinkage: Union[None, str, float], min_observations: int) -> Dict[str, Any]:
+        matrix = returns_matrix(histories, min_observations)
+        tickers: List[str] = list(matrix.columns)
+
+        if not tickers:
+            empty = pd.Series(dtype=float)
+            return {
+                'tickers': [], 'observations': pd.Series(dtype=int), 'mean_returns': empty, 'volatilities': empty,
+                'betas': empty, 'covariance': pd.DataFrame(), 'correlation': pd.DataFrame(), 'shrinkage': 0.0,
+            }
+
+        values = matrix.to_numpy()
+        observed = ~np.isnan(values)
+        covariance = pairwise_covariance(values, min_observations)
+        intensity = 0.0
+        if shrinkage == 'ledoit_wolf':
+            intensity = ledoit_wolf_shrinkage(values)
+        elif shrinkage is not None:
+            intensity = float(shrinkage)
+        if intensity:
+            covariance = shrink_covariance(covariance, intensity)
+
+        betas = pd.Series(dtype=float)
+        if benchmark is not None and not benchmark.empty:
+            # All betas at once: cov(r_i, r_m) / var(r_m), each over the dates the ticker shares with the market
+            market = daily_returns(benchmark).reindex(matrix.index).to_numpy()
+            shared = observed & ~np.isnan(market)[:, None]
+            counts = shared.sum(axis=0)
+            stock = np.where(shared, values, 0.0)
+            market = np.where(shared, market[:, None], 0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                stock_centered = np.where(shared, stock - stock.sum(axis=0) / counts, 0.0)
+                market_centered = np.where(shared, market - market.sum(axis=0) / counts, 0.0)
+                market_var = (market_centered ** 2).sum(axis=0)
+                beta_values = (stock_centered * market_centered).sum(axis=0) / market_var
+            beta_values[(counts < min_observations) | (market_var == 0)] = np.nan
+            betas = pd.Series(beta_values, index=tickers)
+
+        covariance *= TRADING_DAYS
+        return {
+            'tickers': tickers,
+            'observations': pd.Series(observed.sum(axis=0), index=tickers),
+            'mean_returns': pd.Series(np.nanmean(values, axis=0) * TRADING_DAYS, index=tickers),
+            'volatilities': pd.Series(np.sqrt(np.diag(covariance)), index=tickers),
+            'betas': betas,
+            'covariance': pd.DataFrame(covariance, index=tickers, columns=tickers),
+            'correlation': pd.DataFrame(covariance_to_correlation(covariance), index=tickers, columns=tickers),
+            'shrinkage': intensity,
+        }
+
+    def clear(self):
+        """Drop all cached results"""
+        with self._lock:
+            self._results.clear()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_covariance_engine() -> CovarianceEngine:
+    """Get the process-wide covariance engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CovarianceEngine()
+        return _engine
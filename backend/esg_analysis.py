@@ -1,46 +1,121 @@
-import yfinance as yf
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional
+
+from market_data import get_market_data
+from scrape_yfinance import (FUNDAMENTALS_TTL, dataset_fetched_at, is_dataset_stale, mark_dataset_fetched,
+                             save_to_csv, scrape_flight)
+
+ESG_FILE = "sustainability.csv"
+ESG_WORKERS = 8  # Bound on concurrent rating fetches for one allocation
+
+
+def esg_quality(ratings: Optional[Dict[str, float]]) -> float:
+    """
+    Convert a total ESG risk rating into a 0-100 score where higher is better.
+
+    Yahoo's ``totalEsg`` is a Sustainalytics ESG risk rating: unmanaged risk,
+    where lower is better (under 10 negligible, 40 and over severe). Takes
+    the ratings of ESGAnalyzer.get_esg_rating, where a missing rating is None.
+
+    Returns:
+        float: 100 minus the rating, or NaN if the rating is unknown.
+    """
+    if not ratings or ratings.get('total_esg') is None:
+        return np.nan
+    return 100.0 - ratings['total_esg']
+
 
 class ESGAnalyzer:
-    def __init__(self):
-        self.esg_cache = {}
-    
+    """
+    ESG risk ratings served from a cached ``sustainability.csv`` dataset per ticker.
+
+    Ratings are fetched through the market data backend at most once per
+    ``ttl``, one fetch per ticker in flight, and a ticker without ratings is
+    remembered as such until its dataset expires. ``get_esg_score`` serves
+    the API (missing ratings default to 50); ``get_esg_rating`` leaves them
+    unknown for callers that need to tell the difference.
+    """
+
+    def __init__(self, data_path: str = "data/finance", ttl: float = FUNDAMENTALS_TTL):
+        self.data_path = data_path
+        self.ttl = ttl
+        self.esg_cache = {}  # Ticker -> (fetched_at, ratings or None)
+        self._lock = threading.Lock()
+
+    def _refresh(self, ticker: str, save_path: str):
+        if not is_dataset_stale(save_path, ESG_FILE, self.ttl):
+            return
+        os.makedirs(save_path, exist_ok=True)
+        fetched_at = time.time()
+        try:
+            save_to_csv(get_market_data().get_sustainability(ticker), save_path, ESG_FILE)
+            mark_dataset_fetched(save_path, ESG_FILE, fetched_at)
+        except Exception as e:
+            print(f"Error fetching ESG ratings for {ticker}: {str(e)}")
+
+    def _read(self, save_path: str) -> Optional[Dict[str, float]]:
+        csv_path = os.path.join(save_path, ESG_FILE)
+        if not os.path.exists(csv_path):
+            return None
+        sustainability = pd.read_csv(csv_path, index_col=0)
+        if sustainability.empty:
+            return None
+        # Get the first column (usually 'esgScores' or 'Value'); it mixes numbers and text
+        esg_data = pd.to_numeric(sustainability.iloc[:, 0], errors='coerce').to_dict()
+        ratings = {
+            'total_esg': esg_data.get('totalEsg'),
+            'environment': esg_data.get('environmentScore'),
+            'social': esg_data.get('socialScore'),
+            'governance': esg_data.get('governanceScore')
+        }
+        # Normalize ratings to 0-100 scale, leaving missing ones unknown
+        return {k: None if pd.isna(v) else min(100, max(0, float(v))) for k, v in ratings.items()}
+
     def get_esg_score(self, ticker: str) -> Optional[Dict[str, float]]:
         """Get simple ESG scores for a company"""
-        try:
-            # Check cache first
-            if ticker in self.esg_cache:
-                return self.esg_cache[ticker]
-            
-            stock = yf.Ticker(ticker)
-            sustainability = stock.sustainability
-            
-            if isinstance(sustainability, pd.DataFrame) and not sustainability.empty:
-                # Get the first column (usually 'Value' or similar)
-                column = sustainability.columns[0]
-                esg_data = sustainability[column].to_dict()
-                
-                scores = {
-                    'total_esg': esg_data.get('totalEsg', 50),
-                    'environment': esg_data.get('environmentScore', 50),
-                    'social': esg_data.get('socialScore', 50),
-                    'governance': esg_data.get('governanceScore', 50)
-                }
-                
-                # Normalize scores to 0-100 scale
-                scores = {k: min(100, max(0, v)) for k, v in scores.items()}
-                
-                # Cache the result
-                self.esg_cache[ticker] = scores
-                return scores
-            
+        ratings = self.get_esg_rating(ticker)
+        if ratings is None:
             return None
-            
+        return {k: 50 if v is None else v for k, v in ratings.items()}
+
+    def get_esg_rating(self, ticker: str) -> Optional[Dict[str, float]]:
+        """Get a company's ESG risk ratings (lower is better; None where Yahoo has no rating)"""
+        try:
+            with self._lock:
+                cached = self.esg_cache.get(ticker)
+            if cached is not None and time.time() - cached[0] < self.ttl:
+                return cached[1]
+
+            save_path = os.path.join(self.data_path, ticker)
+            if is_dataset_stale(save_path, ESG_FILE, self.ttl):
+                scrape_flight.do(f"dataset:{save_path}/{ESG_FILE}", self._refresh, ticker, save_path)
+            ratings = self._read(save_path)
+
+            # Only fetched results are cached, so a failed fetch is retried on the next call
+            fetched_at = dataset_fetched_at(save_path, ESG_FILE)
+            if fetched_at:
+                with self._lock:
+                    self.esg_cache[ticker] = (fetched_at, ratings)
+            return ratings
+
         except Exception as e:
             print(f"Error getting ESG score for {ticker}: {str(e)}")
             return None
 
+    def get_esg_ratings(self, tickers: List[str]) -> Dict[str, Optional[Dict[str, float]]]:
+        """Get the ESG risk ratings of several companies, fetching missing ones concurrently"""
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(ESG_WORKERS, len(tickers)), thread_name_prefix="esg") as executor:
+            return dict(zip(tickers, executor.map(self.get_esg_rating, tickers)))
+
 def main():
     analyzer = ESGAnalyzer()
     
@@ -0,0 +1,202 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+INDICATOR_CACHE_SIZE = int(os.environ.get("INDICATOR_CACHE_SIZE", 16384))  # (ticker, indicator) values kept
+
+
+def stack_histories(histories: Dict[str, pd.DataFrame], column: str) -> pd.DataFrame:
+    """
+    Stack one column of many histories into a bars x tickers matrix.
+
+    Rows are aligned on each ticker's latest bar (row -1 is every ticker's
+    last bar, row -2 the one before, ...), so tickers trading on different
+    calendars never get holes; shorter histories are padded with leading NaN.
+    """
+    length = max((len(hist) for hist in histories.values()), default=0)
+    matrix = np.full((length, len(histories)), np.nan)
+    for i, hist in enumerate(histories.values()):
+        if len(hist):
+            matrix[length - len(hist):, i] = hist[column].to_numpy(dtype=float)
+    return pd.DataFrame(matrix, columns=list(histories))
+
+
+def _simple_returns(closes: pd.DataFrame) -> pd.DataFrame:
+    return closes / closes.shift(1) - 1
+
+
+def rsi(closes: pd.DataFrame, period: int = 14, flat_value: float = None) -> pd.Series:
+    """Relative Strength Index of the latest bar; ``flat_value`` is used when there were no losses"""
+    delta = closes.diff()
+    gain = delta.where(delta > 0, 0).where(closes.notna()).rolling(window=period).mean().iloc[-1]
+    loss = (-delta.where(delta < 0, 0)).where(closes.notna()).rolling(window=period).mean().iloc[-1]
+    values = 100 - (100 / (1 + gain / loss))
+    if flat_value is not None:
+        values = values.where(loss != 0, flat_value)
+    return values
+
+
+def macd_signal(closes: pd.DataFrame, fast: int = 12, slow: int = 26, signal: int = 9) -> pd.Series:
+    """1 if the MACD line is above its signal line at the latest bar, else -1"""
+    macd = closes.ewm(span=fast, adjust=False).mean() - closes.ewm(span=slow, adjust=False).mean()
+    signal_line = macd.ewm(span=signal, adjust=False).mean()
+    return pd.Series(np.where(macd.iloc[-1] > signal_line.iloc[-1], 1, -1), index=closes.columns)
+
+
+def sma_trend(closes: pd.DataFrame, short: int = 50, long: int = 200) -> pd.Series:
+    """1 if the short moving average is above the long one at the latest bar, else -1"""
+    short_sma = closes.rolling(window=short).mean().iloc[-1]
+    long_sma = closes.rolling(window=long).mean().iloc[-1]
+    return pd.Series(np.where(short_sma > long_sma, 1, -1), index=closes.columns)
+
+
+def volume_trend(volumes: pd.DataFrame, recent: int = 5, base: int = 20) -> pd.Series:
+    """Percent change of the average volume of the last ``recent`` bars over the ``base - recent`` bars before"""
+    return (volumes.iloc[-recent:].mean() / volumes.iloc[-base:-recent].mean() - 1) * 100
+
+
+def change(closes: pd.DataFrame, periods: int = 10) -> pd.Series:
+    """Percent change of the close over the last ``periods`` bars (momentum)"""
+    if periods >= len(closes):
+        return pd.Series(np.nan, index=closes.columns)
+    return (closes.iloc[-1] / closes.iloc[-1 - periods] - 1) * 100
+
+
+def total_return(closes: pd.DataFrame) -> pd.Series:
+    """Percent change of the close over the whole history"""
+    return (closes.iloc[-1] / closes.bfill().iloc[0] - 1) * 100
+
+
+def volatility(closes: pd.DataFrame, bars: int = None, downside: bool = False) -> pd.Series:
+    """Annualized volatility (%) of daily returns over the last ``bars`` closes, or of negative returns only"""
+    returns = _simple_returns(closes if bars is None else closes.iloc[-bars:])
+    if downside:
+        returns = returns.where(returns < 0)
+    return returns.std() * np.sqrt(252) * 100
+
+
+def sharpe_ratio(closes: pd.DataFrame) -> pd.Series:
+    """Annualized Sharpe ratio of daily returns (zero risk-free rate), 0 for a flat series"""
+    returns = _simple_returns(closes)
+    std = returns.std()
+    return ((returns.mean() / std) * np.sqrt(252)).where(std != 0, 0)
+
+
+def max_drawdown(closes: pd.DataFrame) -> pd.Series:
+    """Deepest fall (%) of the close from its running peak"""
+    return ((closes / closes.cummax()) - 1).min() * 100
+
+
+# Indicator name -> (history column it reads, function of a bars x tickers matrix)
+INDICATORS: Dict[str, Tuple[str, Callable[..., pd.Series]]] = {
+    'rsi': ('Close', rsi),
+    'macd_signal': ('Close', macd_signal),
+    'sma_trend': ('Close', sma_trend),
+    'volume_trend': ('Volume', volume_trend),
+    'change': ('Close', change),
+    'total_return': ('Close', total_return),
+    'volatility': ('Close', volatility),
+    'sharpe_ratio': ('Close', sharpe_ratio),
+    'max_drawdown': ('Close', max_drawdown),
+}
+
+
+def _bar_key(hist: pd.DataFrame) -> Tuple[Any, ...]:
+    """Identify a history by its span and latest bar, so a new or revised bar invalidates it"""
+    return (hist.index[0], hist.index[-1], len(hist), float(hist['Close'].iloc[-1]))
+
+
+class IndicatorEngine:
+    """
+    Compute technical indicators for many tickers at once.
+
+    Each requested indicator is computed in one vectorized pass over a
+    bars x tickers matrix of the tickers that need it. Values are memoized
+    per (ticker, history span and latest bar, indicator, params), so they are
+    recomputed only when a ticker gets a new bar, whichever module asks.
+    """
+
+    def __init__(self, max_entries: int = INDICATOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compute(self, histories: Dict[str, pd.DataFrame],
+                indicators: Dict[str, Tuple[str, Dict[str, Any]]]) -> Dict[str, Dict[str, float]]:
+        """
+        Compute an indicator set for every history.
+
+        Args:
+            histories (dict): Ticker -> OHLCV history (oldest bar first).
+            indicators (dict): Output name -> (indicator name from INDICATORS, params).
+
+        Returns:
+            dict: Ticker -> output name -> value at the latest bar.
+        """
+        histories = {ticker: hist for ticker, hist in histories.items() if not hist.empty}
+        bar_keys = {ticker: _bar_key(hist) for ticker, hist in histories.items()}
+        results = {ticker: {} for ticker in histories}
+        missing: Dict[Tuple[str, Tuple], List[Tuple[str, str]]] = {}
+
+        with self._lock:
+            for name, (indicator, params) in indicators.items():
+                params_key = tuple(sorted(params.items()))
+                for ticker in histories:
+                    key = (ticker, bar_keys[ticker], indicator, params_key)
+                    if key in self._values:
+                        self._values.move_to_end(key)
+                        results[ticker][name] = self._values[key]
+                        self.hits += 1
+                    else:
+                        missing.setdefault((indicator, params_key), []).append((ticker, name))
+                        self.misses += 1
+
+        matrices = {}
+        computed = {}
+        for (indicator, params_key), entries in missing.items():
+            column, function = INDICATORS[indicator]
+            tickers = list(dict.fromkeys(ticker for ticker, _ in entries))
+            matrix_key = (column, tuple(tickers))
+            if matrix_key not in matrices:
+                matrices[matrix_key] = stack_histories({ticker: histories[ticker] for ticker in tickers}, column)
+            values = function(matrices[matrix_key], **dict(params_key))
+            for ticker, name in entries:
+                value = values[ticker]
+                results[ticker][name] = value.item() if isinstance(value, np.generic) else value
+                computed[(ticker, bar_keys[ticker], indicator, params_key)] = results[ticker][name]
+
+        if computed:
+            with self._lock:
+                self._values.update(computed)
+                while len(self._values) > self.max_entries:
+                    self._values.popitem(last=False)
+        return results
+
+    def clear(self):
+        """Drop all memoized values"""
+        with self._lock:
+            self._values.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Memoized value count and lookup hit/miss counters"""
+        with self._lock:
+            return {'entries': len(self._values), 'hits': self.hits, 'misses': self.misses}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_indicator_engine() -> IndicatorEngine:
+    """Get the process-wide indicator engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = IndicatorEngine()
+        return _engine
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "data/llm_cache.sqlite")
+DEFAULT_TTL = float(os.environ.get("LLM_CACHE_TTL", 24 * 60 * 60))  # Seconds
+DEFAULT_MAX_MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 1024))
+DEFAULT_MAX_DISK_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so prompts differing only in indentation share a cache entry"""
+    return " ".join(prompt.split())
+
+
+def cache_key(model: str, prompt: str) -> str:
+    """Cache key for a model and normalized prompt"""
+    return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of LLM responses keyed by model and normalized prompt.
+
+    A bounded in-memory LRU sits in front of a SQLite file shared by every
+    worker process on the box. Entries expire after ``ttl`` seconds, and the
+    disk tier evicts least recently used entries beyond ``max_disk_bytes``.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> (response, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, "
+            "expires_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        """Get a cached response, or None on a miss"""
+        key = cache_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return entry[0]
+
+            row = self._db.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self._memory.pop(key, None)
+                self._stats['misses'] += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._remember(key, row[0], row[1])
+            self._stats['disk_hits'] += 1
+            return row[0]
+
+    def set(self, model: str, prompt: str, response: str, ttl: Optional[float] = None):
+        """Store a response in both tiers"""
+        key = cache_key(model, prompt)
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, response, expires_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode()), expires_at, now),
+            )
+            self._stats['stores'] += 1
+            self._evict_disk(now)
+
+    def _remember(self, key: str, response: str, expires_at: float):
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _evict_disk(self, now: float):
+        """Drop expired entries, then least recently used ones until under the size bound"""
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        freed = 0
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if total - freed <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        for (key,) in evicted:
+            self._memory.pop(key, None)
+        self._stats['evictions'] += len(evicted)
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters of this process plus current tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'], stats['disk_bytes'] = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Get the process-wide LLM response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
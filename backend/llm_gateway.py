@@ -0,0 +1,431 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+import httpx
+from groq import Groq, AsyncGroq, APIConnectionError, APIStatusError
+
+from llm_cache import get_llm_cache
+
+DEFAULT_MODEL = "llama3-8b-8192"
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL")  # Point at a local stub server in tests
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 30))  # Seconds per attempt
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", 90))  # Seconds per call, including retries and queueing
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 4))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 16))
+BACKOFF_BASE = 0.5  # Seconds before the first retry, doubled on every attempt
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """An LLM call that failed after all retries or ran out of time"""
+
+
+def completion_text(chat_completion) -> str:
+    """Extract the response text from a Groq chat completion"""
+    if hasattr(chat_completion, 'content'):
+        return str(chat_completion.content)
+    elif hasattr(chat_completion, 'choices'):
+        return str(chat_completion.choices[0].message.content)
+    else:
+        return str(chat_completion)
+
+
+def chunk_text(chunk) -> str:
+    """Extract the text delta from a streamed chat completion chunk"""
+    if not getattr(chunk, 'choices', None):
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Retry rate limits, server errors, timeouts and dropped connections"""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRY_STATUSES
+    return isinstance(error, APIConnectionError)
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Exponential backoff with jitter, honoring the server's Retry-After when present"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class _Waiter:
+    """A queued request for a slot, woken by ``notify`` once the slot is handed to it"""
+
+    def __init__(self, notify: Callable[[], None]):
+        self.notify = notify
+        self.granted = False
+
+
+class ConcurrencyLimiter:
+    """
+    FIFO-fair limit on calls in flight, shared by threads and event loops.
+
+    Callers beyond the limit queue in arrival order, whether they wait in a
+    thread (``acquire``) or on an event loop (``acquire_async``), and a
+    released slot is handed directly to the oldest waiter.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, notify: Callable[[], None]) -> Optional[_Waiter]:
+        """Take a free slot (returning None) or join the queue (returning the waiter)"""
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return None
+            waiter = _Waiter(notify)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue after a timeout; True if the slot was handed over meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait in a thread for a slot; False if none was free within ``timeout`` seconds"""
+        event = threading.Event()
+        waiter = self._enqueue(event.set)
+        if waiter is None or event.wait(timeout):
+            return True
+        return self._abandon(waiter)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """Wait on the running event loop for a slot; False if none was free within ``timeout`` seconds"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            if not granted.done():
+                granted.set_result(True)
+
+        waiter = self._enqueue(lambda: loop.call_soon_threadsafe(wake))
+        if waiter is None:
+            return True
+        try:
+            await asyncio.wait_for(granted, timeout)
+            return True
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                return True
+            return False
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        """Hand the slot to the oldest waiter, or free it"""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    waiter.notify()
+                except RuntimeError:
+                    # The waiter's event loop was closed; the slot goes to the next one
+                    continue
+                waiter.granted = True
+                return
+            self._active -= 1
+
+
+class LLMGateway:
+    """
+    Process-wide access to the LLM provider.
+
+    One pooled HTTP client is shared by every caller. Calls are answered from
+    the response cache when possible, limited to ``max_concurrency`` in
+    flight (excess calls queue), and retried with exponential backoff on
+    rate limits and transient failures until ``deadline`` runs out. Sync
+    and async callers queue for the same slots in arrival order, so threads
+    and the event loop together never exceed the limit.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = GROQ_BASE_URL,
+                 timeout: float = LLM_TIMEOUT, deadline: float = LLM_DEADLINE,
+                 max_retries: int = LLM_MAX_RETRIES, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_connections: int = LLM_MAX_CONNECTIONS, cache=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.cache = cache if cache is not None else get_llm_cache()
+        self._slots = ConcurrencyLimiter(max_concurrency)
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+        self._closing = set()  # Tasks closing clients of earlier event loops
+        self._lock = threading.Lock()
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        # The gateway owns retries, so the SDK's own retry loop is disabled
+        kwargs = {
+            'api_key': self.api_key or os.environ.get("GROQ_API_KEY"),
+            'timeout': self.timeout,
+            'max_retries': 0,
+        }
+        if self.base_url:
+            kwargs['base_url'] = self.base_url
+        return kwargs
+
+    @property
+    def client(self) -> Groq:
+        """Shared synchronous client, created on first use"""
+        with self._lock:
+            if self._client is None:
+                self._client = Groq(http_client=httpx.Client(limits=self.limits), **self._client_kwargs())
+            return self._client
+
+    @property
+    def async_client(self) -> AsyncGroq:
+        """Async client bound to the running event loop; the client of an earlier loop is closed"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._async_loop is not loop:
+                if self._async_client is not None:
+                    self._close_async_client(self._async_client, self._async_loop)
+                self._async_client = AsyncGroq(http_client=httpx.AsyncClient(limits=self.limits), **self._client_kwargs())
+                self._async_loop = loop
+            return self._async_client
+
+    def _close_async_client(self, client: AsyncGroq, loop: asyncio.AbstractEventLoop):
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+            return
+
+        async def close():
+            try:
+                await client.close()
+            except Exception as e:
+                # Connections of a closed loop may not close cleanly; they are dropped with the client
+                print(f"Warning: Could not close LLM client: {str(e)}")
+
+        task = asyncio.get_running_loop().create_task(close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _cache_model(self, model: str, options: Dict[str, Any]) -> str:
+        """Cache namespace: the model plus any options that change the response"""
+        return f"{model}|{json.dumps(options, sort_keys=True)}" if options else model
+
+    def complete(self, prompt: str, model: str = DEFAULT_MODEL, use_cache: bool = True,
+                 validate: Optional[Callable[[str], bool]] = None, **options) -> str:
+        """
+        Get the completion of a single-message prompt.
+
+        Args:
+            prompt (str): The user message.
+            model (str): Model name.
+            use_cache (bool): Answer from and store in the response cache.
+            validate (callable): Only cache responses for which this returns True.
+            **options: Extra chat completion arguments (e.g., response_format).
+
+        Returns:
+            str: The response text. Raises LLMError on failure.
+        """
+        cache_model = self._cache_model(model, options)
+        if use_cache:
+            cached = self.cache.get(cache_model, prompt)
+            if cached is not None:
+                return cached
+
+        deadline = time.monotonic() + self.deadline
+        if not self._slots.acquire(timeout=self.deadline):
+            raise LLMError("Timed out waiting for an LLM slot")
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    chat_completion = self.client.chat.completions.create(
+                        messages=[{"role": "user", "content": prompt}],
+                        model=model,
+                        timeout=max(min(self.timeout, deadline - time.monotonic()), 0.1),
+                        **options,
+                    )
+                    break
+                except Exception as e:
+                    delay = retry_delay(e, attempt)
+                    if not is_retryable(e) or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                        raise LLMError(str(e)) from e
+                    time.sleep(delay)
+        finally:
+            self._slots.release()
+
+        response = completion_text(chat_completion)
+        if use_cache and (validate is None or validate(response)):
+            self.cache.set(cache_model, prompt, response)
+        return response
+
+    async def complete_async(self, prompt: str, model: str = DEFAULT_MODEL, use_cache: bool = True,
+                             validate: Optional[Callable[[str], bool]] = None, **options) -> str:
+        """Get the completion of a single-message prompt without blocking the event loop"""
+        cache_model = self._cache_model(model, options)
+        if use_cache:
+            cached = await asyncio.to_thread(self.cache.get, cache_model, prompt)
+            if cached is not None:
+                return cached
+
+        client = self.async_client
+        deadline = time.monotonic() + self.deadline
+        if not await self._slots.acquire_async(timeout=self.deadline):
+            raise LLMError("Timed out waiting for an LLM slot")
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    chat_completion = await client.chat.completions.create(
+                        messages=[{"role": "user", "content": prompt}],
+                        model=model,
+                        timeout=max(min(self.timeout, deadline - time.monotonic()), 0.1),
+                        **options,
+                    )
+                    break
+                except Exception as e:
+                    delay = retry_delay(e, attempt)
+                    if not is_retryable(e) or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                        raise LLMError(str(e)) from e
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+
+        response = completion_text(chat_completion)
+        if use_cache and (validate is None or validate(response)):
+            await asyncio.to_thread(self.cache.set, cache_model, prompt, response)
+        return response
+
+
+    def stream(self, prompt: str, model: str = DEFAULT_MODEL, use_cache: bool = True,
+               validate: Optional[Callable[[str], bool]] = None, **options) -> Iterator[str]:
+        """
+        Stream the completion of a single-message prompt as text deltas.
+
+        A cached response is yielded whole. Failures are retried only until
+        the first delta arrives, since a partial answer cannot be replayed.
+        The complete response is cached once the stream ends.
+        """
+        cache_model = self._cache_model(model, options)
+        if use_cache:
+            cached = self.cache.get(cache_model, prompt)
+            if cached is not None:
+                yield cached
+                return
+
+        deadline = time.monotonic() + self.deadline
+        if not self._slots.acquire(timeout=self.deadline):
+            raise LLMError("Timed out waiting for an LLM slot")
+        parts = []
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    chunks = self.client.chat.completions.create(
+                        messages=[{"role": "user", "content": prompt}],
+                        model=model,
+                        stream=True,
+                        timeout=max(min(self.timeout, deadline - time.monotonic()), 0.1),
+                        **options,
+                    )
+                    for chunk in chunks:
+                        text = chunk_text(chunk)
+                        if text:
+                            parts.append(text)
+                            yield text
+                    break
+                except Exception as e:
+                    delay = retry_delay(e, attempt)
+                    if parts or not is_retryable(e) or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                        raise LLMError(str(e)) from e
+                    time.sleep(delay)
+        finally:
+            self._slots.release()
+
+        response = "".join(parts)
+        if use_cache and (validate is None or validate(response)):
+            self.cache.set(cache_model, prompt, response)
+
+    async def stream_async(self, prompt: str, model: str = DEFAULT_MODEL, use_cache: bool = True,
+                           validate: Optional[Callable[[str], bool]] = None, **options) -> AsyncIterator[str]:
+        """Stream the completion of a single-message prompt without blocking the event loop"""
+        cache_model = self._cache_model(model, options)
+        if use_cache:
+            cached = await asyncio.to_thread(self.cache.get, cache_model, prompt)
+            if cached is not None:
+                yield cached
+                return
+
+        client = self.async_client
+        deadline = time.monotonic() + self.deadline
+        if not await self._slots.acquire_async(timeout=self.deadline):
+            raise LLMError("Timed out waiting for an LLM slot")
+        parts = []
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    chunks = await client.chat.completions.create(
+                        messages=[{"role": "user", "content": prompt}],
+                        model=model,
+                        stream=True,
+                        timeout=max(min(self.timeout, deadline - time.monotonic()), 0.1),
+                        **options,
+                    )
+                    async for chunk in chunks:
+                        text = chunk_text(chunk)
+                        if text:
+                            parts.append(text)
+                            yield text
+                    break
+                except Exception as e:
+                    delay = retry_delay(e, attempt)
+                    if parts or not is_retryable(e) or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                        raise LLMError(str(e)) from e
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+
+        response = "".join(parts)
+        if use_cache and (validate is None or validate(response)):
+            await asyncio.to_thread(self.cache.set, cache_model, prompt, response)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Get the process-wide LLM gateway"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+def set_llm_gateway(gateway: LLMGateway):
+    """Replace the process-wide gateway (e.g. with one pointed at a stub server)"""
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway
@@ -0,0 +1,234 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import pandas as pd
+import yfinance as yf
+
+from price_store import get_price_store, read_technicals_csv
+
+PERIOD_OFFSETS = {
+    'd': lambda n: pd.DateOffset(days=n),
+    'wk': lambda n: pd.DateOffset(weeks=n),
+    'mo': lambda n: pd.DateOffset(months=n),
+    'y': lambda n: pd.DateOffset(years=n),
+}
+
+
+def period_start(period: str, end: pd.Timestamp) -> Optional[pd.Timestamp]:
+    """Convert a yfinance period string (e.g. "1y", "6mo") into a start date"""
+    if period in (None, 'max'):
+        return None
+    if period == 'ytd':
+        return end.normalize().replace(month=1, day=1)
+    for suffix, offset in PERIOD_OFFSETS.items():
+        if period.endswith(suffix) and period[:-len(suffix)].isdigit():
+            return end - offset(int(period[:-len(suffix)]))
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def _localize(date, tz) -> pd.Timestamp:
+    """Interpret a date bound in the timezone of the index it is compared with"""
+    date = pd.Timestamp(date)
+    return date.tz_localize(tz) if date.tzinfo is None and tz is not None else date
+
+
+def trim_to_period(hist: pd.DataFrame, period: str, start=None, end=None) -> pd.DataFrame:
+    """Trim a daily history frame the way yfinance would for period/start/end"""
+    if hist.empty:
+        return hist
+    if start is not None:
+        hist = hist[hist.index >= _localize(start, hist.index.tz)]
+    if end is not None:
+        hist = hist[hist.index < _localize(end, hist.index.tz)]
+    if start is None and end is None and not hist.empty:
+        first = period_start(period, hist.index[-1])
+        if first is not None:
+            hist = hist[hist.index > first]
+    return hist
+
+
+class MarketDataBackend(ABC):
+    """Source of daily price histories and company info for the provider"""
+
+    @abstractmethod
+    def fetch_histories(self, tickers: List[str], period: str = "1y", start=None, end=None) -> Dict[str, pd.DataFrame]:
+        """Fetch daily bars for several tickers in one call"""
+
+    def fetch_info(self, ticker: str) -> Dict:
+        """Fetch company info for a ticker"""
+        return {}
+
+    def fetch_sustainability(self, ticker: str) -> pd.DataFrame:
+        """Fetch the ESG risk ratings of a ticker (empty if it has none)"""
+        return pd.DataFrame()
+
+
+class YFinanceBackend(MarketDataBackend):
+    """Production backend batching every ticker into one yf.download call"""
+
+    def fetch_histories(self, tickers: List[str], period: str = "1y", start=None, end=None) -> Dict[str, pd.DataFrame]:
+        if start is not None or end is not None:
+            period = None
+        data = yf.download(
+            tickers, period=period, start=start, end=end, interval="1d",
+            group_by='ticker', auto_adjust=True, actions=True,
+            threads=True, progress=False,
+        )
+        histories = {}
+        for ticker in tickers:
+            if data is None or data.empty:
+                histories[ticker] = pd.DataFrame()
+            elif isinstance(data.columns, pd.MultiIndex):
+                if ticker in data.columns.get_level_values(0):
+                    histories[ticker] = data[ticker].dropna(how='all')
+                else:
+                    histories[ticker] = pd.DataFrame()
+            else:
+                histories[ticker] = data.dropna(how='all')
+        return histories
+
+    def fetch_info(self, ticker: str) -> Dict:
+        return yf.Ticker(ticker).info
+
+    def fetch_sustainability(self, ticker: str) -> pd.DataFrame:
+        sustainability = yf.Ticker(ticker).sustainability
+        return sustainability if isinstance(sustainability, pd.DataFrame) else pd.DataFrame()
+
+
+class FixtureBackend(MarketDataBackend):
+    """
+    Offline backend replaying ``<path>/<ticker>/technicals.csv`` fixtures.
+
+    ``period`` is applied relative to each fixture's last bar, so recorded
+    data replays the same way regardless of today's date.
+    """
+
+    def __init__(self, path: str = "data"):
+        self.path = path
+
+    def _read(self, ticker: str) -> pd.DataFrame:
+        csv_path = os.path.join(self.path, ticker, "technicals.csv")
+        if not os.path.exists(csv_path):
+            return pd.DataFrame()
+        return read_technicals_csv(csv_path)
+
+    def fetch_histories(self, tickers: List[str], period: str = "1y", start=None, end=None) -> Dict[str, pd.DataFrame]:
+        return {ticker: trim_to_period(self._read(ticker), period, start, end) for ticker in tickers}
+
+    def fetch_info(self, ticker: str) -> Dict:
+        csv_path = os.path.join(self.path, ticker, "info.csv")
+        if not os.path.exists(csv_path):
+            return {}
+        return pd.read_csv(csv_path, index_col=0)['Value'].to_dict()
+
+    def fetch_sustainability(self, ticker: str) -> pd.DataFrame:
+        csv_path = os.path.join(self.path, ticker, "sustainability.csv")
+        if not os.path.exists(csv_path):
+            return pd.DataFrame()
+        return pd.read_csv(csv_path, index_col=0)
+
+
+class PriceStoreBackend(MarketDataBackend):
+    """Offline backend replaying bars already held in the shared price store"""
+
+    def __init__(self, store=None):
+        self.store = store or get_price_store()
+
+    def fetch_histories(self, tickers: List[str], period: str = "1y", start=None, end=None) -> Dict[str, pd.DataFrame]:
+        histories = {}
+        for ticker in tickers:
+            hist = self.store.load_frame(ticker)
+            histories[ticker] = pd.DataFrame() if hist is None else trim_to_period(hist, period, start, end)
+        return histories
+
+
+class MarketDataProvider:
+    """Bulk market-data access shared by every analysis module"""
+
+    def __init__(self, backend: MarketDataBackend):
+        self.backend = backend
+
+    def get_histories(self, tickers: List[str], period: str = "1y", start=None, end=None) -> Dict[str, pd.DataFrame]:
+        """
+        Fetch daily histories for several tickers in one batched backend call.
+
+        Args:
+            tickers (list): Ticker symbols; duplicates are fetched once.
+            period (str): yfinance period string (e.g., "1y").
+            start, end: Optional date bounds overriding ``period``.
+
+        Returns:
+            dict: Ticker -> history DataFrame (empty if no data was found).
+        """
+        unique = list(dict.fromkeys(tickers))
+        if not unique:
+            return {}
+        return self.backend.fetch_histories(unique, period=period, start=start, end=end)
+
+    def get_history(self, ticker: str, period: str = "1y", start=None, end=None) -> pd.DataFrame:
+        """Fetch the daily history of a single ticker"""
+        return self.get_histories([ticker], period=period, start=start, end=end)[ticker]
+
+    def get_history_frame(self, tickers: List[str], period: str = "1y") -> pd.DataFrame:
+        """Fetch histories as one date-aligned frame with (ticker, field) columns"""
+        histories = {ticker: hist for ticker, hist in self.get_histories(tickers, period).items() if not hist.empty}
+        if not histories:
+            return pd.DataFrame()
+        return pd.concat(
+            {ticker: normalize_dates(hist) for ticker, hist in histories.items()},
+            axis=1,
+        ).sort_index()
+
+    def get_close_matrix(self, tickers: List[str], period: str = "1y") -> pd.DataFrame:
+        """Fetch date-aligned closing prices as a dates x tickers frame"""
+        frame = self.get_history_frame(tickers, period)
+        if frame.empty:
+            return frame
+        return frame.xs('Close', axis=1, level=1)
+
+    def get_info(self, ticker: str) -> Dict:
+        """Fetch company info for a ticker"""
+        return self.backend.fetch_info(ticker)
+
+    def get_sustainability(self, ticker: str) -> pd.DataFrame:
+        """Fetch the ESG risk ratings of a ticker"""
+        return self.backend.fetch_sustainability(ticker)
+
+
+def normalize_dates(hist: pd.DataFrame) -> pd.DataFrame:
+    """Key daily bars by calendar date so tickers from different exchanges align"""
+    index = pd.DatetimeIndex(hist.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return hist.set_axis(index.normalize().rename('Date'))
+
+
+BACKENDS = {
+    'yfinance': YFinanceBackend,
+    'fixture': lambda: FixtureBackend(os.environ.get("MARKET_DATA_FIXTURE_PATH", "data")),
+    'store': PriceStoreBackend,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_market_data() -> MarketDataProvider:
+    """Get the process-wide provider, choosing the backend from MARKET_DATA_BACKEND"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            backend_name = os.environ.get("MARKET_DATA_BACKEND", "yfinance")
+            if backend_name not in BACKENDS:
+                raise ValueError(f"Unknown market data backend: {backend_name}")
+            _provider = MarketDataProvider(BACKENDS[backend_name]())
+        return _provider
+
+
+def set_market_data(provider: MarketDataProvider):
+    """Replace the process-wide provider (e.g. with a fixture backend in tests)"""
+    global _provider
+    with _provider_lock:
+        _provider = provider
@@ -1,9 +1,176 @@
-from pulp import LpMaximize,LpMinimize,LpProblem,LpVariable,lpSum
+import hashlib
+import math
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-def optimize_esg_projects(projects, ESG_scores, costs, risks, budget, risk_tolerance, min_diversification):
+import numpy as np
+import osqp
+from scipy import sparse
+from pulp import (LpMinimize, LpProblem, LpVariable, LpAffineExpression, LpConstraint,
+                  LpConstraintLE, LpConstraintGE, PULP_CBC_CMD, LpStatus)
+
+OPTIMIZER_CACHE_SIZE = 8  # Built models kept for re-solves with new budgets or risk tolerances
+PORTFOLIO_OBJECTIVES = ("min_variance", "max_sharpe")
+OSQP_SETTINGS = {'verbose': False, 'eps_abs': 1e-5, 'eps_rel': 1e-5, 'polish': False, 'max_iter': 10000}
+SHARPE_SEARCH_RANGE = (-3.0, 3.0)  # log10 of the risk tolerances searched, relative to the problem's scale
+SHARPE_SEARCH_TOLERANCE = 0.05
+# Largest universe for max_sharpe: its frontier search takes tens of milliseconds at 100 assets but seconds at 500
+MAX_SHARPE_ASSETS = int(os.environ.get("OPTIMIZER_MAX_SHARPE_ASSETS", 100))
+
+
+class ESGProjectOptimizer:
+    """
+    ESG project selection model built once and re-solved for new budgets and risk tolerances.
+
+    The model is built from coefficient arrays: each constraint is one
+    affine expression created from (variable, coefficient) pairs, instead of
+    summing Python expressions term by term. Changing the budget or risk
+    tolerance only changes two right-hand sides, and the previous solution
+    is passed to CBC as a warm start.
+    """
+
+    def __init__(self, projects, ESG_scores, costs, risks, min_diversification):
+        """
+        Parameters:
+            projects (list): List of project names.
+            ESG_scores (dict or array): ESG impact scores, by project name or in project order.
+            costs (dict or array): Costs for each project.
+            risks (dict or array): Risks for each project.
+            min_diversification (int): Minimum number of projects to invest in.
+        """
+        self.projects = list(projects)
+        self.ESG_scores = self._as_array(ESG_scores)
+        self.costs = self._as_array(costs)
+        self.risks = self._as_array(risks)
+        self.min_diversification = min_diversification
+        self.budget = None
+        self.risk_tolerance = None
+        self.solved = False
+        self._lock = threading.Lock()
+        self._build()
+
+    def _as_array(self, values) -> np.ndarray:
+        if isinstance(values, dict):
+            return np.array([values[project] for project in self.projects], dtype=float)
+        return np.asarray(values, dtype=float)
+
+    def _build(self):
+        n = len(self.projects)
+        self.problem = LpProblem("Maximize_ESG_Impact", LpMinimize)
+
+        # Decision variables, named by position so any project name is valid
+        self.x = LpVariable.matrix("x", range(n), cat="Binary")  # Binary variables
+        self.y = LpVariable.matrix("y", range(n), lowBound=0, upBound=1)  # Fraction of budget
+
+        # Objective function: Minimize ESG Risk
+        self.problem.setObjective(LpAffineExpression(zip(self.y, self.ESG_scores.tolist()), name="Total_ESG_Impact"))
+
+        # Constraints; the budget and risk right-hand sides are set before each solve
+        self.problem += LpConstraint(LpAffineExpression(zip(self.y, self.costs.tolist())),
+                                     LpConstraintLE, "Budget_Constraint", 0)
+        self.problem += LpConstraint(LpAffineExpression(zip(self.y, self.risks.tolist())),
+                                     LpConstraintLE, "Risk_Constraint", 0)
+        self.problem += LpConstraint(LpAffineExpression(zip(self.x, np.ones(n).tolist())),
+                                     LpConstraintGE, "Diversification_Constraint", self.min_diversification)
+
+        # Binary-continuous relationship: cost * y <= cost * x
+        for i, (x, y, cost) in enumerate(zip(self.x, self.y, self.costs.tolist())):
+            self.problem += LpConstraint(LpAffineExpression([(y, cost), (x, -cost)]),
+                                         LpConstraintLE, f"Binary_Relationship_{i}", 0)
+
+    def solve(self, budget, risk_tolerance, time_limit=None, gap_rel=None, warm_start=True, threads=None):
+        """
+        Solve for a budget and risk tolerance.
+
+        Parameters:
+            budget (float): Total budget available.
+            risk_tolerance (float): Maximum allowable risk.
+            time_limit (float): Seconds CBC may search before returning its best solution.
+            gap_rel (float): Relative MIP gap at which CBC may stop (e.g., 0.01).
+            warm_start (bool): Start from the previous solution, if there is one.
+            threads (int): CBC threads.
+
+        Returns:
+            dict: Results containing the status, total ESG impact, details of each
+            project, and the solver status name and wall-clock time.
+        """
+        with self._lock:
+            self.problem.constraints["Budget_Constraint"].changeRHS(budget)
+            self.problem.constraints["Risk_Constraint"].changeRHS(risk_tolerance)
+            self.budget, self.risk_tolerance = budget, risk_tolerance
+
+            solver = PULP_CBC_CMD(msg=False, timeLimit=time_limit, gapRel=gap_rel,
+                                  warmStart=warm_start and self.solved, threads=threads)
+            started = time.perf_counter()
+            self.problem.solve(solver)
+            elapsed = time.perf_counter() - started
+            self.solved = True
+            return self._results(budget, elapsed)
+
+    def _results(self, budget, elapsed):
+        selected = np.array([x.varValue or 0 for x in self.x]).round().astype(int)
+        fractions = np.array([y.varValue or 0 for y in self.y])
+        budget_fractions = fractions * self.costs / budget if budget else np.zeros(len(fractions))
+
+        results = {
+            "status": self.problem.status,
+            "solver_status": LpStatus[self.problem.status],
+            "solve_time": elapsed,
+            "total_esg_impact": self.problem.objective.value(),
+            "projects": []
+        }
+        for project, project_selected, budget_fraction in zip(self.projects, selected.tolist(), budget_fractions.tolist()):
+            results["projects"].append({
+                "project": project,
+                "selected": project_selected,
+                "budget_fraction": budget_fraction
+            })
+        return results
+
+
+_optimizers = OrderedDict()  # Model structure fingerprint -> ESGProjectOptimizer
+_optimizers_lock = threading.Lock()
+
+
+def _model_key(projects, ESG_scores, costs, risks, min_diversification) -> str:
+    """Fingerprint of everything but the budget and risk tolerance"""
+    digest = hashlib.sha256()
+    digest.update("\0".join(map(str, projects)).encode())
+    for values in (ESG_scores, costs, risks):
+        if isinstance(values, dict):
+            values = [values[project] for project in projects]
+        digest.update(np.asarray(values, dtype=float).tobytes())
+    digest.update(str(min_diversification).encode())
+    return digest.hexdigest()
+
+
+def get_esg_optimizer(projects, ESG_scores, costs, risks, min_diversification) -> ESGProjectOptimizer:
+    """Get the built model for a project set, building it on first use"""
+    key = _model_key(projects, ESG_scores, costs, risks, min_diversification)
+    with _optimizers_lock:
+        if key in _optimizers:
+            _optimizers.move_to_end(key)
+            return _optimizers[key]
+    optimizer = ESGProjectOptimizer(projects, ESG_scores, costs, risks, min_diversification)
+    with _optimizers_lock:
+        optimizer = _optimizers.setdefault(key, optimizer)
+        while len(_optimizers) > OPTIMIZER_CACHE_SIZE:
+            _optimizers.popitem(last=False)
+    return optimizer
+
+
+def optimize_esg_projects(projects, ESG_scores, costs, risks, budget, risk_tolerance, min_diversification,
+                          time_limit=None, gap_rel=None, warm_start=True):
     """
     Optimizes ESG projects selection to maximize impact while adhering to budget and risk constraints.
 
+    The model of a project set is built once; calls that only change the
+    budget or risk tolerance re-solve it, warm-started from the last solution.
+
     Parameters:
         projects (list): List of project names.
         ESG_scores (dict): ESG impact scores for each project.
@@ -12,49 +179,273 @@ def optimize_esg_projects(projects, ESG_scores, costs, risks, budget, risk_toler
         budget (float): Total budget available.
         risk_tolerance (float): Maximum allowable risk.
         min_diversification (int): Minimum number of projects to invest in.
+        time_limit (float): Seconds the solver may search before returning its best solution.
+        gap_rel (float): Relative optimality gap at which the solver may stop.
+        warm_start (bool): Start from the previous solution of the same project set.
 
     Returns:
         dict: Results containing the status, total ESG impact, and details of each project.
     """
-    # Create the problem
-    problem = LpProblem("Maximize_ESG_Impact", LpMinimize)
+    optimizer = get_esg_optimizer(projects, ESG_scores, costs, risks, min_diversification)
+    return optimizer.solve(budget, risk_tolerance, time_limit=time_limit, gap_rel=gap_rel, warm_start=warm_start)
 
-    # Decision variables
-    x = {project: LpVariable(f"x_{project}", cat="Binary") for project in projects}  # Binary variables
-    y = {project: LpVariable(f"y_{project}", lowBound=0, upBound=1) for project in projects}  # Fraction of budget
 
-    # Objective function: Minimize ESG Risk
-    problem += lpSum(ESG_scores[project] * y[project] for project in projects), "Total_ESG_Impact"
+_worker_optimizer = None  # Model of the sweep being run by this pool process
 
-    # Constraints
-    problem += lpSum(costs[project] * y[project] for project in projects) <= budget, "Budget_Constraint"
-    problem += lpSum(risks[project] * y[project] for project in projects) <= risk_tolerance, "Risk_Constraint"
-    problem += lpSum(x[project] for project in projects) >= min_diversification, "Diversification_Constraint"
 
-    # Binary-continuous relationship
-    for project in projects:
-        problem += y[project] * costs[project] <= x[project] * costs[project], f"Binary_Relationship_{project}"
+def _init_sweep_worker(projects, ESG_scores, costs, risks, min_diversification):
+    """Build the sweep's model once per pool process"""
+    global _worker_optimizer
+    _worker_optimizer = ESGProjectOptimizer(projects, ESG_scores, costs, risks, min_diversification)
 
-    # Solve the problem
-    problem.solve()
 
-    # Prepare results
-    results = {
-        "status": problem.status,
-        "total_esg_impact": problem.objective.value(),
-        "projects": []
+def _solve_sweep_point(point, time_limit, gap_rel, include_projects):
+    budget, risk_tolerance = point
+    try:
+        result = _worker_optimizer.solve(budget, risk_tolerance, time_limit=time_limit, gap_rel=gap_rel, threads=1)
+    except Exception as e:
+        return {"budget": budget, "risk_tolerance": risk_tolerance, "status": None,
+                "solver_status": "Error", "error": str(e), "solve_time": None, "worker": os.getpid()}
+    selected = [project["project"] for project in result["projects"] if project["selected"]]
+    point_result = {
+        "budget": budget,
+        "risk_tolerance": risk_tolerance,
+        "status": result["status"],
+        "solver_status": result["solver_status"],
+        "total_esg_impact": result["total_esg_impact"],
+        "selected_projects": selected,
+        "solve_time": result["solve_time"],
+        "worker": os.getpid(),
     }
+    if include_projects:
+        point_result["projects"] = result["projects"]
+    return point_result
+
+
+def sweep_esg_projects(projects, ESG_scores, costs, risks, budgets, risk_tolerances, min_diversification,
+                       max_workers=None, time_limit=None, gap_rel=None, include_projects=False):
+    """
+    Solves the ESG project selection over a grid of budgets and risk tolerances (an efficient frontier).
+
+    Points are solved in a process pool. Each process builds the model once
+    and re-solves it for a contiguous block of the grid, so neighbouring
+    points warm-start from each other.
 
-    for project in projects:
-        selected = int(x[project].value())
-        budget_fraction = (y[project].value() * costs[project]) / budget if y[project].value() else 0
-        results["projects"].append({
-            "project": project,
-            "selected": selected,
-            "budget_fraction": budget_fraction
+    Parameters:
+        projects, ESG_scores, costs, risks, min_diversification: As for optimize_esg_projects.
+        budgets (list): Budgets to sweep.
+        risk_tolerances (list): Risk tolerances to sweep; every pair with a budget is solved.
+        max_workers (int): Pool processes (defaults to the CPU count).
+        time_limit (float): Seconds each point's solve may take.
+        gap_rel (float): Relative optimality gap at which each solve may stop.
+        include_projects (bool): Include the per-project details of every point.
+
+    Returns:
+        dict: Points (budget, risk tolerance, status, total ESG impact, selected
+        projects, solve time and worker pid, in grid order), workers used and
+        total wall-clock time.
+    """
+    points = [(budget, risk_tolerance) for budget in budgets for risk_tolerance in risk_tolerances]
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(points)))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker,
+                             initargs=(projects, ESG_scores, costs, risks, min_diversification)) as executor:
+        results = list(executor.map(
+            _solve_sweep_point, points,
+            repeat(time_limit), repeat(gap_rel), repeat(include_projects),
+            chunksize=math.ceil(len(points) / workers) if points else 1,
+        ))
+    return {
+        "points": results,
+        "workers": workers,
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+class PortfolioOptimizer:
+    """
+    Long-only mean-variance portfolio weights, solved as a quadratic program with OSQP.
+
+    Weights minimize variance, or maximize the Sharpe ratio, subject to a
+    minimum weighted ESG score, a maximum weighted risk score, a maximum
+    position size and per-sector caps. The constraint matrix does not depend
+    on the limits, so one OSQP workspace is set up (and its KKT system
+    factorized) once: new limits only update the bounds, and the maximum
+    Sharpe portfolio is found by a search along the efficient frontier that
+    only updates the linear cost. Every solve is warm-started from the last.
+
+    That search solves a dozen QPs, so "max_sharpe" is only offered for up
+    to MAX_SHARPE_ASSETS assets; larger universes must use "min_variance".
+    """
+
+    def __init__(self, tickers, covariance, expected_returns, esg_scores=None, risk_scores=None, sectors=None):
+        """
+        Parameters:
+            tickers (list): Asset names.
+            covariance (array): Annualized covariance matrix of returns, in ticker order.
+            expected_returns (array): Annualized expected returns.
+            esg_scores (array): ESG score of each asset (0-100, higher is better; NaN if unknown).
+            risk_scores (array): Risk score of each asset (0-100, higher is riskier; NaN if unknown).
+            sectors (list): Sector of each asset, for sector caps.
+        """
+        self.tickers = list(tickers)
+        n = len(self.tickers)
+        self.covariance = np.asarray(covariance, dtype=float)
+        self.expected_returns = np.asarray(expected_returns, dtype=float)
+        # Assets without a score count as neutral, so they neither help nor break a limit
+        self.esg_scores = np.full(n, 50.0) if esg_scores is None else np.nan_to_num(np.asarray(esg_scores, dtype=float), nan=50.0)
+        self.risk_scores = np.full(n, 50.0) if risk_scores is None else np.nan_to_num(np.asarray(risk_scores, dtype=float), nan=50.0)
+        self.sectors = list(sectors) if sectors is not None else ['Other'] * n
+        self.sector_names = list(dict.fromkeys(self.sectors))
+        self.sector_index = np.array([self.sector_names.index(sector) for sector in self.sectors], dtype=int)
+
+        # Rows: sum(w) = 1, 0 <= w_i <= max_position, esg'w >= min_esg, risk'w <= max_risk, sector sums <= caps
+        rows = np.concatenate([np.zeros(n), 1 + np.arange(n), np.full(n, n + 1), np.full(n, n + 2), n + 3 + self.sector_index])
+        cols = np.tile(np.arange(n), 5)
+        data = np.concatenate([np.ones(n), np.ones(n), self.esg_scores, self.risk_scores, np.ones(n)])
+        self._A = sparse.csc_matrix((data, (rows, cols)), shape=(n + 3 + len(self.sector_names), n))
+        self._P = sparse.triu(sparse.csc_matrix(self.covariance), format='csc')
+        self._solver = None
+        self._lock = threading.Lock()
+
+    def _bounds(self, min_esg, max_position, sector_caps, max_risk):
+        n, s = len(self.tickers), len(self.sector_names)
+        if isinstance(sector_caps, dict):
+            caps = np.array([sector_caps.get(sector, np.inf) for sector in self.sector_names], dtype=float)
+        else:
+            caps = np.full(s, np.inf if sector_caps is None else sector_caps, dtype=float)
+        l = np.concatenate([[1.0], np.zeros(n), [-np.inf if min_esg is None else min_esg], [-np.inf], np.full(s, -np.inf)])
+        u = np.concatenate([[1.0], np.full(n, min(max_position, 1.0)), [np.inf], [np.inf if max_risk is None else max_risk], caps])
+        return l, u
+
+    def _solve_qp(self, q):
+        """Minimize w'Cw / 2 + q'w under the current bounds; returns (status, weights or None)"""
+        self._solver.update(q=q)
+        result = self._solver.solve()
+        if result.info.status != "solved" or result.x is None:
+            return result.info.status, None
+        weights = np.clip(result.x, 0, None)
+        return result.info.status, weights / weights.sum()
+
+    def _sharpe(self, weights, risk_free_rate):
+        volatility = math.sqrt(max(weights @ self.covariance @ weights, 0.0))
+        return (weights @ self.expected_returns - risk_free_rate) / volatility if volatility > 0 else -np.inf
+
+    def _max_sharpe(self, risk_free_rate):
+        """
+        Golden-section search over the risk tolerance t of min w'Cw / 2 - t (mu - rf)'w.
+
+        The Sharpe ratio is unimodal along the efficient frontier, and each
+        point only changes the linear cost, so the factorization is reused.
+        """
+        excess = self.expected_returns - risk_free_rate
+        # Tolerances around the one at which risk and excess return are of the same size
+        scale = np.trace(self.covariance) / len(self.tickers) / max(np.abs(excess).max(), 1e-12)
+        evaluated = {}
+
+        def evaluate(log_t):
+            if log_t not in evaluated:
+                status, weights = self._solve_qp(-(scale * 10 ** log_t) * excess)
+                sharpe = self._sharpe(weights, risk_free_rate) if weights is not None else -np.inf
+                evaluated[log_t] = (sharpe, status, weights)
+            return evaluated[log_t][0]
+
+        low, high = SHARPE_SEARCH_RANGE
+        ratio = (math.sqrt(5) - 1) / 2
+        a, b = high - ratio * (high - low), low + ratio * (high - low)
+        while high - low > SHARPE_SEARCH_TOLERANCE:
+            if evaluate(a) >= evaluate(b):
+                high, b = b, a
+                a = high - ratio * (high - low)
+            else:
+                low, a = a, b
+                b = low + ratio * (high - low)
+        _, status, weights = max(evaluated.values(), key=lambda point: point[0])
+        return status, weights
+
+    def solve(self, objective="min_variance", min_esg=None, max_position=1.0, sector_caps=None, max_risk=None,
+              risk_free_rate=0.0):
+        """
+        Find the optimal weights under the given limits.
+
+        Parameters:
+            objective (str): "min_variance" or "max_sharpe" (up to MAX_SHARPE_ASSETS assets).
+            min_esg (float): Minimum weighted ESG score.
+            max_position (float): Maximum weight of one asset.
+            sector_caps (float or dict): Maximum weight of any sector, or of each named sector.
+            max_risk (float): Maximum weighted risk score.
+            risk_free_rate (float): Annual risk-free rate for the Sharpe ratio.
+
+        Returns:
+            dict: Solver status, weights by ticker (empty unless solved), and the
+            expected return, volatility, Sharpe ratio, ESG and risk scores and
+            sector weights of the portfolio, and the solve time.
+        """
+        if objective not in PORTFOLIO_OBJECTIVES:
+            raise ValueError(f"Unknown objective: {objective}")
+        if objective == "max_sharpe" and len(self.tickers) > MAX_SHARPE_ASSETS:
+            raise ValueError(f"max_sharpe supports at most {MAX_SHARPE_ASSETS} assets, got {len(self.tickers)}")
+        l, u = self._bounds(min_esg, max_position, sector_caps, max_risk)
+
+        with self._lock:
+            started = time.perf_counter()
+            if self._solver is None:
+                self._solver = osqp.OSQP()
+                self._solver.setup(self._P, np.zeros(len(self.tickers)), self._A, l, u, **OSQP_SETTINGS)
+            else:
+                self._solver.update(l=l, u=u)
+            if objective == "max_sharpe":
+                status, weights = self._max_sharpe(risk_free_rate)
+            else:
+                status, weights = self._solve_qp(np.zeros(len(self.tickers)))
+            elapsed = time.perf_counter() - started
+
+        results = {"status": status, "weights": {}, "solve_time": elapsed}
+        if weights is None:
+            return results
+        expected_return = float(weights @ self.expected_returns)
+        volatility = float(np.sqrt(max(weights @ self.covariance @ weights, 0.0)))
+        sector_weights = np.bincount(self.sector_index, weights=weights, minlength=len(self.sector_names))
+        results.update({
+            "weights": {ticker: round(float(weight), 6) for ticker, weight in zip(self.tickers, weights)},
+            "expected_return": expected_return,
+            "volatility": volatility,
+            "sharpe_ratio": (expected_return - risk_free_rate) / volatility if volatility > 0 else None,
+            "esg_score": float(weights @ self.esg_scores),
+            "risk_score": float(weights @ self.risk_scores),
+            "sector_weights": {sector: round(float(weight), 6) for sector, weight in zip(self.sector_names, sector_weights)},
         })
+        return results
+
+
+_portfolio_optimizers = OrderedDict()  # Model data fingerprint -> PortfolioOptimizer
+
+
+def _portfolio_key(tickers, covariance, expected_returns, esg_scores, risk_scores, sectors) -> str:
+    """Fingerprint of the model data; limits and objectives are chosen per solve"""
+    digest = hashlib.sha256()
+    for names in (tickers, sectors or ()):
+        digest.update("\0".join(map(str, names)).encode() + b"\1")
+    for values in (covariance, expected_returns, esg_scores, risk_scores):
+        digest.update(b"\1" if values is None else np.asarray(values, dtype=float).tobytes())
+    return digest.hexdigest()
+
 
-    return results
+def get_portfolio_optimizer(tickers, covariance, expected_returns, esg_scores=None, risk_scores=None,
+                            sectors=None) -> PortfolioOptimizer:
+    """Get the optimizer for a ticker set and its data, building it (and its OSQP workspace) on first use"""
+    key = _portfolio_key(tickers, covariance, expected_returns, esg_scores, risk_scores, sectors)
+    with _optimizers_lock:
+        if key in _portfolio_optimizers:
+            _portfolio_optimizers.move_to_end(key)
+            return _portfolio_optimizers[key]
+    optimizer = PortfolioOptimizer(tickers, covariance, expected_returns, esg_scores, risk_scores, sectors)
+    with _optimizers_lock:
+        optimizer = _portfolio_optimizers.setdefault(key, optimizer)
+        while len(_portfolio_optimizers) > OPTIMIZER_CACHE_SIZE:
+            _portfolio_optimizers.popitem(last=False)
+    return optimizer
 
 
 # Example Usage
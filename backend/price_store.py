@@ -0,0 +1,415 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from filelock import FileLock
+
+DEFAULT_STORE_PATH = os.environ.get("PRICE_STORE_PATH", "data/prices")
+RESERVE_ROWS = int(os.environ.get("PRICE_STORE_RESERVE_ROWS", 32))  # Minimum spare rows after each segment
+COMPACT_RATIO = float(os.environ.get("PRICE_STORE_COMPACT_RATIO", 0.5))  # Dead share of rows that triggers compaction
+COMPACT_MIN_ROWS = 4096  # Dead rows below which compaction is not worth it
+
+# Column name -> (file name, dtype). Timestamps are int64 epoch seconds (UTC).
+COLUMNS = {
+    'timestamp': ('timestamp.i8', np.dtype('<i8')),
+    'Open': ('open.f8', np.dtype('<f8')),
+    'High': ('high.f8', np.dtype('<f8')),
+    'Low': ('low.f8', np.dtype('<f8')),
+    'Close': ('close.f8', np.dtype('<f8')),
+    'Volume': ('volume.i8', np.dtype('<i8')),
+    'Dividends': ('dividends.f8', np.dtype('<f8')),
+    'Stock Splits': ('stock_splits.f8', np.dtype('<f8')),
+}
+PRICE_COLUMNS = [name for name in COLUMNS if name != 'timestamp']
+
+
+def segment_capacity(length: int) -> int:
+    """Rows to reserve for a segment of ``length`` bars, leaving room for later bars"""
+    return length + max(RESERVE_ROWS, length // 4)
+
+
+class PriceStore:
+    """
+    Columnar on-disk store for daily OHLCV bars of every ticker.
+
+    Each column lives in one flat little-endian binary file shared by all
+    tickers, and ``index.json`` maps every ticker to its contiguous
+    ``[offset, offset + length)`` row range inside a segment of ``capacity``
+    rows. New bars (and the refetched last bar) are written in place into
+    the segment's spare rows and become visible when the index is saved;
+    a segment that runs out of room is copied to the end of the files with
+    more room. Once superseded segments make up most of the files, they are
+    compacted into a new generation of files, which the index switches to
+    in one rename.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_PATH):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, "index.json")
+        self._write_lock = FileLock(os.path.join(root, ".write.lock"))
+        self._lock = threading.Lock()
+        self._index = {'rows': 0, 'tickers': {}}
+        self._index_mtime = None
+        self._maps = {}
+        self._maps_key = None
+
+    # Index handling
+
+    def _load_index(self) -> Dict:
+        """Reload the index if another writer replaced it since our last read"""
+        try:
+            mtime = os.stat(self._index_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._index
+        if mtime != self._index_mtime:
+            with open(self._index_path) as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+        return self._index
+
+    def _save_index(self, index: Dict):
+        tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+        self._index = index
+        self._index_mtime = os.stat(self._index_path).st_mtime_ns
+
+    def _column_path(self, name: str, generation: int) -> str:
+        """Path of a column file; files of generation 0 keep their original names"""
+        file_name = COLUMNS[name][0]
+        return os.path.join(self.root, file_name if generation == 0 else f"g{generation}.{file_name}")
+
+    def _column_maps(self, index: Dict) -> Dict[str, np.ndarray]:
+        """Memory-map every column file of the index's generation up to its row count"""
+        rows, generation = index['rows'], index.get('generation', 0)
+        key = (rows, generation, self._index_mtime)
+        if key != self._maps_key:
+            self._maps = {
+                name: np.memmap(self._column_path(name, generation), dtype=dtype, mode='r', shape=(rows,))
+                if rows else np.empty(0, dtype=dtype)
+                for name, (_, dtype) in COLUMNS.items()
+            }
+            self._maps_key = key
+        return self._maps
+
+    def _segment(self, index: Dict, entry: Dict) -> Dict[str, np.ndarray]:
+        """Views of a ticker's stored bars under the given index"""
+        maps = self._column_maps(index)
+        start, stop = entry['offset'], entry['offset'] + entry['length']
+        return {name: column[start:stop] for name, column in maps.items()}
+
+    # Read API
+
+    def tickers(self) -> List[str]:
+        """List every ticker held in the store"""
+        with self._lock:
+            return sorted(self._load_index()['tickers'])
+
+    def has(self, ticker: str) -> bool:
+        """Check whether the store holds bars for a ticker"""
+        with self._lock:
+            return ticker in self._load_index()['tickers']
+
+    def metadata(self, ticker: str) -> Optional[Dict]:
+        """Get the index entry (offset, length, capacity, tz, updated_at, checked_at) for a ticker"""
+        with self._lock:
+            entry = self._load_index()['tickers'].get(ticker)
+            return dict(entry) if entry else None
+
+    def last_timestamp(self, ticker: str) -> Optional[int]:
+        """Get the epoch-seconds timestamp of the last stored bar for a ticker"""
+        bars = self.load(ticker)
+        if bars is None or len(bars['timestamp']) == 0:
+            return None
+        return int(bars['timestamp'][-1])
+
+    def load(self, ticker: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Load a ticker's bars as zero-copy read-only NumPy views.
+
+        Args:
+            ticker (str): The ticker symbol (e.g., "AAPL").
+
+        Returns:
+            dict: Column name -> 1-D array view, or None if the ticker is unknown.
+        """
+        with self._lock:
+            index = self._load_index()
+            entry = index['tickers'].get(ticker)
+            if entry is None:
+                return None
+            try:
+                return self._segment(index, entry)
+            except FileNotFoundError:
+                # A compaction removed the generation we had just read the index of
+                self._index_mtime = None
+                index = self._load_index()
+                entry = index['tickers'].get(ticker)
+                return self._segment(index, entry) if entry is not None else None
+
+    def load_frame(self, ticker: str) -> Optional[pd.DataFrame]:
+        """Load a ticker's bars as a DataFrame indexed by their original timezone"""
+        bars = self.load(ticker)
+        if bars is None:
+            return None
+        tz = self.metadata(ticker).get('tz')
+        index = pd.to_datetime(np.asarray(bars['timestamp']), unit='s', utc=True)
+        index = index.tz_convert(tz) if tz else index.tz_localize(None)
+        index.name = 'Date'
+        return pd.DataFrame({name: bars[name] for name in PRICE_COLUMNS}, index=index)
+
+    # Write API
+
+    def _append_rows(self, index: Dict, columns: Dict[str, np.ndarray], capacity: int) -> int:
+        """Append a segment of ``capacity`` rows starting with the given rows and return its offset"""
+        offset = index['rows']
+        for name, (_, dtype) in COLUMNS.items():
+            data = np.zeros(capacity, dtype=dtype)
+            data[:len(columns[name])] = columns[name]
+            with open(self._column_path(name, index.get('generation', 0)), "ab") as f:
+                # Truncate any rows left behind by a writer that died before committing
+                f.truncate(offset * dtype.itemsize)
+                f.write(data.tobytes())
+        return offset
+
+    def _write_rows(self, index: Dict, start: int, columns: Dict[str, np.ndarray]):
+        """Overwrite rows of the column files in place, from row ``start`` on"""
+        for name, (_, dtype) in COLUMNS.items():
+            with open(self._column_path(name, index.get('generation', 0)), "r+b") as f:
+                f.seek(start * dtype.itemsize)
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+    def _commit(self, index: Dict, ticker: str, entry: Dict, rows: int):
+        """Save the index with a ticker's new entry, compacting if superseded segments dominate"""
+        index = {**index, 'rows': rows, 'tickers': {**index['tickers'], ticker: entry}}
+        dead = rows - sum(entry.get('capacity', entry['length']) for entry in index['tickers'].values())
+        if dead >= COMPACT_MIN_ROWS and dead >= rows * COMPACT_RATIO:
+            self._compact(index)
+        else:
+            self._save_index(index)
+
+    def write(self, ticker: str, history: pd.DataFrame):
+        """
+        Replace all stored bars for a ticker.
+
+        Args:
+            ticker (str): The ticker symbol (e.g., "AAPL").
+            history (pd.DataFrame): Bars indexed by date, as returned by yfinance.
+        """
+        columns, tz = frame_to_columns(history)
+        with self._write_lock, self._lock:
+            self._index_mtime = None
+            index = self._load_index()
+            length = len(columns['timestamp'])
+            capacity = segment_capacity(length)
+            offset = self._append_rows(index, columns, capacity)
+            now = time.time()
+            self._commit(index, ticker, {
+                'offset': offset,
+                'length': length,
+                'capacity': capacity,
+                'tz': tz,
+                'updated_at': now,
+                'checked_at': now,
+            }, offset + capacity)
+
+    def append(self, ticker: str, history: pd.DataFrame) -> int:
+        """
+        Append new bars for a ticker, replacing any stored bars they overlap.
+
+        The last stored bar is usually refetched because it may have been
+        captured intraday, so bars from the first new timestamp onwards are
+        replaced. They are written in place into the ticker's segment while
+        it has room; only a full segment is copied to the end of the files.
+        A reader holding the previous index keeps its old length, though it
+        may see a replaced bar's new values.
+
+        Args:
+            ticker (str): The ticker symbol (e.g., "AAPL").
+            history (pd.DataFrame): New bars indexed by date.
+
+        Returns:
+            int: Number of bars added beyond the previously stored last bar.
+        """
+        if history.empty:
+            self.touch(ticker)
+            return 0
+        with self._write_lock, self._lock:
+            self._index_mtime = None
+            index = self._load_index()
+            entry = index['tickers'].get(ticker)
+            if entry is None:
+                columns, tz = frame_to_columns(history)
+                old_timestamps = np.empty(0, dtype=np.int64)
+            else:
+                tz = entry.get('tz')
+                columns, _ = frame_to_columns(history, tz)
+                old_timestamps = self._segment(index, entry)['timestamp']
+            keep = int(np.searchsorted(old_timestamps, columns['timestamp'][0], side='left'))
+            if len(old_timestamps):
+                added = int(np.count_nonzero(columns['timestamp'] > old_timestamps[-1]))
+            else:
+                added = len(columns['timestamp'])
+            length = keep + len(columns['timestamp'])
+            rows = index['rows']
+
+            if entry is not None and length <= entry.get('capacity', entry['length']):
+                # Room left in the segment: overwrite the refetched bars and fill spare rows
+                offset, capacity = entry['offset'], entry.get('capacity', entry['length'])
+                self._write_rows(index, offset + keep, columns)
+            elif entry is not None and entry['offset'] + entry.get('capacity', entry['length']) == rows:
+                # Last segment of the files: write in place and extend the files with spare rows
+                offset, capacity = entry['offset'], segment_capacity(length)
+                padded = {name: np.zeros(capacity - keep, dtype=dtype) for name, (_, dtype) in COLUMNS.items()}
+                for name in COLUMNS:
+                    padded[name][:len(columns[name])] = columns[name]
+                self._write_rows(index, offset + keep, padded)
+                rows = offset + capacity
+            else:
+                # Copy the kept bars and the new ones into a larger segment at the end
+                old = self._segment(index, entry) if entry is not None else None
+                merged = {name: np.concatenate([old[name][:keep], columns[name]]) if old else columns[name]
+                          for name in COLUMNS}
+                capacity = segment_capacity(length)
+                offset = self._append_rows(index, merged, capacity)
+                rows = offset + capacity
+
+            now = time.time()
+            self._commit(index, ticker, {
+                'offset': offset,
+                'length': length,
+                'capacity': capacity,
+                'tz': tz,
+                'updated_at': now,
+                'checked_at': now,
+            }, rows)
+            return added
+
+    def touch(self, ticker: str):
+        """Record that a ticker was checked for new bars without writing any"""
+        with self._write_lock, self._lock:
+            self._index_mtime = None
+            index = self._load_index()
+            if ticker not in index['tickers']:
+                return
+            entry = {**index['tickers'][ticker], 'checked_at': time.time()}
+            self._save_index({**index, 'tickers': {**index['tickers'], ticker: entry}})
+
+    def _compact(self, index: Dict):
+        """
+        Copy the live segments into a new generation of column files and switch the index to it.
+
+        The new files are complete before the index naming them replaces the
+        old one, so readers see either the old files and index or the new
+        ones. The old files are removed afterwards; memory maps of them stay
+        valid, and a reader that had not opened them yet reloads the index.
+        """
+        generation = index.get('generation', 0)
+        maps = self._column_maps(index)
+        tickers, parts = {}, {name: [] for name in COLUMNS}
+        offset = 0
+        for ticker, entry in index['tickers'].items():
+            capacity = segment_capacity(entry['length'])
+            start = entry['offset']
+            for name, (_, dtype) in COLUMNS.items():
+                data = np.zeros(capacity, dtype=dtype)
+                data[:entry['length']] = maps[name][start:start + entry['length']]
+                parts[name].append(data)
+            tickers[ticker] = {**entry, 'offset': offset, 'capacity': capacity}
+            offset += capacity
+
+        new_generation = generation + 1
+        for name, (_, dtype) in COLUMNS.items():
+            with open(self._column_path(name, new_generation), "wb") as f:
+                for data in parts[name]:
+                    f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self._maps, self._maps_key = {}, None
+        self._save_index({'rows': offset, 'generation': new_generation, 'tickers': tickers})
+        for name in COLUMNS:
+            try:
+                os.remove(self._column_path(name, generation))
+            except OSError:
+                pass
+
+    def compact(self):
+        """Rewrite the column files so they only hold live segments"""
+        with self._write_lock, self._lock:
+            self._index_mtime = None
+            self._compact(self._load_index())
+
+
+def frame_to_columns(history: pd.DataFrame, tz: Optional[str] = None):
+    """
+    Convert a yfinance history frame into store columns and its timezone name.
+
+    Naive indexes (e.g. from yf.download) are read as wall-clock times in
+    ``tz`` so they line up with bars previously stored for the ticker.
+    """
+    index = pd.DatetimeIndex(history.index)
+    if index.tz is None and tz:
+        index = index.tz_localize(tz)
+    tz = str(index.tz) if index.tz is not None else None
+    index = index.tz_convert('UTC') if index.tz is not None else index.tz_localize('UTC')
+    columns = {'timestamp': index.as_unit('s').asi8}
+    for name in PRICE_COLUMNS:
+        if name in history.columns:
+            values = history[name].to_numpy()
+            if COLUMNS[name][1].kind == 'i':
+                values = np.nan_to_num(values.astype(float)).round()
+            columns[name] = values
+        else:
+            columns[name] = np.zeros(len(history))
+    return columns, tz
+
+
+def frame_to_records(history: pd.DataFrame) -> List[Dict]:
+    """Convert a stored history frame into the JSON records the API serves"""
+    records = history.reset_index()
+    records['Date'] = records['Date'].astype(str)
+    return records.to_dict(orient='records')
+
+
+def read_technicals_csv(csv_path: str) -> pd.DataFrame:
+    """Read a legacy ``technicals.csv`` keyed by each bar's exchange-local date"""
+    history = pd.read_csv(csv_path)
+    # Offsets change with DST, so keep the wall-clock date rather than the instant
+    history.index = pd.DatetimeIndex(pd.to_datetime(history.pop('Date').str[:10]), name='Date')
+    return history
+
+
+def import_technicals_csv(store: PriceStore, ticker: str, csv_path: str):
+    """Import a legacy ``technicals.csv`` written by scrape_yfinance_data"""
+    store.write(ticker, read_technicals_csv(csv_path))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_price_store(root: str = DEFAULT_STORE_PATH) -> PriceStore:
+    """Get the process-wide PriceStore for a root directory"""
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = PriceStore(root)
+        return _stores[root]
+
+
+if __name__ == "__main__":
+    # Migrate legacy per-ticker CSV directories into the shared store
+    store = get_price_store()
+    for base in ["data", "data/finance"]:
+        if not os.path.isdir(base):
+            continue
+        for ticker in sorted(os.listdir(base)):
+            csv_path = os.path.join(base, ticker, "technicals.csv")
+            if os.path.exists(csv_path) and not store.has(ticker):
+                import_technicals_csv(store, ticker, csv_path)
+                print(f"Imported: {ticker}")
@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from scipy.signal import lfilter
 from typing import Union, Dict, Any
 
 def validate_price_data(prices: Union[pd.DataFrame, pd.Series]) -> pd.DataFrame:
@@ -46,21 +47,76 @@ def calculate_heiken_ashi(prices: pd.DataFrame) -> pd.DataFrame:
     """Calculate Heiken-Ashi candles from historical prices."""
     try:
         prices = validate_price_data(prices)
-        ha_prices = pd.DataFrame(index=prices.index)
-        
-        # Initialize the first Heiken-Ashi values
-        ha_prices['HA_Close'] = (prices['Open'] + prices['High'] + prices['Low'] + prices['Close']) / 4
-        ha_prices.loc[prices.index[0], 'HA_Open'] = (prices['Open'].iloc[0] + prices['Close'].iloc[0]) / 2
-        ha_prices['HA_High'] = prices[['High', 'Open', 'Close']].max(axis=1)
-        ha_prices['HA_Low'] = prices[['Low', 'Open', 'Close']].min(axis=1)
-
-        # Calculate subsequent Heiken-Ashi values
-        for i in range(1, len(prices)):
-            ha_prices.loc[prices.index[i], 'HA_Open'] = (ha_prices['HA_Open'].iloc[i-1] + ha_prices['HA_Close'].iloc[i-1]) / 2
-            ha_prices.loc[prices.index[i], 'HA_High'] = ha_prices.loc[prices.index[i:i+1], ['HA_Open', 'HA_Close']].max(axis=1).iloc[0]
-            ha_prices.loc[prices.index[i], 'HA_Low'] = ha_prices.loc[prices.index[i:i+1], ['HA_Open', 'HA_Close']].min(axis=1).iloc[0]
-
-        return ha_prices
+        ha_close, ha_open, ha_high, ha_low = heiken_ashi_arrays(
+            prices['Open'].to_numpy(dtype=float), prices['High'].to_numpy(dtype=float),
+            prices['Low'].to_numpy(dtype=float), prices['Close'].to_numpy(dtype=float)
+        )
+        return pd.DataFrame({
+            'HA_Close': ha_close,
+            'HA_Open': ha_open,
+            'HA_High': ha_high,
+            'HA_Low': ha_low
+        }, index=prices.index)
+    except Exception as e:
+        raise ValueError(f"Error calculating Heiken-Ashi candles: {str(e)}")
+
+def heiken_ashi_arrays(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray):
+    """
+    Calculate Heiken-Ashi candles for 1-D (bars) or 2-D (bars x tickers) price arrays.
+
+    HA_Open follows the recurrence HA_Open[i] = (HA_Open[i-1] + HA_Close[i-1]) / 2,
+    evaluated as a first-order linear filter along the bar axis, so every
+    ticker column is processed in one pass. Values are identical to the
+    row-by-row definition: the first candle's high/low include the raw
+    High/Low, later candles take the max/min of HA_Open and HA_Close.
+
+    Args:
+        open_, high, low, close (np.ndarray): Aligned prices without NaNs.
+
+    Returns:
+        tuple: (HA_Close, HA_Open, HA_High, HA_Low) arrays shaped like the input.
+    """
+    if np.isnan(open_).any() or np.isnan(high).any() or np.isnan(low).any() or np.isnan(close).any():
+        raise ValueError("Prices must not contain NaN values")
+    if len(close) < 1:
+        raise ValueError("Insufficient data points for analysis")
+
+    ha_close = (open_ + high + low + close) / 4
+    first_open = (open_[0] + close[0]) / 2
+
+    # HA_Open[1:] = lfilter([0.5], [1, -0.5], HA_Close[:-1]) seeded with HA_Open[0]
+    ha_open = np.empty_like(ha_close)
+    ha_open[0] = first_open
+    if len(close) > 1:
+        zi = (0.5 * np.asarray(first_open))[np.newaxis, ...]
+        ha_open[1:], _ = lfilter([0.5], [1.0, -0.5], ha_close[:-1], axis=0, zi=zi)
+
+    ha_high = np.maximum(ha_open, ha_close)
+    ha_low = np.minimum(ha_open, ha_close)
+    ha_high[0] = np.maximum(np.maximum(high[0], open_[0]), close[0])
+    ha_low[0] = np.minimum(np.minimum(low[0], open_[0]), close[0])
+    return ha_close, ha_open, ha_high, ha_low
+
+def calculate_heiken_ashi_batch(open_: pd.DataFrame, high: pd.DataFrame, low: pd.DataFrame,
+                                close: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Calculate Heiken-Ashi candles for many tickers at once.
+
+    Args:
+        open_, high, low, close (pd.DataFrame): Date-aligned dates x tickers price frames.
+
+    Returns:
+        dict: 'HA_Close', 'HA_Open', 'HA_High', 'HA_Low' -> dates x tickers frames.
+    """
+    try:
+        arrays = heiken_ashi_arrays(
+            open_.to_numpy(dtype=float), high.to_numpy(dtype=float),
+            low.to_numpy(dtype=float), close.to_numpy(dtype=float)
+        )
+        return {
+            name: pd.DataFrame(values, index=close.index, columns=close.columns)
+            for name, values in zip(['HA_Close', 'HA_Open', 'HA_High', 'HA_Low'], arrays)
+        }
     except Exception as e:
         raise ValueError(f"Error calculating Heiken-Ashi candles: {str(e)}")
 
@@ -74,36 +130,42 @@ def calculate_max_drawdown(prices: Union[pd.DataFrame, pd.Series]) -> float:
     """Calculate the maximum drawdown of the portfolio."""
     try:
         prices = validate_price_data(prices)
-        daily_returns = calculate_daily_returns(prices)
-        cumulative_returns = (1 + daily_returns).cumprod()
-        peak = cumulative_returns.expanding().max()
-        drawdown = (cumulative_returns - peak) / peak
-        return float(drawdown.min() * 100)  # Return as a percentage
+        return max_drawdown_from_returns(prices['Close'].pct_change().dropna())
     except Exception as e:
         raise ValueError(f"Error calculating maximum drawdown: {str(e)}")
 
+def max_drawdown_from_returns(daily_returns: pd.Series) -> float:
+    """Maximum drawdown, as a percentage, of a series of daily returns."""
+    cumulative_returns = (1 + daily_returns).cumprod()
+    peak = cumulative_returns.expanding().max()
+    drawdown = (cumulative_returns - peak) / peak
+    return float(drawdown.min() * 100)  # Return as a percentage
+
+def score_risk(volatility, max_dd):
+    """Combine annualized volatility and maximum drawdown (%) into a 0-100 risk score."""
+    # Calculate base risk score from volatility
+    vol_score = np.minimum(100, (volatility * 100) / 0.4)  # Normalize to 100, assuming 40% annual volatility as maximum
+    
+    # Adjust score based on maximum drawdown
+    dd_score = np.minimum(100, np.abs(max_dd))
+    
+    # Final risk score is weighted average
+    risk_score = 0.7 * vol_score + 0.3 * dd_score
+    return np.clip(risk_score, 0, 100)  # Ensure score is between 0 and 100
+
 def calculate_risk_score(prices: Union[pd.DataFrame, pd.Series], window: int = 30) -> Dict[str, Any]:
     """Calculate a comprehensive risk score based on multiple factors."""
     try:
         prices = validate_price_data(prices)
-        daily_returns = calculate_daily_returns(prices)
+        daily_returns = prices['Close'].pct_change().dropna()
         
         # Calculate various risk metrics
         volatility = daily_returns.std() * np.sqrt(252)  # Annualized volatility
-        max_dd = calculate_max_drawdown(prices)
+        max_dd = max_drawdown_from_returns(daily_returns)
         rolling_std = calculate_rolling_std_dev(daily_returns, window)
         
-        # Calculate base risk score from volatility
-        vol_score = min(100, (volatility * 100) / 0.4)  # Normalize to 100, assuming 40% annual volatility as maximum
-        
-        # Adjust score based on maximum drawdown
-        dd_score = min(100, abs(max_dd))
-        
-        # Final risk score is weighted average
-        risk_score = 0.7 * vol_score + 0.3 * dd_score
-        
         return {
-            'risk_score': min(100, max(0, risk_score)),  # Ensure score is between 0 and 100
+            'risk_score': float(score_risk(volatility, max_dd)),
             'volatility': volatility,
             'max_drawdown': max_dd,
             'rolling_std': rolling_std.iloc[-1] if len(rolling_std) > 0 else np.nan
@@ -111,6 +173,61 @@ def calculate_risk_score(prices: Union[pd.DataFrame, pd.Series], window: int = 3
     except Exception as e:
         raise ValueError(f"Error calculating risk score: {str(e)}")
 
+def validate_price_matrix(prices: pd.DataFrame) -> pd.DataFrame:
+    """Validate a dates x tickers matrix of closing prices."""
+    if not isinstance(prices, pd.DataFrame):
+        raise ValueError("Prices must be a dates x tickers DataFrame")
+    prices = prices.sort_index().apply(pd.to_numeric, errors='coerce').astype(float)
+    if len(prices) < 2:
+        raise ValueError("Insufficient data points for analysis")
+    return prices
+
+def calculate_risk_scores(prices: pd.DataFrame, window: int = 30) -> pd.DataFrame:
+    """
+    Calculate risk scores for many tickers in one vectorized pass.
+
+    Each column is scored as calculate_risk_score would score it on its
+    own: missing bars are skipped rather than breaking returns, and the
+    rolling std covers each ticker's last ``window`` returns. Tickers with
+    fewer than ``window`` returns get NaN metrics and no category.
+
+    Args:
+        prices (pd.DataFrame): Aligned closing prices, dates x tickers.
+        window (int): Rolling window for the standard deviation of returns.
+
+    Returns:
+        pd.DataFrame: Tickers x (risk_score, volatility, max_drawdown, rolling_std, category).
+    """
+    try:
+        prices = validate_price_matrix(prices)
+        observed = prices.notna()
+        
+        # Returns against each ticker's previous available close, only on bars it has
+        daily_returns = (prices.ffill() / prices.ffill().shift(1) - 1).where(observed)
+        
+        # Calculate various risk metrics
+        volatility = daily_returns.std() * np.sqrt(252)  # Annualized volatility
+        cumulative_returns = (1 + daily_returns).cumprod()
+        peak = cumulative_returns.cummax()
+        max_dd = ((cumulative_returns - peak) / peak).min() * 100
+        
+        # Standard deviation of each ticker's last `window` returns
+        has_return = daily_returns.notna()
+        from_end = has_return[::-1].cumsum()[::-1]
+        rolling_std = daily_returns.where(has_return & (from_end <= window)).std()
+        
+        scores = pd.DataFrame({
+            'risk_score': score_risk(volatility, max_dd),
+            'volatility': volatility,
+            'max_drawdown': max_dd,
+            'rolling_std': rolling_std,
+        })
+        scores[has_return.sum() < window] = np.nan
+        scores['category'] = [None if np.isnan(score) else categorize_risk(score) for score in scores['risk_score']]
+        return scores
+    except Exception as e:
+        raise ValueError(f"Error calculating risk scores: {str(e)}")
+
 def categorize_risk(risk_score: float) -> str:
     """Categorize the risk score into Low, Medium, or High."""
     if risk_score < 33:
@@ -0,0 +1,284 @@
+import json
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from price_store import get_price_store
+from risk_analysis import score_risk, categorize_risk
+
+DEFAULT_STATE_PATH = os.environ.get("RISK_STATE_PATH", "data/risk_state")
+RISK_WINDOW = 30
+
+
+class RiskState:
+    """
+    Incrementally updated risk metrics of one ticker.
+
+    Each new close updates, in O(1): the running mean/variance of daily
+    returns (Welford), the running peak of cumulative returns and the
+    deepest drawdown from it, and a ring buffer of the last ``window``
+    returns with its own mean/variance. Metrics equal those of
+    risk_analysis.calculate_risk_score over the same closes.
+
+    The state before the latest bar is kept, so a revised latest bar (e.g.
+    captured intraday, then final) replaces it instead of being added. Only
+    its scalar fields and the ring slot the bar overwrote are kept, so an
+    update stays O(1); the ring itself is copied only by to_dict.
+    """
+
+    def __init__(self, window: int = RISK_WINDOW):
+        self.window = window
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.last_close = None
+        self.count = 0  # Number of returns
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cumulative = 1.0
+        self.peak = None
+        self.max_drawdown = 0.0
+        self.ring = []  # Last `window` returns, oldest at ring_head once full
+        self.ring_head = 0
+        self.ring_mean = 0.0
+        self.ring_m2 = 0.0
+        self.previous = None  # Fields before the latest bar (see _fields)
+
+    def update(self, timestamp: int, close: float) -> bool:
+        """
+        Add a bar, or replace the latest bar if it has the same timestamp.
+
+        Returns:
+            bool: False if the bar was ignored (older than the latest, or no valid close).
+        """
+        if close is None or not math.isfinite(close):
+            return False
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            return False
+        if timestamp == self.last_timestamp:
+            if self.previous is None:
+                return False
+            self._restore(self.previous)
+        else:
+            self.previous = self._fields()
+        self._apply(timestamp, close)
+        return True
+
+    def _apply(self, timestamp: int, close: float):
+        if self.last_close is None:
+            self.first_timestamp = timestamp
+        else:
+            daily_return = close / self.last_close - 1
+
+            # Welford update of the mean and variance of all returns
+            self.count += 1
+            delta = daily_return - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (daily_return - self.mean)
+
+            # Drawdown of cumulative returns from their running peak
+            self.cumulative *= 1 + daily_return
+            self.peak = self.cumulative if self.peak is None else max(self.peak, self.cumulative)
+            self.max_drawdown = min(self.max_drawdown, (self.cumulative - self.peak) / self.peak)
+
+            self._push_window(daily_return)
+        self.last_timestamp = timestamp
+        self.last_close = close
+
+    def _push_window(self, value: float):
+        if len(self.ring) < self.window:
+            self.ring.append(value)
+            delta = value - self.ring_mean
+            self.ring_mean += delta / len(self.ring)
+            self.ring_m2 += delta * (value - self.ring_mean)
+            return
+
+        oldest = self.ring[self.ring_head]
+        self.ring[self.ring_head] = value
+        self.ring_head = (self.ring_head + 1) % self.window
+        if self.ring_head == 0:
+            # Recompute exactly once per lap so rounding errors never accumulate
+            values = np.asarray(self.ring)
+            self.ring_mean = float(values.mean())
+            self.ring_m2 = float(((values - self.ring_mean) ** 2).sum())
+        else:
+            mean = self.ring_mean + (value - oldest) / self.window
+            self.ring_m2 += (value - oldest) * (value - mean + oldest - self.ring_mean)
+            self.ring_mean = mean
+
+    def metrics(self) -> Dict[str, Any]:
+        """Risk score, its components and category, as get_risk reports them"""
+        if self.count < max(self.window, 1):
+            raise ValueError(f"Insufficient data points for {self.window}-day window")
+        volatility = math.sqrt(self.m2 / (self.count - 1)) * math.sqrt(252) if self.count > 1 else float('nan')
+        rolling_std = math.sqrt(max(self.ring_m2, 0.0) / (len(self.ring) - 1)) if len(self.ring) > 1 else float('nan')
+        max_dd = self.max_drawdown * 100
+        risk_score = float(score_risk(volatility, max_dd))
+        return {
+            'risk_score': risk_score,
+            'volatility': volatility,
+            'max_drawdown': max_dd,
+            'rolling_std': rolling_std,
+            'category': categorize_risk(risk_score),
+        }
+
+    def _fields(self) -> Dict[str, Any]:
+        """Scalar fields, plus what the next return will overwrite in the ring"""
+        fields = {name: value for name, value in self.__dict__.items() if name not in ('ring', 'previous')}
+        fields['ring_length'] = len(self.ring)
+        fields['ring_oldest'] = self.ring[self.ring_head] if self.ring and len(self.ring) == self.window else None
+        return fields
+
+    def _restore(self, fields: Dict[str, Any]):
+        previous = self.previous
+        fields = dict(fields)
+        ring = fields.pop('ring', None)
+        ring_length = fields.pop('ring_length', None)
+        ring_oldest = fields.pop('ring_oldest', None)
+        self.__dict__.update(fields)
+        if ring is not None:
+            # A full ring, from to_dict (or a previous state saved before rings were undone by slot)
+            self.ring = list(ring)
+        else:
+            del self.ring[ring_length:]
+            if ring_oldest is not None:
+                self.ring[self.ring_head] = ring_oldest
+        self.previous = previous
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the state, including the state before the latest bar"""
+        fields = {name: value for name, value in self.__dict__.items() if name not in ('ring', 'previous')}
+        return {**fields, 'ring': list(self.ring), 'previous': self.previous}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'RiskState':
+        """Restore a state saved with to_dict"""
+        state = cls(data.get('window', RISK_WINDOW))
+        state._restore({name: value for name, value in data.items() if name != 'previous'})
+        state.previous = data.get('previous')
+        return state
+
+    def sync(self, timestamps: np.ndarray, closes: np.ndarray) -> Optional['RiskState']:
+        """
+        Apply the bars of a full history that are new since the last update.
+
+        Returns:
+            RiskState: This state brought up to date, or None if the history
+            was rewritten (e.g. re-adjusted for a split) and must be replayed.
+        """
+        if self.last_timestamp is None:
+            start = 0
+        else:
+            if len(timestamps) == 0 or timestamps[0] != self.first_timestamp:
+                return None
+            start = int(np.searchsorted(timestamps, self.last_timestamp))
+            if start >= len(timestamps) or timestamps[start] != self.last_timestamp:
+                return None
+            # The bar before the latest must be unchanged; the latest may be revised
+            if self.previous is not None and self.previous['last_close'] is not None:
+                if start == 0 or closes[start - 1] != self.previous['last_close']:
+                    return None
+            if closes[start] == self.last_close:
+                start += 1
+        for timestamp, close in zip(timestamps[start:], closes[start:]):
+            self.update(int(timestamp), float(close))
+        return self
+
+
+def replay(timestamps: np.ndarray, closes: np.ndarray, window: int = RISK_WINDOW) -> RiskState:
+    """Build a risk state from a full history"""
+    state = RiskState(window)
+    for timestamp, close in zip(timestamps, closes):
+        state.update(int(timestamp), float(close))
+    return state
+
+
+class RiskStateStore:
+    """Risk states of every ticker, cached in memory and persisted as one JSON file per ticker"""
+
+    def __init__(self, root: str = DEFAULT_STATE_PATH):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._states: Dict[str, RiskState] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', ticker) + ".json")
+
+    def get(self, ticker: str) -> Optional[RiskState]:
+        """Get a ticker's saved state"""
+        with self._lock:
+            if ticker in self._states:
+                return self._states[ticker]
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = RiskState.from_dict(json.load(f))
+        with self._lock:
+            return self._states.setdefault(ticker, state)
+
+    def put(self, ticker: str, state: RiskState):
+        """Save a ticker's state"""
+        path = self._path(ticker)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state.to_dict(), f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._states[ticker] = state
+
+
+def update_risk(ticker: str, price_store=None, state_store=None, window: int = RISK_WINDOW) -> Dict[str, Any]:
+    """
+    Bring a ticker's risk state up to date with the price store and return its metrics.
+
+    Only bars added since the last call are processed; the full history is
+    replayed only for a new ticker or a rewritten history.
+    """
+    price_store = price_store or get_price_store()
+    state_store = state_store or get_risk_state_store()
+    bars = price_store.load(ticker)
+    if bars is None:
+        raise ValueError(f"No price history for {ticker}")
+    timestamps, closes = bars['timestamp'], bars['Close']
+
+    # States are updated in place, so one update runs at a time
+    with _update_lock:
+        state = state_store.get(ticker)
+        last_timestamp = state.last_timestamp if state else None
+        last_close = state.last_close if state else None
+        if state is None or state.window != window or state.sync(timestamps, closes) is None:
+            state = replay(timestamps, closes, window)
+        if state.last_timestamp != last_timestamp or state.last_close != last_close:
+            state_store.put(ticker, state)
+        return state.metrics()
+
+
+def update_risks(tickers: List[str], price_store=None, state_store=None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Re-score many tickers incrementally; tickers that cannot be scored map to None"""
+    risks = {}
+    for ticker in tickers:
+        try:
+            risks[ticker] = update_risk(ticker, price_store, state_store)
+        except ValueError as e:
+            print(f"Warning: Cannot score {ticker}: {str(e)}")
+            risks[ticker] = None
+    return risks
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+_update_lock = threading.Lock()
+
+
+def get_risk_state_store() -> RiskStateStore:
+    """Get the process-wide risk state store"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = RiskStateStore()
+        return _state_store
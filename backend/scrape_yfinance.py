@@ -1,70 +1,337 @@
 import yfinance as yf
 import pandas as pd
+import hashlib
+import json
 import os
+import threading
+import time
+from typing import Dict, List
+from price_store import get_price_store
+from market_data import get_market_data
+from single_flight import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
 
-def scrape_yfinance_data(ticker_name, save_path):
+HISTORY_PERIOD = "1y"
+HISTORY_TTL = 6 * 60 * 60  # Seconds between checks for new daily bars
+FUNDAMENTALS_TTL = 7 * 24 * 60 * 60  # Seconds before fundamentals are refetched
+META_SUFFIX = ".meta.json"
+PREFETCH_WORKERS = 4  # Bound on concurrent background dataset fetches
+
+# Fundamental datasets: CSV file name -> fetcher taking a yf.Ticker
+FUNDAMENTALS = {
+    # Financials (Income Statement)
+    "financials.csv": lambda ticker: ticker.financials,
+    # Balance Sheet
+    "balance_sheet.csv": lambda ticker: ticker.balance_sheet,
+    # Cash Flow
+    "cashflow.csv": lambda ticker: ticker.cashflow,
+    # Quarterly Financials
+    "quarterly_financials.csv": lambda ticker: ticker.quarterly_financials,
+    # Quarterly Balance Sheet
+    "quarterly_balance_sheet.csv": lambda ticker: ticker.quarterly_balance_sheet,
+    # Quarterly Cash Flow
+    "quarterly_cashflow.csv": lambda ticker: ticker.quarterly_cashflow,
+    # Key Statistics and Info
+    "info.csv": lambda ticker: pd.DataFrame.from_dict(ticker.info, orient="index", columns=["Value"]),
+    # Institutional Holders
+    "holders.csv": lambda ticker: ticker.institutional_holders,
+    # Major Holders
+    "major_holders.csv": lambda ticker: pd.DataFrame(ticker.major_holders),
+    # Recommendations
+    "recommendations.csv": lambda ticker: ticker.recommendations,
+}
+
+scrape_flight = SingleFlight()
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def atomic_write_path(path: str) -> str:
+    """Temporary sibling path to write before os.replace-ing it over ``path``"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def save_to_csv(data, save_path, file_name):
+    """Save a DataFrame to CSV atomically, skipping empty results"""
+    if data is not None and not data.empty:
+        path = os.path.join(save_path, file_name)
+        tmp_path = atomic_write_path(path)
+        data.to_csv(tmp_path)
+        # Readers see either the old file or the complete new one
+        os.replace(tmp_path, path)
+        print(f"Saved: {file_name}")
+    else:
+        print(f"No data found for {file_name}")
+
+
+def dataset_meta_path(save_path: str, file_name: str) -> str:
+    """Path of the freshness metadata saved next to a dataset"""
+    return os.path.join(save_path, f"{file_name}{META_SUFFIX}")
+
+
+def dataset_fetched_at(save_path: str, file_name: str) -> float:
+    """Get when a dataset was last fetched (0 if never)"""
+    meta_path = dataset_meta_path(save_path, file_name)
+    if not os.path.exists(meta_path):
+        return 0
+    with open(meta_path) as f:
+        return json.load(f)['fetched_at']
+
+
+def mark_dataset_fetched(save_path: str, file_name: str, fetched_at: float):
+    """Record when a dataset was fetched, even if it came back empty"""
+    path = dataset_meta_path(save_path, file_name)
+    tmp_path = atomic_write_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump({'fetched_at': fetched_at}, f)
+    os.replace(tmp_path, path)
+
+
+def is_dataset_stale(save_path: str, file_name: str, ttl: float = FUNDAMENTALS_TTL) -> bool:
+    """Check whether a fundamental dataset is missing or older than ``ttl``"""
+    return time.time() - dataset_fetched_at(save_path, file_name) >= ttl
+
+
+def is_history_stale(ticker_name: str, store=None, ttl: float = HISTORY_TTL) -> bool:
+    """Check whether a ticker's bars are missing or were last checked over ``ttl`` seconds ago"""
+    metadata = (store or get_price_store()).metadata(ticker_name)
+    if metadata is None:
+        return True
+    return time.time() - metadata.get('checked_at', metadata['updated_at']) > ttl
+
+
+def ensure_price_history(ticker_name: str, store=None, ttl: float = HISTORY_TTL) -> int:
+    """Fetch a ticker's bars if missing, or only the new ones if stale; returns bars added"""
+    store = store or get_price_store()
+    if not is_history_stale(ticker_name, store, ttl):
+        return 0
+
+    def refresh():
+        # Another process may have refreshed while we waited for the lock
+        if not is_history_stale(ticker_name, store, ttl):
+            return 0
+        return refresh_price_history([ticker_name], store)[ticker_name]
+
+    return scrape_flight.do(f"history:{ticker_name}", refresh)
+
+
+def ensure_price_histories(tickers: List[str], store=None, ttl: float = HISTORY_TTL) -> Dict[str, int]:
     """
-    Scrape data from Yahoo Finance for a given ticker and save it as CSV files.
+    Refresh the stale histories of several tickers in one batched, single-flight download.
+
+    Concurrent requests for the same set of tickers share one download, and
+    tickers another caller refreshed in the meantime are skipped.
+
+    Returns:
+        dict: Ticker -> number of new bars stored (only tickers that were refreshed).
+    """
+    store = store or get_price_store()
+    stale = sorted(set(ticker for ticker in tickers if is_history_stale(ticker, store, ttl)))
+    if not stale:
+        return {}
+    if len(stale) == 1:
+        return {stale[0]: ensure_price_history(stale[0], store, ttl)}
+
+    def refresh():
+        # Re-check: single-ticker flights or other processes may have refreshed some meanwhile
+        still_stale = [ticker for ticker in stale if is_history_stale(ticker, store, ttl)]
+        return refresh_price_history(still_stale, store) if still_stale else {}
+
+    # Hash the batch so long ticker lists still make a valid lock file name
+    key = hashlib.sha1(",".join(stale).encode()).hexdigest()
+    return scrape_flight.do(f"histories:{key}", refresh)
+
+
+def refresh_price_history(tickers: List[str], store=None, full: bool = False) -> Dict[str, int]:
+    """
+    Bring the stored daily bars of several tickers up to date.
+
+    Only the range after each ticker's last stored bar is downloaded (the
+    last bar itself is refetched in case it was captured intraday). Tickers
+    sharing a start date are fetched in one batched call.
 
     Args:
-        ticker_name (str): The ticker symbol of the company (e.g., "RELIANCE.NS").
-        save_path (str): The directory path where the data will be saved.
+        tickers (list): Ticker symbols to refresh.
+        store (PriceStore): Price store for the daily bars (defaults to the shared store).
+        full (bool): Refetch a full HISTORY_PERIOD instead of the missing range.
 
     Returns:
-        None
+        dict: Ticker -> number of new bars stored.
     """
-    # Ensure the save directory exists
-    os.makedirs(save_path, exist_ok=True)
+    store = store or get_price_store()
 
-    # Initialize the ticker object
-    ticker = yf.Ticker(ticker_name)
+    # Group tickers by the date their missing range starts
+    groups = {}
+    for ticker_name in tickers:
+        metadata = None if full else store.metadata(ticker_name)
+        start = None
+        if metadata and metadata['length']:
+            last_bar = pd.Timestamp(store.last_timestamp(ticker_name), unit='s', tz='UTC')
+            if metadata.get('tz'):
+                last_bar = last_bar.tz_convert(metadata['tz'])
+            start = last_bar.strftime('%Y-%m-%d')
+        groups.setdefault(start, []).append(ticker_name)
 
-    # Function to save DataFrame to CSV
-    def save_to_csv(data, file_name):
-        if not data.empty:
-            data.to_csv(os.path.join(save_path, file_name))
-            print(f"Saved: {file_name}")
+    added = {}
+    market_data = get_market_data()
+    for start, group in groups.items():
+        if start is None:
+            histories = market_data.get_histories(group, period=HISTORY_PERIOD)
         else:
-            print(f"No data found for {file_name}")
+            histories = market_data.get_histories(group, start=start)
+        for ticker_name in group:
+            history = histories.get(ticker_name, pd.DataFrame())
+            if start is None:
+                if not history.empty:
+                    store.write(ticker_name, history)
+                added[ticker_name] = len(history)
+            else:
+                added[ticker_name] = store.append(ticker_name, history)
+    return added
 
-    # 1. Technical Data: Historical Data
-    history = ticker.history(period="1y", interval="1d")
-    save_to_csv(history, "technicals.csv")
 
-    # 2. Fundamental Data
-    # Financials (Income Statement)
-    save_to_csv(ticker.financials, "financials.csv")
+def refresh_dataset(ticker_name, save_path, file_name, ticker=None):
+    """
+    Fetch one fundamental dataset of a ticker and record its freshness.
 
-    # Balance Sheet
-    save_to_csv(ticker.balance_sheet, "balance_sheet.csv")
+    Args:
+        ticker_name (str): The ticker symbol of the company (e.g., "RELIANCE.NS").
+        save_path (str): The directory path where the data will be saved.
+        file_name (str): Dataset file name, a key of FUNDAMENTALS (e.g., "financials.csv").
+        ticker (yf.Ticker): Optional ticker object to reuse.
+    """
+    os.makedirs(save_path, exist_ok=True)
+    fetched_at = time.time()
+    try:
+        save_to_csv(FUNDAMENTALS[file_name](ticker or yf.Ticker(ticker_name)), save_path, file_name)
+        mark_dataset_fetched(save_path, file_name, fetched_at)
+    except Exception as e:
+        print(f"Error fetching {file_name} for {ticker_name}: {str(e)}")
 
-    # Cash Flow
-    save_to_csv(ticker.cashflow, "cashflow.csv")
 
-    # Quarterly Financials
-    save_to_csv(ticker.quarterly_financials, "quarterly_financials.csv")
+def ensure_dataset(ticker_name, save_path, file_name, ttl: float = FUNDAMENTALS_TTL):
+    """Fetch one fundamental dataset if it is missing or stale, one fetch in flight at a time"""
+    if not is_dataset_stale(save_path, file_name, ttl):
+        return
 
-    # Quarterly Balance Sheet
-    save_to_csv(ticker.quarterly_balance_sheet, "quarterly_balance_sheet.csv")
+    def refresh():
+        if is_dataset_stale(save_path, file_name, ttl):
+            refresh_dataset(ticker_name, save_path, file_name)
 
-    # Quarterly Cash Flow
-    save_to_csv(ticker.quarterly_cashflow, "quarterly_cashflow.csv")
+    scrape_flight.do(f"dataset:{save_path}/{file_name}", refresh)
 
-    # Key Statistics and Info
-    info = pd.DataFrame.from_dict(ticker.info, orient="index", columns=["Value"])
-    save_to_csv(info, "info.csv")
 
-    # Institutional Holders
-    save_to_csv(ticker.institutional_holders, "holders.csv")
+def prefetch_datasets(ticker_name, save_path, exclude=(), store=None, ttl: float = FUNDAMENTALS_TTL):
+    """
+    Load a ticker's remaining stale datasets in the background.
 
-    # Major Holders
-    major_holders = pd.DataFrame(ticker.major_holders)
-    save_to_csv(major_holders, "major_holders.csv")
+    Each dataset is a separate task on a bounded thread pool, and a dataset
+    already queued is not queued again.
 
-    # Recommendations
-    save_to_csv(ticker.recommendations, "recommendations.csv")
+    Args:
+        ticker_name (str): The ticker symbol of the company (e.g., "RELIANCE.NS").
+        save_path (str): The directory path where the data will be saved.
+        exclude (iterable): Dataset names to skip ("technicals" for price history).
+        store (PriceStore): Price store for the daily bars (defaults to the shared store).
+        ttl (float): Maximum age in seconds of the fundamental datasets.
+    """
+    tasks = []
+    if 'technicals' not in exclude and is_history_stale(ticker_name, store):
+        tasks.append(('technicals', ensure_price_history, (ticker_name, store)))
+    for file_name in FUNDAMENTALS:
+        if file_name not in exclude and is_dataset_stale(save_path, file_name, ttl):
+            tasks.append((file_name, ensure_dataset, (ticker_name, save_path, file_name, ttl)))
+
+    for name, fn, args in tasks:
+        key = (ticker_name, save_path, name)
+        with _pending_lock:
+            if key in _pending:
+                continue
+            _pending.add(key)
+        future = _prefetch_pool.submit(fn, *args)
+        future.add_done_callback(lambda _, key=key: _discard_pending(key))
+
+
+def _discard_pending(key):
+    with _pending_lock:
+        _pending.discard(key)
+
+
+def refresh_fundamentals(ticker_name, save_path, ttl: float = FUNDAMENTALS_TTL, ticker=None):
+    """
+    Refetch the fundamental datasets of a ticker whose saved copy is older than ``ttl``.
+
+    Args:
+        ticker_name (str): The ticker symbol of the company (e.g., "RELIANCE.NS").
+        save_path (str): The directory path where the data will be saved.
+        ttl (float): Maximum age in seconds before a dataset is refetched.
+        ticker (yf.Ticker): Optional ticker object to reuse.
+    """
+    for file_name in FUNDAMENTALS:
+        if is_dataset_stale(save_path, file_name, ttl):
+            ticker = ticker or yf.Ticker(ticker_name)
+            refresh_dataset(ticker_name, save_path, file_name, ticker)
+
+
+def refresh_yfinance_data(ticker_name, save_path, store=None, fundamentals_ttl: float = FUNDAMENTALS_TTL):
+    """
+    Incrementally update a ticker: fetch only new daily bars, and fundamentals whose TTL expired.
+
+    Args:
+        ticker_name (str): The ticker symbol of the company (e.g., "RELIANCE.NS").
+        save_path (str): The directory path where the data will be saved.
+        store (PriceStore): Price store for the daily bars (defaults to the shared store).
+        fundamentals_ttl (float): Maximum age in seconds of the fundamental datasets.
+
+    Returns:
+        int: Number of new daily bars stored.
+    """
+    added = refresh_price_history([ticker_name], store)[ticker_name]
+    refresh_fundamentals(ticker_name, save_path, fundamentals_ttl)
+    return added
+
+
+def scrape_yfinance_data(ticker_name, save_path, store=None):
+    """
+    Scrape data from Yahoo Finance for a given ticker and save it as CSV files.
+
+    Daily bars go to the shared columnar price store instead of a CSV file.
+
+    Args:
+        ticker_name (str): The ticker symbol of the company (e.g., "RELIANCE.NS").
+        save_path (str): The directory path where the data will be saved.
+        store (PriceStore): Price store for the daily bars (defaults to the shared store).
+
+    Returns:
+        None
+    """
+    # Ensure the save directory exists
+    os.makedirs(save_path, exist_ok=True)
+
+    # Initialize the ticker object
+    ticker = yf.Ticker(ticker_name)
+
+    # 1. Technical Data: Historical Data
+    history = ticker.history(period=HISTORY_PERIOD, interval="1d")
+    if not history.empty:
+        (store or get_price_store()).write(ticker_name, history)
+        print(f"Saved: {ticker_name} price history")
+    else:
+        print(f"No data found for {ticker_name} price history")
+
+    # 2. Fundamental Data
+    refresh_fundamentals(ticker_name, save_path, ttl=0, ticker=ticker)
 
 if __name__ == "__main__":
-    ticker_name = "RELIANCE.NS"
-    save_path = f"data/{ticker_name}"
-    scrape_yfinance_data(ticker_name, save_path)
\ No newline at end of file
+    import sys
+    # Daily delta job: batch-refresh stored tickers, full scrape for new ones
+    tickers = sys.argv[1:] or ["RELIANCE.NS"]
+    store = get_price_store()
+    stored = [ticker_name for ticker_name in tickers if store.has(ticker_name)]
+    for ticker_name, added in refresh_price_history(stored, store).items():
+        print(f"{ticker_name}: {added} new bars")
+        refresh_fundamentals(ticker_name, f"data/{ticker_name}")
+    for ticker_name in tickers:
+        if ticker_name not in stored:
+            scrape_yfinance_data(ticker_name, f"data/{ticker_name}", store)
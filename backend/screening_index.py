@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+import pandas as pd
+
+from market_data import get_market_data
+from single_flight import SingleFlight
+
+DEFAULT_INDEX_PATH = os.environ.get("SCREENING_INDEX_PATH", "data/screening_index.json")
+SCREENING_REFRESH_INTERVAL = float(os.environ.get("SCREENING_REFRESH_INTERVAL", 6 * 60 * 60))  # Seconds between rebuilds
+SCREENING_PERIOD = "1y"
+
+screening_flight = SingleFlight()
+
+
+class ScreeningIndex:
+    """
+    Precomputed metrics and scores of every ticker in a sector universe.
+
+    ``screen`` turns a batch of histories into one row (a dict of metrics and
+    scores) per ticker. The whole universe is screened in one batched fetch
+    and saved to ``path``, so worker processes share one build. Queries are
+    served from the last build; a background thread rebuilds it every
+    ``refresh_interval`` seconds, and only the very first query waits for a
+    build.
+    """
+
+    def __init__(self, screen: Callable[[Dict[str, pd.DataFrame]], Dict[str, Dict[str, Any]]],
+                 universe: Dict[str, List[str]], path: str = DEFAULT_INDEX_PATH,
+                 refresh_interval: float = SCREENING_REFRESH_INTERVAL):
+        self.screen = screen
+        self.universe = universe
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.sectors: Dict[str, List[str]] = {}  # Ticker -> sectors it belongs to
+        for sector, tickers in universe.items():
+            for ticker in tickers:
+                self.sectors.setdefault(ticker, []).append(sector)
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_stale(self) -> bool:
+        """Check whether the loaded build is missing or older than the refresh interval"""
+        return time.time() - self.built_at >= self.refresh_interval
+
+    def _load(self) -> bool:
+        """Load the saved build if it is newer than ours"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            data = json.load(f)
+        with self._lock:
+            if data['built_at'] <= self.built_at:
+                return False
+            self.rows, self.built_at = data['rows'], data['built_at']
+        return True
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Screen the whole universe and save the build.
+
+        Returns:
+            int: Number of tickers screened (0 if another process had just built it).
+        """
+        def build():
+            # Another process may have rebuilt while we waited for the lock
+            self._load()
+            if not force and not self.is_stale():
+                return 0
+            tickers = list(self.sectors)
+            histories = get_market_data().get_histories(tickers, period=SCREENING_PERIOD)
+            rows = self.screen({ticker: hist for ticker, hist in histories.items() if not hist.empty})
+            for ticker, row in rows.items():
+                row['sectors'] = self.sectors.get(ticker, [])
+            built_at = time.time()
+
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({'built_at': built_at, 'rows': rows}, f)
+            os.replace(tmp_path, self.path)
+            with self._lock:
+                self.rows, self.built_at = rows, built_at
+            print(f"Screening index rebuilt: {len(rows)}/{len(tickers)} tickers")
+            return len(rows)
+
+        return screening_flight.do(f"screening:{self.path}", build)
+
+    def ensure_built(self):
+        """Make sure some build is loaded, building one if none exists yet"""
+        if self.rows:
+            return
+        self._load()
+        if not self.rows:
+            self.refresh(force=True)
+
+    def top(self, sectors: Iterable[str], k: int, score: str, exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Get the highest scoring tickers of some sectors.
+
+        Args:
+            sectors (iterable): Sector names from the universe.
+            k (int): Number of rows to return.
+            score (str): Row field to rank by (e.g., 'buy_score').
+            exclude (iterable): Tickers to leave out (e.g., current holdings).
+
+        Returns:
+            list: Up to ``k`` rows, best first (ties broken by ticker).
+        """
+        self.ensure_built()
+        sectors, exclude = set(sectors), set(exclude)
+        with self._lock:
+            rows = [row for ticker, row in self.rows.items()
+                    if ticker not in exclude and sectors.intersection(row['sectors'])]
+        rows.sort(key=lambda row: (-row.get(score, 0), row['ticker']))
+        return [dict(row) for row in rows[:k]]
+
+    def lookup(self, tickers: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the rows of the given tickers that are in the index"""
+        self.ensure_built()
+        with self._lock:
+            return {ticker: dict(self.rows[ticker]) for ticker in tickers if ticker in self.rows}
+
+    def sector_tickers(self, sectors: Iterable[str]) -> List[str]:
+        """Universe tickers belonging to any of the sectors"""
+        sectors = set(sectors)
+        return [ticker for ticker, ticker_sectors in self.sectors.items() if sectors.intersection(ticker_sectors)]
+
+    def start(self):
+        """Rebuild the index in a background thread every refresh interval"""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self._load()
+                    if self.is_stale():
+                        self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing screening index: {str(e)}")
+                remaining = self.refresh_interval - (time.time() - self.built_at)
+                self._stop.wait(max(remaining, 60))
+
+        self._thread = threading.Thread(target=run, name="screening-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh"""
+        self._stop.set()
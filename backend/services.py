@@ -0,0 +1,285 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import os
+
+import pandas as pd
+
+from esg_analysis import ESGAnalyzer
+from price_store import get_price_store, frame_to_records
+from session_store import get_session_store
+from market_data import normalize_dates
+from risk_analysis import calculate_risk_score, calculate_risk_scores
+from risk_stream import update_risk
+from scrape_yfinance import ensure_price_history, ensure_price_histories, ensure_dataset, prefetch_datasets, FUNDAMENTALS
+from chatbot import PortfolioChat
+from strategy_bot import generate_strategies, generate_strategies_async
+from swot_analysis import generate_portfolio_swot, generate_portfolio_swot_async, generate_trading_signals, parse_swot_analysis
+
+SERVICE_WORKERS = 8  # Bound on concurrent per-ticker work in composite requests
+
+esg_analyser = ESGAnalyzer()
+price_store = get_price_store()
+sessions = get_session_store()
+_executor = ThreadPoolExecutor(max_workers=SERVICE_WORKERS, thread_name_prefix="service")
+
+
+def get_technicals(ticker_name: str) -> Optional[pd.DataFrame]:
+    """Get a ticker's daily bars, fetching or refreshing them first if needed"""
+    ensure_price_history(ticker_name, price_store)
+    return price_store.load_frame(ticker_name)
+
+
+def get_finance_data(ticker_name: str, qtype: str):
+    """
+    Get one dataset of a ticker as JSON-ready records.
+
+    Only the requested dataset is fetched in the foreground; the ticker's
+    other stale datasets are loaded in the background.
+
+    Returns:
+        list: Records of the dataset, or None if no data was found.
+    """
+    save_path = f"data/finance/{ticker_name}"
+    if qtype == 'technicals':
+        technicals = get_technicals(ticker_name)
+        prefetch_datasets(ticker_name, save_path, exclude=[qtype], store=price_store)
+        if technicals is not None:
+            return frame_to_records(technicals)
+    elif f"{qtype}.csv" in FUNDAMENTALS:
+        ensure_dataset(ticker_name, save_path, f"{qtype}.csv")
+        prefetch_datasets(ticker_name, save_path, exclude=[f"{qtype}.csv"], store=price_store)
+    if os.path.exists(f"{save_path}/{qtype}.csv"):
+        return pd.read_csv(f"{save_path}/{qtype}.csv").to_dict(orient='records')
+    return None
+
+
+def get_risk(ticker_name: str) -> Dict[str, Any]:
+    """Get the risk score, its components and category for a ticker, updated incrementally"""
+    ensure_price_history(ticker_name, price_store)
+    return update_risk(ticker_name, price_store)
+
+
+def get_risk_batch(tickers: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Get the risk scores of many tickers in one vectorized pass.
+
+    Stale histories are refreshed together in batched downloads first.
+
+    Returns:
+        dict: Ticker -> risk score, components and category (None without data).
+    """
+    tickers = list(dict.fromkeys(tickers))
+    ensure_price_histories(tickers, price_store)
+
+    closes = {}
+    for ticker in tickers:
+        frame = price_store.load_frame(ticker)
+        if frame is not None and not frame.empty:
+            closes[ticker] = normalize_dates(frame)['Close']
+    risk = {ticker: None for ticker in tickers}
+    if closes:
+        scores = calculate_risk_scores(pd.concat(closes, axis=1))
+        # NaN is not valid JSON
+        risk.update(scores.astype(object).where(scores.notna(), None).to_dict(orient='index'))
+    return risk
+
+
+def get_esg(ticker_name: str) -> Dict[str, Any]:
+    """Get the ESG analysis for a ticker"""
+    return {'analysis': esg_analyser.get_esg_score(ticker_name)}
+
+
+def get_swot(portfolio: List[str]) -> Dict[str, Any]:
+    """Get the portfolio SWOT analysis and trading signals"""
+    # Called from request threads only: pool tasks must not wait on other pool tasks
+    swot = _executor.submit(generate_portfolio_swot, portfolio)
+    signals = _executor.submit(generate_trading_signals, portfolio)
+    return {
+        "swot": parse_swot_analysis(swot.result()),
+        "signals": signals.result()
+    }
+
+
+async def get_swot_async(portfolio: List[str]) -> Dict[str, Any]:
+    """Get the portfolio SWOT analysis and trading signals without blocking the event loop"""
+    swot, signals = await asyncio.gather(
+        generate_portfolio_swot_async(portfolio),
+        asyncio.to_thread(generate_trading_signals, portfolio),
+    )
+    return {
+        "swot": parse_swot_analysis(swot),
+        "signals": signals
+    }
+
+
+def get_strategies(prompt: str, portfolio: List[str]) -> List[Dict[str, Any]]:
+    """Get investment strategies for a portfolio and user prompt"""
+    return generate_strategies(prompt, portfolio)
+
+
+async def get_strategies_async(prompt: str, portfolio: List[str]) -> List[Dict[str, Any]]:
+    """Get investment strategies without blocking the event loop"""
+    return await generate_strategies_async(prompt, portfolio)
+
+
+def reset_chat(user_id: str):
+    """Drop a user's chat session"""
+    sessions.delete(user_id)
+
+
+def get_chat_session(user_id: str) -> PortfolioChat:
+    """Get a user's chat session, starting one if needed"""
+    state = sessions.get(user_id)
+    return PortfolioChat() if state is None else PortfolioChat.from_state(state)
+
+
+def save_chat_session(user_id: str, bot: PortfolioChat):
+    """Save a user's chat session after a request changed it"""
+    sessions.put(user_id, bot.to_state())
+
+
+def chat(user_id: str, portfolio: List[str], prompt: Optional[str] = None, doc: Optional[str] = None):
+    """Answer a chat prompt or analyze a report within a user's chat session"""
+    bot = get_chat_session(user_id)
+    if doc:
+        assert prompt is None
+        response = bot.analyze_report(doc)
+    elif prompt:
+        response = bot.process_message(prompt, portfolio)
+    else:
+        return {"error": "No prompt or document provided."}
+    save_chat_session(user_id, bot)
+    return response
+
+
+async def chat_async(user_id: str, portfolio: List[str], prompt: Optional[str] = None, doc: Optional[str] = None):
+    """Answer a chat prompt or analyze a report without blocking the event loop"""
+    bot = await asyncio.to_thread(get_chat_session, user_id)
+    if doc:
+        assert prompt is None
+        response = await asyncio.to_thread(bot.analyze_report, doc)
+    elif prompt:
+        response = await bot.process_message_async(prompt, portfolio)
+    else:
+        return {"error": "No prompt or document provided."}
+    await asyncio.to_thread(save_chat_session, user_id, bot)
+    return response
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+class _StreamStats:
+    """Timing and size of a streamed answer, reported in its final frame"""
+
+    def __init__(self, user_id: str, portfolio: List[str]):
+        self.started = time.monotonic()
+        self.metadata = {'user_id': user_id, 'portfolio': portfolio, 'chunks': 0, 'characters': 0,
+                         'first_token_ms': None}
+
+    def add(self, text: str):
+        if self.metadata['first_token_ms'] is None:
+            self.metadata['first_token_ms'] = round((time.monotonic() - self.started) * 1000)
+        self.metadata['chunks'] += 1
+        self.metadata['characters'] += len(text)
+
+    def done(self, error: Optional[Exception] = None) -> Dict[str, Any]:
+        self.metadata['elapsed_ms'] = round((time.monotonic() - self.started) * 1000)
+        if error is not None:
+            self.metadata['error'] = str(error)
+        return self.metadata
+
+
+def chat_stream(user_id: str, portfolio: List[str], prompt: str) -> Iterator[str]:
+    """
+    Answer a chat prompt as Server-Sent Events.
+
+    Each text delta is sent as a ``{"token": ...}`` frame as soon as the
+    LLM produces it, followed by a final ``done`` frame with metadata.
+    """
+    stats = _StreamStats(user_id, portfolio)
+    error = None
+    try:
+        bot = get_chat_session(user_id)
+        for text in bot.process_message_stream(prompt, portfolio):
+            stats.add(text)
+            yield sse_event({'token': text})
+        save_chat_session(user_id, bot)
+    except Exception as e:
+        error = e
+    yield sse_event(stats.done(error), event='done')
+
+
+async def chat_stream_async(user_id: str, portfolio: List[str], prompt: str) -> AsyncIterator[str]:
+    """Answer a chat prompt as Server-Sent Events without blocking the event loop"""
+    stats = _StreamStats(user_id, portfolio)
+    error = None
+    try:
+        bot = await asyncio.to_thread(get_chat_session, user_id)
+        async for text in bot.process_message_stream_async(prompt, portfolio):
+            stats.add(text)
+            yield sse_event({'token': text})
+        await asyncio.to_thread(save_chat_session, user_id, bot)
+    except Exception as e:
+        error = e
+    yield sse_event(stats.done(error), event='done')
+
+
+def get_ticker_summary(ticker_name: str) -> Dict[str, Any]:
+    """Summarize one holding for the dashboard: price moves, ESG, risk and ROI"""
+    technicals = get_technicals(ticker_name)
+    closes = technicals['Close']
+    last = closes.iloc[-1]
+    last_to_last = closes.iloc[-2]
+    month_ago = closes.iloc[-31]
+    percentage_change = (last - last_to_last)/last_to_last*100
+    roi = ((last/month_ago)-1)*100
+    roi_prev = ((last_to_last/month_ago)-1)*100
+    roi_pct = ((roi-roi_prev)/roi_prev)*100
+    esg_analysis = get_esg(ticker_name)['analysis']
+    return {'Value': float(last),
+        'name': ticker_name,
+        'ticker_name': ticker_name,
+        'percentage_change': float(percentage_change),
+        'sign': bool(percentage_change > 0),
+        'ESG': esg_analysis['total_esg'] if esg_analysis else None,
+        'Risk': calculate_risk_score(technicals)['risk_score'],
+        'ROI': float(roi),
+        'ROI_PCT': float(roi_pct),
+        'Principle': float(month_ago),
+    }
+
+
+def get_portfolio_overview(tickers: List[str], prompt: str = "Improve my strategies") -> Dict[str, Any]:
+    """
+    Compose the full dashboard for a portfolio in process.
+
+    Per-ticker summaries, the SWOT analysis and the strategies are computed
+    concurrently and returned as Python objects.
+
+    Args:
+        tickers (list): Portfolio ticker symbols.
+        prompt (str): User prompt for strategy generation.
+
+    Returns:
+        dict: Per-ticker summaries, their averages, SWOT and strategies.
+    """
+    swot = _executor.submit(generate_portfolio_swot, tickers)
+    signals = _executor.submit(generate_trading_signals, tickers)
+    strategies = _executor.submit(get_strategies, prompt, tickers)
+    summaries = [_executor.submit(get_ticker_summary, ticker) for ticker in tickers]
+    portfolio_data = [summary.result() for summary in summaries]
+    return {'tickers': portfolio_data,
+        'overall': pd.DataFrame(portfolio_data)[['ESG', 'Risk', 'ROI', 'Principle']].mean().to_dict(),
+        'swot': {
+            "swot": parse_swot_analysis(swot.result()),
+            "signals": signals.result()
+        },
+        'strategies': strategies.result(),
+    }
@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+SESSION_BACKEND = os.environ.get("SESSION_STORE", "memory")
+DEFAULT_SESSION_PATH = os.environ.get("SESSION_STORE_PATH", "data/sessions.sqlite")
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", 2 * 60 * 60))  # Seconds without a request before a session is dropped
+SESSION_MAX_COUNT = int(os.environ.get("SESSION_MAX_COUNT", 10000))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def _to_json(value: Any):
+    """Encode numpy scalars and timestamps found in chat state"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dump_state(state: Dict[str, Any]) -> str:
+    """Serialize a session state dict"""
+    return json.dumps(state, default=_to_json)
+
+
+class SessionStore(ABC):
+    """
+    Storage of chat session states keyed by user id.
+
+    States are JSON-serializable dicts (see PortfolioChat.to_state). A
+    session idle for ``idle_ttl`` seconds is dropped, and least recently
+    used sessions are evicted beyond ``max_sessions`` or ``max_bytes``.
+    """
+
+    def __init__(self, idle_ttl: float = SESSION_IDLE_TTL, max_sessions: int = SESSION_MAX_COUNT,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session state, or None if there is none or it expired"""
+
+    @abstractmethod
+    def put(self, user_id: str, state: Dict[str, Any]):
+        """Save a session state, evicting others if the store is over its bounds"""
+
+    @abstractmethod
+    def delete(self, user_id: str):
+        """Drop a session"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Number of sessions held and their total serialized size"""
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions held in this process only"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions = OrderedDict()  # user_id -> (serialized state, last used)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._expire(time.time())
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            self._sessions[user_id] = (entry[0], time.time())
+            self._sessions.move_to_end(user_id)
+            return json.loads(entry[0])
+
+    def put(self, user_id: str, state: Dict[str, Any]):
+        data = dump_state(state)
+        with self._lock:
+            self._pop(user_id)
+            self._sessions[user_id] = (data, time.time())
+            self._bytes += len(data)
+            self._expire(time.time())
+            while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                self._pop(next(iter(self._sessions)))
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._pop(user_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'sessions': len(self._sessions), 'bytes': self._bytes}
+
+    def _pop(self, user_id: str):
+        entry = self._sessions.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _expire(self, now: float):
+        # Entries are in last-used order, so idle ones are at the front
+        while self._sessions:
+            user_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._pop(user_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file shared by every worker process on the box"""
+
+    def __init__(self, path: str = DEFAULT_SESSION_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id TEXT PRIMARY KEY, state TEXT, size INTEGER, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM sessions WHERE user_id = ? AND last_used > ?", (user_id, now - self.idle_ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE sessions SET last_used = ? WHERE user_id = ?", (now, user_id))
+            return json.loads(row[0])
+
+    def put(self, user_id: str, state: Dict[str, Any]):
+        data = dump_state(state)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, state, size, last_used) VALUES (?, ?, ?, ?)",
+                (user_id, data, len(data), now),
+            )
+            self._evict(now)
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+            return {'sessions': count, 'bytes': size}
+
+    def _evict(self, now: float):
+        """Drop idle sessions, then least recently used ones until within bounds"""
+        self._db.execute("DELETE FROM sessions WHERE last_used <= ?", (now - self.idle_ttl,))
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+        evicted = []
+        for user_id, size in self._db.execute("SELECT user_id, size FROM sessions ORDER BY last_used"):
+            if count <= 1 or (count <= self.max_sessions and total <= self.max_bytes):
+                break
+            evicted.append((user_id,))
+            count -= 1
+            total -= size
+        self._db.executemany("DELETE FROM sessions WHERE user_id = ?", evicted)
+
+
+SESSION_BACKENDS = {
+    'memory': MemorySessionStore,
+    'sqlite': SQLiteSessionStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Get the process-wide session store, choosing the backend from SESSION_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_BACKEND not in SESSION_BACKENDS:
+                raise ValueError(f"Unknown session store: {SESSION_BACKEND}")
+            _store = SESSION_BACKENDS[SESSION_BACKEND]()
+        return _store
+
+
+def set_session_store(store: SessionStore):
+    """Replace the process-wide session store"""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,74 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict
+
+from filelock import FileLock
+
+DEFAULT_LOCK_DIR = os.environ.get("SINGLE_FLIGHT_LOCK_DIR", "data/locks")
+
+
+class _Call:
+    """An in-flight call whose result is shared with every waiting thread"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time, across threads and processes.
+
+    Threads of one process asking for a key that is already in flight wait
+    for the leader and share its result (or exception). Leaders of
+    different processes serialize on a per-key file lock, so ``fn`` must
+    re-check whether its work is still needed once it runs: a process that
+    waited on the lock will typically find the data already fresh.
+    """
+
+    def __init__(self, lock_dir: str = DEFAULT_LOCK_DIR, timeout: float = 300):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        os.makedirs(lock_dir, exist_ok=True)
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', key) + ".lock")
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Call ``fn(*args, **kwargs)`` unless a call for ``key`` is already in flight.
+
+        Args:
+            key (str): Identifies the work being deduplicated (e.g., a ticker).
+            fn (callable): The work to run; must be safe to repeat.
+
+        Returns:
+            The leader's return value. Its exception is raised in every waiter.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with FileLock(self._lock_path(key), timeout=self.timeout):
+                call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -1,10 +1,28 @@
 from typing import Dict, List, Any
+import asyncio
 import yfinance as yf
 import numpy as np
 import pandas as pd
-from groq import Groq
 import os
+import threading
 from references import SECTOR_TICKERS
+from market_data import PriceStoreBackend, normalize_dates
+from price_store import get_price_store
+from scrape_yfinance import ensure_price_histories
+from llm_gateway import get_llm_gateway
+from indicators import get_indicator_engine
+from screening_index import ScreeningIndex
+from covariance import get_covariance_engine
+from esg_analysis import ESGAnalyzer, esg_quality
+from risk_analysis import calculate_risk_scores
+from optimizer import MAX_SHARPE_ASSETS, get_portfolio_optimizer
+
+ALLOCATION_MAX_POSITION = 0.25  # Largest weight of one stock (raised to 1/n for fewer than 4 stocks)
+ALLOCATION_SECTOR_CAP = 0.5  # Largest weight of one sector
+
+_screening_index = None
+_screening_index_lock = threading.Lock()
+esg_analyzer = ESGAnalyzer()
 
 
 def normalize_sector_name(sector: str) -> str:
@@ -28,8 +46,42 @@ def normalize_sector_name(sector: str) -> str:
 
 def generate_strategies(user_input: str, portfolio: List[str]) -> List[Dict[str, Any]]:
     """Generate three investment strategies based on user constraints and current portfolio"""
+    response = generate_completion(build_strategies_prompt(user_input, portfolio))
+    strategies = parse_strategies(response)
+    
+    # Add stock recommendations for each strategy, considering current portfolio
+    for strategy in strategies:
+        strategy['recommendations'] = get_portfolio_recommendations(strategy['sectors'], portfolio)
+    data = load_allocation_data(allocation_tickers(strategies, portfolio))
+    for strategy in strategies:
+        strategy['allocation'] = get_strategy_allocation(strategy['recommendations'], portfolio, data)
+    
+    return strategies
+
+async def generate_strategies_async(user_input: str, portfolio: List[str]) -> List[Dict[str, Any]]:
+    """Generate investment strategies, awaiting the LLM and fetching recommendations concurrently"""
+    response = await generate_completion_async(build_strategies_prompt(user_input, portfolio))
+    strategies = parse_strategies(response)
     
-    prompt = f"""
+    recommendations = await asyncio.gather(*(
+        asyncio.to_thread(get_portfolio_recommendations, strategy['sectors'], portfolio)
+        for strategy in strategies
+    ))
+    for strategy, strategy_recommendations in zip(strategies, recommendations):
+        strategy['recommendations'] = strategy_recommendations
+    data = await asyncio.to_thread(load_allocation_data, allocation_tickers(strategies, portfolio))
+    allocations = await asyncio.gather(*(
+        asyncio.to_thread(get_strategy_allocation, strategy['recommendations'], portfolio, data)
+        for strategy in strategies
+    ))
+    for strategy, allocation in zip(strategies, allocations):
+        strategy['allocation'] = allocation
+    
+    return strategies
+
+def build_strategies_prompt(user_input: str, portfolio: List[str]) -> str:
+    """Build the strategy generation prompt"""
+    return f"""
     Based on this user input: "{user_input}"
     Current portfolio holdings: {', '.join(portfolio)}
     
@@ -54,42 +106,33 @@ def generate_strategies(user_input: str, portfolio: List[str]) -> List[Dict[str,
 
     Each strategy should be distinctly different and focus on future transformation rather than current holdings.
     """
-    
-    response = generate_completion(prompt)
-    strategies = parse_strategies(response)
-    
-    # Add stock recommendations for each strategy, considering current portfolio
-    for strategy in strategies:
-        strategy['recommendations'] = get_portfolio_recommendations(strategy['sectors'], portfolio)
-    
-    return strategies
 
-def calculate_stock_metrics(hist: pd.DataFrame, ticker: str) -> Dict[str, float]:
+STOCK_INDICATORS = {
+    'value_change_21d': ('change', {'periods': 20}),
+    'monthly_return': ('change', {'periods': 29}),
+    'ytd_return': ('total_return', {}),
+    'volatility': ('volatility', {}),
+    'downside_vol': ('volatility', {'downside': True}),
+    'max_drawdown': ('max_drawdown', {}),
+    'momentum': ('change', {'periods': 9}),
+    'trend_signal': ('sma_trend', {'short': 50, 'long': 200}),
+    'rsi': ('rsi', {'period': 14}),
+    'macd_signal': ('macd_signal', {}),
+    'volume_trend': ('volume_trend', {'recent': 5, 'base': 20}),
+}
+
+def calculate_stocks_metrics(histories: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, float]]:
+    """Calculate comprehensive metrics of many stocks, computing their indicators together"""
+    indicators = get_indicator_engine().compute(histories, STOCK_INDICATORS)
+    return {ticker: calculate_stock_metrics(hist, ticker, indicators.get(ticker)) for ticker, hist in histories.items()}
+
+def calculate_stock_metrics(hist: pd.DataFrame, ticker: str, indicators: Dict[str, float] = None) -> Dict[str, float]:
     """Calculate comprehensive stock metrics"""
     try:
-        # Basic price metrics
-        returns = hist['Close'].pct_change().dropna()
-        current_price = hist['Close'].iloc[-1]
-        
-        # Performance metrics
-        value_change_21d = ((current_price / hist['Close'].iloc[-21]) - 1) * 100
-        monthly_return = ((current_price / hist['Close'].iloc[-30]) - 1) * 100
-        ytd_return = ((current_price / hist['Close'].iloc[0]) - 1) * 100
-        
-        # Risk metrics
-        volatility = returns.std() * np.sqrt(252) * 100
-        downside_vol = returns[returns < 0].std() * np.sqrt(252) * 100
-        max_drawdown = ((hist['Close'] / hist['Close'].expanding(min_periods=1).max()) - 1).min() * 100
-        
-        # Technical indicators
-        sma_50 = hist['Close'].rolling(window=50).mean().iloc[-1]
-        sma_200 = hist['Close'].rolling(window=200).mean().iloc[-1]
-        rsi = calculate_rsi(hist['Close'])
-        macd = calculate_macd(hist['Close'])
-        
-        # Volume and momentum
-        volume_trend = (hist['Volume'].iloc[-5:].mean() / hist['Volume'].iloc[-20:-5].mean() - 1) * 100
-        momentum = ((current_price / hist['Close'].iloc[-10]) - 1) * 100
+        if len(hist) < 30:
+            raise ValueError(f"Need at least 30 days of history, got {len(hist)}")
+        if indicators is None:
+            indicators = get_indicator_engine().compute({ticker: hist}, STOCK_INDICATORS)[ticker]
         
         # ESG and risk scores (simulated - replace with actual data if available)
         esg_score = np.random.normal(65, 15)  # Simulated ESG score (0-100)
@@ -98,42 +141,16 @@ def calculate_stock_metrics(hist: pd.DataFrame, ticker: str) -> Dict[str, float]
         
         return {
             'ticker': ticker,
-            'value_change_21d': value_change_21d,
-            'monthly_return': monthly_return,
-            'ytd_return': ytd_return,
-            'volatility': volatility,
-            'downside_vol': downside_vol,
-            'max_drawdown': max_drawdown,
-            'momentum': momentum,
-            'trend_signal': 1 if sma_50 > sma_200 else -1,
-            'rsi': rsi,
-            'macd_signal': macd,
-            'volume_trend': volume_trend,
+            **indicators,
             'esg_score': esg_score,
             'governance_risk': governance_risk,
             'climate_risk': climate_risk,
-            'risk_score': calculate_risk_score(volatility, downside_vol, rsi, esg_score)
+            'risk_score': calculate_risk_score(indicators['volatility'], indicators['downside_vol'], indicators['rsi'], esg_score)
         }
     except Exception as e:
         print(f"Error calculating metrics for {ticker}: {str(e)}")
         return {}
 
-def calculate_rsi(prices: pd.Series, periods: int = 14) -> float:
-    """Calculate Relative Strength Index"""
-    delta = prices.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=periods).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=periods).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs.iloc[-1]))
-
-def calculate_macd(prices: pd.Series) -> int:
-    """Calculate MACD signal"""
-    exp1 = prices.ewm(span=12, adjust=False).mean()
-    exp2 = prices.ewm(span=26, adjust=False).mean()
-    macd = exp1 - exp2
-    signal = macd.ewm(span=9, adjust=False).mean()
-    return 1 if macd.iloc[-1] > signal.iloc[-1] else -1
-
 def calculate_risk_score(volatility: float, downside_vol: float, rsi: float, esg_score: float) -> float:
     """Calculate comprehensive risk score including ESG factors"""
     vol_score = min(volatility / 50, 1)  # Normalize volatility
@@ -143,102 +160,177 @@ def calculate_risk_score(volatility: float, downside_vol: float, rsi: float, esg
     
     return (vol_score * 0.3 + down_score * 0.3 + rsi_score * 0.2 + esg_score_norm * 0.2) * 100
 
+def calculate_buy_score(metrics: Dict[str, float]) -> float:
+    """Score a stock's buying opportunity (0-1) from its technical signals"""
+    return (
+        (metrics['trend_signal'] == 1) * 0.3 +
+        (metrics['macd_signal'] == 1) * 0.2 +
+        (metrics['rsi'] < 70) * 0.2 +
+        (metrics['volume_trend'] > 0) * 0.15 +
+        (metrics['ytd_return'] > 0) * 0.15
+    )
+
+def calculate_sell_score(metrics: Dict[str, float]) -> float:
+    """Score a holding's selling pressure (0-1) from its risk factors"""
+    return (
+        (metrics['trend_signal'] == -1) * 0.3 +
+        (metrics['macd_signal'] == -1) * 0.2 +
+        (metrics['rsi'] > 70) * 0.2 +
+        (metrics['volume_trend'] < 0) * 0.15 +
+        (metrics['risk_score'] > 70) * 0.15
+    )
+
+def screen_stocks(histories: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, Any]]:
+    """Metrics plus buy and sell scores of every stock with at least 21 days of history"""
+    screened = {}
+    for ticker, metrics in calculate_stocks_metrics({
+        ticker: hist for ticker, hist in histories.items() if len(hist) >= 21
+    }).items():
+        if metrics:
+            metrics['buy_score'] = float(calculate_buy_score(metrics))
+            metrics['sell_score'] = float(calculate_sell_score(metrics))
+            screened[ticker] = metrics
+    return screened
+
+def get_screening_index() -> ScreeningIndex:
+    """Get the process-wide screening index of SECTOR_TICKERS, starting its scheduled refresh"""
+    global _screening_index
+    with _screening_index_lock:
+        if _screening_index is None:
+            _screening_index = ScreeningIndex(screen_stocks, SECTOR_TICKERS)
+            _screening_index.start()
+        return _screening_index
+
 def get_portfolio_recommendations(sectors: List[str], portfolio: List[str]) -> Dict[str, List[Dict[str, str]]]:
-    """Get stock recommendations based on strategy sectors and current portfolio"""
+    """Get stock recommendations from the screening index, based on strategy sectors and current portfolio"""
     recommendations = {'buy': [], 'sell': []}
     
     try:
         # Normalize sector names
         normalized_sectors = [normalize_sector_name(sector) for sector in sectors]
+        index = get_screening_index()
         
-        # Get all relevant tickers for the sectors
-        potential_tickers = set()
-        for sector in normalized_sectors:
-            if sector in SECTOR_TICKERS:
-                potential_tickers.update(SECTOR_TICKERS[sector])
-        
-        # Remove portfolio stocks from buy candidates
-        buy_candidates = list(potential_tickers - set(portfolio))
-        
-        if not buy_candidates:
+        if not set(index.sector_tickers(normalized_sectors)) - set(portfolio):
             print(f"Warning: No buy candidates found for sectors: {sectors}")
             return recommendations
         
-        # Analyze portfolio stocks
-        portfolio_metrics = []
-        for ticker in portfolio:
-            try:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period="1y")
-                if not hist.empty and len(hist) >= 21:  # Need at least 21 days
-                    metrics = calculate_stock_metrics(hist, ticker)
-                    if metrics:
-                        portfolio_metrics.append(metrics)
-            except Exception as e:
-                continue
-        
-        # Analyze sector stocks for buying opportunities
-        sector_metrics = []
-        for ticker in buy_candidates:
-            try:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period="1y")
-                if not hist.empty and len(hist) >= 21:
-                    metrics = calculate_stock_metrics(hist, ticker)
-                    if metrics:
-                        sector_metrics.append(metrics)
-            except Exception as e:
-                continue
+        # Get top 2 buy recommendations among sector stocks not held yet
+        for stock in index.top(normalized_sectors, 2, 'buy_score', exclude=portfolio):
+            recommendations['buy'].append({
+                'ticker': stock['ticker'],
+                'reason': get_primary_signal(stock)
+            })
         
-        # Generate buy recommendations
-        if sector_metrics:
-            # Score stocks based on multiple factors
-            for metrics in sector_metrics:
-                buy_score = (
-                    (metrics['trend_signal'] == 1) * 0.3 +
-                    (metrics['macd_signal'] == 1) * 0.2 +
-                    (metrics['rsi'] < 70) * 0.2 +
-                    (metrics['volume_trend'] > 0) * 0.15 +
-                    (metrics['ytd_return'] > 0) * 0.15
-                )
-                metrics['buy_score'] = buy_score
-            
-            # Get top 2 buy recommendations
-            buy_candidates = sorted(sector_metrics, key=lambda x: x.get('buy_score', 0), reverse=True)[:2]
-            for stock in buy_candidates:
-                signal = get_primary_signal(stock)
-                recommendations['buy'].append({
-                    'ticker': stock['ticker'],
-                    'reason': signal
-                })
+        # Holdings outside the screened universe are scored live
+        portfolio_metrics = index.lookup(portfolio)
+        unscreened = [ticker for ticker in dict.fromkeys(portfolio) if ticker not in portfolio_metrics]
+        if unscreened:
+            portfolio_metrics.update(screen_stocks(load_histories(unscreened)))
         
-        # Generate sell recommendations
-        if portfolio_metrics:
-            # Score stocks based on risk factors
-            for metrics in portfolio_metrics:
-                sell_score = (
-                    (metrics['trend_signal'] == -1) * 0.3 +
-                    (metrics['macd_signal'] == -1) * 0.2 +
-                    (metrics['rsi'] > 70) * 0.2 +
-                    (metrics['volume_trend'] < 0) * 0.15 +
-                    (metrics['risk_score'] > 70) * 0.15
-                )
-                metrics['sell_score'] = sell_score
-            
-            # Get top 2 sell recommendations
-            sell_candidates = sorted(portfolio_metrics, key=lambda x: x.get('sell_score', 0), reverse=True)[:2]
-            for stock in sell_candidates:
-                signal = get_primary_signal(stock)
-                recommendations['sell'].append({
-                    'ticker': stock['ticker'],
-                    'reason': signal
-                })
+        # Get top 2 sell recommendations
+        sell_candidates = sorted(portfolio_metrics.values(), key=lambda x: x.get('sell_score', 0), reverse=True)[:2]
+        for stock in sell_candidates:
+            recommendations['sell'].append({
+                'ticker': stock['ticker'],
+                'reason': get_primary_signal(stock)
+            })
     
     except Exception as e:
         print(f"Error generating recommendations: {str(e)}")
     
     return recommendations
 
+def load_histories(tickers: List[str], period: str = "1y") -> Dict[str, pd.DataFrame]:
+    """Daily bars from the price store, downloading only those past their TTL"""
+    price_store = get_price_store()
+    tickers = list(dict.fromkeys(tickers))
+    try:
+        ensure_price_histories(tickers, price_store)
+    except Exception as e:
+        print(f"Error refreshing histories: {str(e)}")
+    return PriceStoreBackend(price_store).fetch_histories(tickers, period=period)
+
+def allocation_tickers(strategies: List[Dict[str, Any]], portfolio: List[str]) -> List[str]:
+    """Holdings plus every strategy's buy recommendations"""
+    buys = [stock['ticker'] for strategy in strategies for stock in strategy['recommendations']['buy']]
+    return list(dict.fromkeys([*portfolio, *buys]))
+
+def load_allocation_data(tickers: List[str]) -> Dict[str, Any]:
+    """
+    Histories and ESG ratings of the stocks a request's allocations may use, loaded once for all strategies.
+
+    Returns:
+        dict: histories (ticker -> 1y daily bars) and esg_ratings (ticker -> ratings or None).
+    """
+    return {
+        'histories': load_histories(tickers),
+        'esg_ratings': esg_analyzer.get_esg_ratings(tickers),
+    }
+
+def get_strategy_allocation(recommendations: Dict[str, List[Dict[str, str]]], portfolio: List[str],
+                            data: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Optimal weights of the current holdings plus a strategy's buy recommendations.
+
+    The maximum Sharpe portfolio (falling back to the minimum variance one, the
+    only objective above MAX_SHARPE_ASSETS stocks) is found under a maximum
+    position size and sector caps, with an ESG score no lower and a risk score
+    no higher than the current equally weighted holdings. ESG risk ratings are
+    converted to scores where higher is better, and stocks without a rating
+    get the median score of the rest. Limits that cannot be met are dropped:
+    sector caps first, then ESG and risk.
+
+    Args:
+        data (dict): load_allocation_data of these stocks (or more), shared by a
+            request's strategies; loaded here if not given.
+
+    Returns:
+        dict: PortfolioOptimizer results plus the objective and limits used
+        (empty if there was not enough price history).
+    """
+    try:
+        tickers = list(dict.fromkeys([*portfolio, *(stock['ticker'] for stock in recommendations['buy'])]))
+        if data is None:
+            data = load_allocation_data(tickers)
+        histories = {ticker: data['histories'].get(ticker, pd.DataFrame()) for ticker in tickers}
+        analysis = get_covariance_engine().analyze(
+            {ticker: hist for ticker, hist in histories.items() if not hist.empty}, shrinkage='ledoit_wolf')
+        tickers = analysis['tickers']
+        if not tickers:
+            return {}
+        
+        esg_scores = np.array([esg_quality(data['esg_ratings'].get(ticker)) for ticker in tickers])
+        # Unrated stocks count as typical of the universe; with no ratings at all there is no ESG limit
+        rated = ~np.isnan(esg_scores)
+        esg_scores[~rated] = np.median(esg_scores[rated]) if rated.any() else np.nan
+        closes = pd.concat({ticker: normalize_dates(histories[ticker])['Close'] for ticker in tickers}, axis=1)
+        risk_scores = calculate_risk_scores(closes)['risk_score'].reindex(tickers).to_numpy(dtype=float)
+        sectors = [next((sector for sector, sector_tickers in SECTOR_TICKERS.items() if ticker in sector_tickers), 'Other')
+                   for ticker in tickers]
+        optimizer = get_portfolio_optimizer(tickers, analysis['covariance'].to_numpy(), analysis['mean_returns'].to_numpy(),
+                                            esg_scores, risk_scores, sectors)
+        
+        # The new portfolio should be no worse than the current one on ESG and risk
+        held = [i for i, ticker in enumerate(tickers) if ticker in portfolio]
+        limits = {
+            'min_esg': float(optimizer.esg_scores[held].mean()) if held and rated.any() else None,
+            'max_position': max(ALLOCATION_MAX_POSITION, 1 / len(tickers)),
+            'sector_caps': {sector: ALLOCATION_SECTOR_CAP for sector in set(sectors) if sector != 'Other'},
+            'max_risk': float(optimizer.risk_scores[held].mean()) if held else None,
+        }
+        objectives = ("max_sharpe", "min_variance") if len(tickers) <= MAX_SHARPE_ASSETS else ("min_variance",)
+        for relaxed in ({}, {'sector_caps': None}, {'sector_caps': None, 'min_esg': None, 'max_risk': None}):
+            for objective in objectives:
+                allocation = optimizer.solve(objective, **{**limits, **relaxed})
+                if allocation['weights']:
+                    return {**allocation, 'objective': objective, 'limits': {**limits, **relaxed}}
+        print(f"Warning: No feasible allocation for {tickers}")
+    
+    except Exception as e:
+        print(f"Error optimizing allocation: {str(e)}")
+    
+    return {}
+
 def get_primary_signal(metrics: Dict[str, float]) -> str:
     """Get the primary signal reason for a stock with consistent percentage formatting"""
     try:
@@ -276,24 +368,18 @@ def get_primary_signal(metrics: Dict[str, float]) -> str:
         # Fallback with basic metric
         return f"{metrics.get('value_change_21d', 0):0.1f}% price movement"
 
-def generate_completion(prompt: str) -> str:
-    """Generate AI completion using Groq"""
+def generate_completion(prompt: str, **options) -> str:
+    """Generate AI completion through the shared LLM gateway"""
     try:
-        client = Groq(
-            api_key=os.environ.get("GROQ_API_KEY"),
-        )
-        
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192",
-        )
-        
-        if hasattr(chat_completion, 'content'):
-            return str(chat_completion.content)
-        elif hasattr(chat_completion, 'choices'):
-            return str(chat_completion.choices[0].message.content)
-        else:
-            return str(chat_completion)
+        return get_llm_gateway().complete(prompt, **options)
+    except Exception as e:
+        print(f"Error in AI completion: {str(e)}")
+        return "AI analysis temporarily unavailable"
+
+async def generate_completion_async(prompt: str, **options) -> str:
+    """Generate AI completion through the shared LLM gateway without blocking the event loop"""
+    try:
+        return await get_llm_gateway().complete_async(prompt, **options)
     except Exception as e:
         print(f"Error in AI completion: {str(e)}")
         return "AI analysis temporarily unavailable"
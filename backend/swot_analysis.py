@@ -1,71 +1,129 @@
+import asyncio
+import json
 import re
 import numpy as np
 import pandas as pd
 import yfinance as yf
 from typing import Dict, Any, List
 import os
-from groq import Groq
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from market_data import get_market_data
+from llm_gateway import get_llm_gateway
+from indicators import get_indicator_engine
+from covariance import get_covariance_engine, average_correlation
+from references import SECTOR_TICKERS
+from benchmarks import get_benchmarks, portfolio_benchmark
 
+ANALYSIS_WORKERS = 8  # Bound on concurrent per-ticker lookups and LLM calls
+INSIGHTS_BATCH_SIZE = 5  # Tickers per batched SWOT/recommendation prompt
+INSIGHTS_MAX_ATTEMPTS = 2  # Batched attempts before falling back to per-ticker prompts
 
-def calculate_max_drawdown(prices: pd.Series) -> float:
-    """Calculate the maximum drawdown percentage"""
-    peak = prices.expanding(min_periods=1).max()
-    drawdown = (prices - peak) / peak
-    return float(drawdown.min() * 100)
 
-def analyze_portfolio(tickers: List[str], period: str = "1y") -> Dict[str, Any]:
-    """Comprehensive portfolio analysis including quantitative metrics and AI insights"""
-    portfolio_data = {}
+STOCK_INDICATORS = {
+    'value_change_21': ('change', {'periods': 20}),
+    'risk_change_67': ('volatility', {'bars': 67}),
+    'volatility': ('volatility', {}),
+    'sharpe_ratio': ('sharpe_ratio', {}),
+    'max_drawdown': ('max_drawdown', {}),
+    'rsi': ('rsi', {'period': 14, 'flat_value': 50}),
+}
+
+def analyze_portfolio(tickers: List[str], period: str = "1y", max_workers: int = ANALYSIS_WORKERS,
+                      batch_size: int = INSIGHTS_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Comprehensive portfolio analysis including quantitative metrics and AI insights.
+
+    SWOT insights and trading recommendations are requested for
+    ``batch_size`` tickers per structured LLM call; tickers whose batched
+    answer stays invalid fall back to the per-ticker prompts. The LLM calls
+    run concurrently, and a ticker that fails is skipped without affecting
+    the others.
+
+    Args:
+        tickers (list): Portfolio ticker symbols.
+        period (str): History period for the metrics (e.g., "1y").
+        max_workers (int): Bound on concurrent lookups and LLM calls; 1 runs serially.
+        batch_size (int): Tickers per batched LLM call; 1 uses two prompts per ticker.
+
+    Returns:
+        dict: Ticker -> metrics, SWOT insights and trading recommendation.
+    """
+    market_data = get_market_data()
+    histories = market_data.get_histories(tickers, period=period)
     
+    # Calculate quantitative metrics, computing every ticker's indicators together
+    available = {}
     for ticker in tickers:
+        hist = histories.get(ticker, pd.DataFrame())
+        if hist.empty:
+            print(f"Warning: No data available for {ticker}, skipping...")
+            continue
+        available[ticker] = hist
+    indicators = get_indicator_engine().compute(available, STOCK_INDICATORS)
+    
+    ticker_metrics = {}
+    for ticker, hist in available.items():
         try:
-            stock = yf.Ticker(ticker)
-            hist = stock.history(period=period)
-            
-            if hist.empty:
-                print(f"Warning: No data available for {ticker}, skipping...")
-                continue
-                
-            # Calculate quantitative metrics
-            metrics = calculate_stock_metrics(hist, ticker)
-            
-            # Generate AI insights
-            ai_insights = generate_stock_insights(metrics, stock.info)
-            
-            # Get trading recommendations
-            recommendations = generate_trading_recommendations(metrics, stock.info)
-            
-            portfolio_data[ticker] = {**metrics, **ai_insights, **recommendations}
-            
+            ticker_metrics[ticker] = calculate_stock_metrics(hist, ticker, indicators[ticker])
         except Exception as e:
             print(f"Error analyzing {ticker}: {str(e)}")
-            continue
+    
+    portfolio_data = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="analysis") as executor:
+        remaining = ticker_metrics
+        if batch_size > 1:
+            batched = generate_batch_insights(list(ticker_metrics.values()), batch_size, executor)
+            for ticker, insights in batched.items():
+                portfolio_data[ticker] = {**ticker_metrics[ticker], **insights}
+            remaining = {ticker: metrics for ticker, metrics in ticker_metrics.items() if ticker not in batched}
+        
+        infos = {executor.submit(market_data.get_info, ticker): ticker for ticker in remaining}
+        
+        # Generate AI insights and trading recommendations as each ticker's info arrives
+        tasks = {}
+        for info in as_completed(infos):
+            ticker = infos[info]
+            metrics = remaining[ticker]
+            try:
+                stock_info = info.result()
+            except Exception as e:
+                print(f"Error analyzing {ticker}: {str(e)}")
+                continue
+            tasks[ticker] = (
+                metrics,
+                executor.submit(generate_stock_insights, metrics, stock_info),
+                executor.submit(generate_trading_recommendations, metrics, stock_info),
+            )
+        
+        for ticker, (metrics, ai_insights, recommendations) in tasks.items():
+            try:
+                portfolio_data[ticker] = {**metrics, **ai_insights.result(), **recommendations.result()}
+            except Exception as e:
+                print(f"Error analyzing {ticker}: {str(e)}")
     
     if not portfolio_data:
         raise ValueError("No valid stocks found in portfolio")
         
-    return portfolio_data
+    return {ticker: portfolio_data[ticker] for ticker in ticker_metrics if ticker in portfolio_data}
 
-def calculate_stock_metrics(hist: pd.DataFrame, ticker: str) -> Dict[str, float]:
-    """Calculate key quantitative metrics for a stock"""
-    daily_returns = hist['Close'].pct_change()
+def calculate_stock_metrics(hist: pd.DataFrame, ticker: str, indicators: Dict[str, float] = None) -> Dict[str, float]:
+    """Calculate key quantitative metrics for a stock, from its precomputed indicators if given"""
+    if indicators is None:
+        indicators = get_indicator_engine().compute({ticker: hist}, STOCK_INDICATORS)[ticker]
     
-    # Calculate periods for different metrics
-    days_21 = hist['Close'].iloc[-21:] if len(hist) >= 21 else hist['Close']
-    days_67 = hist['Close'].iloc[-67:] if len(hist) >= 67 else hist['Close']
     days_321 = hist['Close'].iloc[-321:] if len(hist) >= 321 else hist['Close']
     
     metrics = {
         'ticker': ticker,
         'current_price': hist['Close'].iloc[-1],
-        'value_change_21': (hist['Close'].iloc[-1] / hist['Close'].iloc[-21] - 1) * 100 if len(hist) >= 21 else 0,
-        'risk_change_67': calculate_risk_change(days_67),
+        'value_change_21': indicators['value_change_21'] if len(hist) >= 21 else 0,
+        'risk_change_67': indicators['risk_change_67'],
         'esg_change_321': calculate_esg_score_change(days_321),
-        'volatility': daily_returns.std() * np.sqrt(252) * 100,
-        'sharpe_ratio': (daily_returns.mean() / daily_returns.std()) * np.sqrt(252) if daily_returns.std() != 0 else 0,
-        'max_drawdown': calculate_max_drawdown(hist['Close']),
-        'rsi': calculate_rsi(hist['Close']),
+        'volatility': indicators['volatility'],
+        'sharpe_ratio': indicators['sharpe_ratio'],
+        'max_drawdown': indicators['max_drawdown'],
+        'rsi': indicators['rsi'],
     }
     
     return metrics
@@ -98,42 +156,143 @@ def generate_trading_recommendations(metrics: Dict[str, float], stock_info: Dict
     return {
         'recommendation': recommendation.split(':')[0].strip(),
         'reason': recommendation.split(':')[1].strip() if ':' in recommendation else '',
-        'metrics': {
-            'value_21d': f"+{metrics['value_change_21']:.1f}%" if metrics['value_change_21'] > 0 else f"{metrics['value_change_21']:.1f}%",
-            'risk_67d': f"+{metrics['risk_change_67']:.1f}%" if metrics['risk_change_67'] > 0 else f"{metrics['risk_change_67']:.1f}%",
-            'esg_321d': f"+{metrics['esg_change_321']:.1f}%" if metrics['esg_change_321'] > 0 else f"{metrics['esg_change_321']:.1f}%"
-        }
+        'metrics': format_signal_metrics(metrics)
     }
 
-def generate_completion(prompt: str) -> str:
-    """Generate AI completion using Groq"""
+def format_signal_metrics(metrics: Dict[str, float]) -> Dict[str, str]:
+    """Format the value, risk and ESG changes shown next to a recommendation"""
+    return {
+        'value_21d': f"+{metrics['value_change_21']:.1f}%" if metrics['value_change_21'] > 0 else f"{metrics['value_change_21']:.1f}%",
+        'risk_67d': f"+{metrics['risk_change_67']:.1f}%" if metrics['risk_change_67'] > 0 else f"{metrics['risk_change_67']:.1f}%",
+        'esg_321d': f"+{metrics['esg_change_321']:.1f}%" if metrics['esg_change_321'] > 0 else f"{metrics['esg_change_321']:.1f}%"
+    }
+
+def build_batch_insights_prompt(batch: List[Dict[str, float]]) -> str:
+    """Build one structured prompt asking for SWOT and BUY/SELL of several tickers"""
+    blocks = "\n".join(
+        f"""    {metrics['ticker']}:
+    - Value change (21 days): {metrics['value_change_21']:.1f}%
+    - Risk change (67 days): {metrics['risk_change_67']:.1f}%
+    - ESG change (321 days): {metrics['esg_change_321']:.1f}%
+    - Volatility: {metrics['volatility']:.1f}%
+    - Sharpe ratio: {metrics['sharpe_ratio']:.2f}
+    - RSI: {metrics['rsi']:.1f}"""
+        for metrics in batch
+    )
+    return f"""
+    Based on the following metrics for each stock:
+{blocks}
+
+    For every stock, provide a concise SWOT analysis (one line per section) and a
+    single trading recommendation (BUY or SELL) with a brief reason focusing on
+    the most significant metric.
+
+    Respond with JSON only, matching this schema:
+    {{"stocks": [{{"ticker": string, "strengths": string, "weaknesses": string,
+    "opportunities": string, "threats": string, "action": "BUY" | "SELL", "reason": string}}]}}
+    Include exactly one entry per stock: {", ".join(metrics['ticker'] for metrics in batch)}.
+    """
+
+def parse_batch_insights(response: str, tickers: List[str]) -> Dict[str, Dict[str, str]]:
+    """
+    Validate a batched insights response.
+
+    Args:
+        response (str): The JSON text returned by the LLM.
+        tickers (list): Tickers the batch asked for.
+
+    Returns:
+        dict: Ticker -> validated entry, only for the tickers answered correctly.
+    """
     try:
-        client = Groq(
-            api_key=os.environ.get("GROQ_API_KEY"),
-        )
+        stocks = json.loads(response).get('stocks', [])
+    except (ValueError, AttributeError):
+        return {}
+    
+    valid = {}
+    fields = ('strengths', 'weaknesses', 'opportunities', 'threats', 'reason')
+    for entry in stocks if isinstance(stocks, list) else []:
+        if not isinstance(entry, dict) or entry.get('ticker') not in tickers:
+            continue
+        if str(entry.get('action', '')).upper() not in ('BUY', 'SELL'):
+            continue
+        if not all(isinstance(entry.get(field), str) and entry[field].strip() for field in fields):
+            continue
+        valid[entry['ticker']] = entry
+    return valid
+
+def generate_batch_insights(ticker_metrics: List[Dict[str, float]], batch_size: int = INSIGHTS_BATCH_SIZE,
+                            executor=None) -> Dict[str, Dict[str, Any]]:
+    """
+    Generate SWOT insights and trading recommendations with one LLM call per batch of tickers.
+
+    Tickers missing or invalid in a batch's answer are retried in a new
+    batch, up to INSIGHTS_MAX_ATTEMPTS times; tickers answered correctly are
+    never asked again.
+
+    Args:
+        ticker_metrics (list): Metrics of each ticker, from calculate_stock_metrics.
+        batch_size (int): Tickers per LLM call.
+        executor (Executor): Optional pool running the batches concurrently.
+
+    Returns:
+        dict: Ticker -> {swot, analysis_date, recommendation, reason, metrics},
+        only for the tickers that were answered correctly.
+    """
+    by_ticker = {metrics['ticker']: metrics for metrics in ticker_metrics}
+    answered = {}
+    pending = list(by_ticker)
+    for attempt in range(INSIGHTS_MAX_ATTEMPTS):
+        if not pending:
+            break
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
         
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-8b-8192",
-        )
+        def ask(batch):
+            # Only fully valid answers are cached, so a retry never replays a bad one
+            return generate_completion(
+                build_batch_insights_prompt([by_ticker[ticker] for ticker in batch]),
+                response_format={"type": "json_object"},
+                validate=lambda response: len(parse_batch_insights(response, batch)) == len(batch),
+            )
         
-        if hasattr(chat_completion, 'content'):
-            return str(chat_completion.content)
-        elif hasattr(chat_completion, 'choices'):
-            return str(chat_completion.choices[0].message.content)
-        else:
-            return str(chat_completion)
+        responses = list(executor.map(ask, batches)) if executor is not None else [ask(batch) for batch in batches]
+        for batch, response in zip(batches, responses):
+            answered.update(parse_batch_insights(response, batch))
+        pending = [ticker for ticker in pending if ticker not in answered]
+    
+    if pending:
+        print(f"Warning: No valid batched insights for {', '.join(pending)}")
+    
+    analysis_date = datetime.now().strftime('%Y-%m-%d')
+    return {
+        ticker: {
+            'swot': (f"Strengths: {entry['strengths'].strip()}\n"
+                     f"Weaknesses: {entry['weaknesses'].strip()}\n"
+                     f"Opportunities: {entry['opportunities'].strip()}\n"
+                     f"Threats: {entry['threats'].strip()}"),
+            'analysis_date': analysis_date,
+            'recommendation': entry['action'].upper(),
+            'reason': entry['reason'].strip(),
+            'metrics': format_signal_metrics(by_ticker[ticker]),
+        }
+        for ticker, entry in answered.items()
+    }
+
+def generate_completion(prompt: str, **options) -> str:
+    """Generate AI completion through the shared LLM gateway"""
+    try:
+        return get_llm_gateway().complete(prompt, **options)
     except Exception as e:
         print(f"Error in AI completion: {str(e)}")
         return "AI analysis temporarily unavailable"
 
-def calculate_rsi(prices: pd.Series, period: int = 14) -> float:
-    """Calculate Relative Strength Index"""
-    delta = prices.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs.iloc[-1])) if loss.iloc[-1] != 0 else 50
+async def generate_completion_async(prompt: str, **options) -> str:
+    """Generate AI completion through the shared LLM gateway without blocking the event loop"""
+    try:
+        return await get_llm_gateway().complete_async(prompt, **options)
+    except Exception as e:
+        print(f"Error in AI completion: {str(e)}")
+        return "AI analysis temporarily unavailable"
 
 def generate_stock_insights(metrics: Dict[str, float], stock_info: Dict[str, Any]) -> Dict[str, str]:
     """Generate SWOT analysis using AI"""
@@ -160,8 +319,25 @@ def generate_stock_insights(metrics: Dict[str, float], stock_info: Dict[str, Any
         'analysis_date': datetime.now().strftime('%Y-%m-%d')
     }
 
+def calculate_sector_diversity(portfolio: List[str]) -> float:
+    """
+    Score how evenly equal-weighted holdings spread across sectors (0-100%).
+
+    100% means no two holdings share a sector; 0% means all are in one.
+    Tickers outside SECTOR_TICKERS count as one 'Other' sector.
+    """
+    holdings = list(dict.fromkeys(portfolio))
+    if len(holdings) < 2:
+        return 0.0
+    weights = {}
+    for ticker in holdings:
+        sector = next((sector for sector, tickers in SECTOR_TICKERS.items() if ticker in tickers), 'Other')
+        weights[sector] = weights.get(sector, 0) + 1 / len(holdings)
+    herfindahl = sum(weight ** 2 for weight in weights.values())
+    return float((1 - herfindahl) / (1 - 1 / len(holdings)) * 100)
+
 def calculate_portfolio_metrics(portfolio: List[str]) -> Dict[str, float]:
-    """Calculate comprehensive portfolio metrics for SWOT analysis"""
+    """Calculate comprehensive metrics of the equal-weighted portfolio for SWOT analysis"""
     metrics = {
         'avg_return': 0.0,
         'portfolio_volatility': 0.0,
@@ -171,41 +347,29 @@ def calculate_portfolio_metrics(portfolio: List[str]) -> Dict[str, float]:
     }
     
     try:
-        # Get market data (S&P 500 as benchmark)
-        spy = yf.Ticker("SPY")
-        market_hist = spy.history(period="1y")
-        market_returns = market_hist['Close'].pct_change().dropna()
+        # Get the holdings' market data; the benchmark (S&P 500, or the regional index) is cached daily
+        histories = get_market_data().get_histories(portfolio, period="1y")
+        holdings = {ticker: histories.get(ticker, pd.DataFrame()) for ticker in portfolio}
+        benchmark_symbol = portfolio_benchmark(portfolio)
+        benchmark = get_benchmarks().get_history(benchmark_symbol)
+        if benchmark.empty:
+            print(f"Warning: No {benchmark_symbol} history, portfolio beta defaults to 1.0")
+        # Reported diagnostics come from the sample matrices; shrinkage would pull correlations toward 0
+        analysis = get_covariance_engine().analyze(holdings, benchmark=benchmark)
         
-        returns_data = []
-        volatilities = []
-        betas = []
+        skipped = [ticker for ticker in holdings if ticker not in analysis['tickers']]
+        if skipped:
+            print(f"Warning: Insufficient data for {', '.join(skipped)}, excluded from portfolio metrics")
         
-        for ticker in portfolio:
-            try:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period="1y")
-                
-                if not hist.empty and len(hist) > 30:  # Ensure sufficient data
-                    returns = hist['Close'].pct_change().dropna()
-                    annual_return = returns.mean() * 252 * 100
-                    annual_vol = returns.std() * np.sqrt(252) * 100
-                    beta = returns.cov(market_returns) / market_returns.var()
-                    
-                    returns_data.append(annual_return)
-                    volatilities.append(annual_vol)
-                    betas.append(beta)
-            
-            except Exception as e:
-                print(f"Warning: Error processing {ticker}: {str(e)}")
-                continue
-        
-        if returns_data:
+        if analysis['tickers']:
+            weights = np.full(len(analysis['tickers']), 1 / len(analysis['tickers']))
+            covariance = analysis['covariance'].to_numpy()
             metrics.update({
-                'avg_return': np.mean(returns_data),
-                'portfolio_volatility': np.mean(volatilities),
-                'beta': np.mean(betas),
-                'sector_diversity': 75.0,  # Placeholder - implement actual sector analysis if needed
-                'avg_correlation': 0.5  # Placeholder - implement if needed
+                'avg_return': float(analysis['mean_returns'].mean() * 100),
+                'portfolio_volatility': float(np.sqrt(weights @ covariance @ weights) * 100),
+                'beta': float(analysis['betas'].mean()) if not analysis['betas'].empty else 1.0,
+                'sector_diversity': calculate_sector_diversity(analysis['tickers']),
+                'avg_correlation': float(np.nan_to_num(average_correlation(analysis['correlation'].to_numpy())))
             })
     
     except Exception as e:
@@ -216,8 +380,16 @@ def calculate_portfolio_metrics(portfolio: List[str]) -> Dict[str, float]:
 def generate_portfolio_swot(portfolio: List[str]) -> str:
     """Generate a portfolio-level SWOT analysis based on quantitative metrics"""
     metrics = calculate_portfolio_metrics(portfolio)
-    
-    prompt = f"""
+    return generate_completion(build_portfolio_swot_prompt(metrics))
+
+async def generate_portfolio_swot_async(portfolio: List[str]) -> str:
+    """Generate a portfolio-level SWOT analysis, awaiting market data and the LLM"""
+    metrics = await asyncio.to_thread(calculate_portfolio_metrics, portfolio)
+    return await generate_completion_async(build_portfolio_swot_prompt(metrics))
+
+def build_portfolio_swot_prompt(metrics: Dict[str, float]) -> str:
+    """Build the portfolio SWOT prompt from portfolio metrics"""
+    return f"""
     Based on portfolio analysis with these metrics:
     - Average Annual Return: {metrics['avg_return']:.1f}%
     - Portfolio Volatility: {metrics['portfolio_volatility']:.1f}%
@@ -237,8 +409,6 @@ def generate_portfolio_swot(portfolio: List[str]) -> str:
     Opportunities: [10 words]
     Threats: [10 words]
     """
-    
-    return generate_completion(prompt)
 
 def generate_trading_signals(portfolio: List[str]) -> Dict[str, List[Dict[str, str]]]:
     """Generate top 2 buy and sell recommendations with quantitative reasons"""
@@ -251,11 +421,11 @@ def generate_trading_signals(portfolio: List[str]) -> Dict[str, List[Dict[str, s
         
         # Filter portfolio to only include valid tickers
         portfolio = [ticker for ticker in portfolio if ticker in valid_tickers]
+        histories = get_market_data().get_histories(portfolio, period="1y")
         
         for ticker in portfolio:
             try:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period="1y")
+                hist = histories.get(ticker, pd.DataFrame())
                 
                 if not hist.empty and len(hist) >= 21:  # Only need 21 days minimum
                     value_change = ((hist['Close'].iloc[-1] / hist['Close'].iloc[-21]) - 1) * 100
@@ -311,8 +481,7 @@ def generate_trading_signals(portfolio: List[str]) -> Dict[str, List[Dict[str, s
 def get_stock_metrics(ticker: str) -> Dict[str, str]:
     """Get relevant metrics for a stock recommendation"""
     try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="1y")
+        hist = get_market_data().get_history(ticker, period="1y")
         
         return {
             'value_21d': f"+{calculate_change(hist, 21):.1f}%",